@@ -0,0 +1,79 @@
+"""
+Benchmark of calculate_play_performance on many plays of the same beatmap.
+
+Run: python -m benchmarks.bench_calculate [--plays N] [--objects N]
+"""
+import argparse
+import tempfile
+import time
+from pathlib import Path
+from types import SimpleNamespace
+
+import rosu_pp_py as rosu
+
+from benchmarks.corpus import make_osu_file
+from osu.beatmap_store import md5_hex
+from osu.calculate import calculate_play_performance, clear_calculation_caches, calculation_cache_stats
+
+
+def make_play(beatmap_hash: str, objects: int, misses: int, mods: int) -> SimpleNamespace:
+    # Only the fields read by calculate_play_performance
+    return SimpleNamespace(beatmap_hash=beatmap_hash, accuracy=0.97, count_misses=misses,
+                           greatest_combo=objects - misses, mods=mods)
+
+
+def uncached_performance(beatmap_path: str, play) -> float:
+    # Original implementation: parse the map and calculate difficulty for every play
+    perf = rosu.Performance(accuracy=play.accuracy * 100, lazer=False, misses=play.count_misses,
+                            combo=play.greatest_combo, hitresult_priority=rosu.HitResultPriority.BestCase)
+    perf.set_mods(play.mods)
+    beatmap = rosu.Beatmap(path=beatmap_path)
+    return perf.calculate(perf.calculate(beatmap)).pp
+
+
+def run(plays: int, objects: int) -> dict:
+    with tempfile.TemporaryDirectory() as tmp:
+        content = make_osu_file(objects)
+        beatmap_hash = md5_hex(content)
+        path = Path(tmp) / f"{beatmap_hash}.osu"
+        path.write_bytes(content)
+
+        batch = [make_play(beatmap_hash, objects, i % 5, (0, 8, 16, 64)[i % 4]) for i in range(plays)]
+
+        start = time.perf_counter()
+        expected = [uncached_performance(str(path), play) for play in batch]
+        uncached = time.perf_counter() - start
+
+        clear_calculation_caches()
+        start = time.perf_counter()
+        actual = [calculate_play_performance(str(path), play).pp for play in batch]
+        cached = time.perf_counter() - start
+
+        if any(abs(a - e) > 1e-6 for a, e in zip(actual, expected)):
+            raise AssertionError("Cached calculation differs from the uncached one")
+
+        beatmap_stats, difficulty_stats = calculation_cache_stats()
+        return {
+            "plays": plays,
+            "objects": objects,
+            "uncached_s": uncached,
+            "cached_s": cached,
+            "speedup": uncached / cached if cached else float("inf"),
+            "beatmap_cache": str(beatmap_stats),
+            "difficulty_cache": str(difficulty_stats),
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--plays", type=int, default=200)
+    parser.add_argument("--objects", type=int, default=1000)
+    args = parser.parse_args()
+
+    result = run(args.plays, args.objects)
+    for key, value in result.items():
+        print(f"{key:>17}: {value:.4f}" if isinstance(value, float) else f"{key:>17}: {value}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,127 @@
+"""
+Benchmark of TextTemplate compilation and resolution against the original list based lexer.
+
+Run: python -m benchmarks.bench_text_template [--repeat N] [--long-vars N]
+"""
+import argparse
+import time
+from typing import List, Callable, Optional
+
+from core.text_template import TextTemplate, Literal, Variable, Token, template_cache_stats
+
+
+class LegacyTemplateLexer:
+    """
+    Copy of the original lexer, keeps the content as a list of chars and re-slices it on every token.
+    """
+
+    def __init__(self, content: str):
+        self.content: List[str] = list(content)
+
+    def empty(self) -> bool:
+        return len(self.content) == 0
+
+    def peek(self) -> Optional[str]:
+        return self.content[0] if not self.empty() else None
+
+    def chop(self, n: int) -> str:
+        token = self.content[:n]
+        self.content = self.content[n:]
+        return ''.join(token)
+
+    def chop_until(self, predicate: Callable[[str], bool]) -> str:
+        n = 0
+        while n < len(self.content) and not predicate(self.content[n]):
+            n += 1
+        return self.chop(n)
+
+    def trim(self) -> None:
+        n = 0
+        while n < len(self.content) and self.content[n].isspace():
+            n += 1
+        self.content = self.content[n:]
+
+    def next_token(self) -> Optional[Token]:
+        if self.empty():
+            return None
+        if self.peek() == '{':
+            self.chop(1)
+            self.trim()
+            varname = self.chop_until(lambda x: x == '}').rstrip().upper().replace(' ', '_')
+            if self.empty():
+                return Variable(varname)
+            self.chop(1)
+            return Variable(varname)
+        return Literal(self.chop_until(lambda c: c == '{'))
+
+    def tokenize(self) -> List[Token]:
+        tokens: List[Token] = []
+        while not self.empty():
+            token = self.next_token()
+            if token:
+                tokens.append(token)
+        return tokens
+
+
+def legacy_resolve(tokens: List[Token], variables: dict) -> str:
+    parts: List[str] = []
+    for token in tokens:
+        if isinstance(token, Literal):
+            parts.append(token.text)
+        else:
+            parts.append(str(variables[token.name]))
+    return "".join(parts)
+
+
+def timed(function: Callable[[], object], repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        function()
+    return time.perf_counter() - start
+
+
+def run(repeat: int, long_vars: int) -> dict:
+    short = "Moj pp to {PP} ({STARS}*) na {MAP}"
+    long = " | ".join(f"stat {i}: {{VAR_{i}}}" for i in range(long_vars))
+    variables = {"PP": 727, "STARS": "7.27", "MAP": "Blue Zenith"}
+    variables.update({f"VAR_{i}": i for i in range(long_vars)})
+
+    result = {"repeat": repeat, "long_template_chars": len(long)}
+    for name, source in (("short", short), ("long", long)):
+        legacy_tokens = LegacyTemplateLexer(source).tokenize()
+        template = TextTemplate(source)
+        if legacy_resolve(legacy_tokens, variables) != template.resolve_dict(variables):
+            raise AssertionError(f"{name} template resolves differently than the legacy one")
+
+        # Long templates are quadratic in the legacy lexer, fewer rounds keep the run short
+        rounds = repeat if name == "short" else max(1, repeat // 100)
+        legacy_compile = timed(lambda: LegacyTemplateLexer(source).tokenize(), rounds)
+        compile_time = timed(lambda: TextTemplate(source), rounds)
+        interned = timed(lambda: TextTemplate.of(source), rounds)
+        legacy_resolve_time = timed(lambda: legacy_resolve(legacy_tokens, variables), repeat)
+        resolve_time = timed(lambda: template.resolve_with(lambda key: str(variables[key])), repeat)
+
+        result.update({
+            f"{name}_legacy_compile_us": legacy_compile / rounds * 1e6,
+            f"{name}_compile_us": compile_time / rounds * 1e6,
+            f"{name}_interned_us": interned / rounds * 1e6,
+            f"{name}_legacy_resolve_us": legacy_resolve_time / repeat * 1e6,
+            f"{name}_resolve_us": resolve_time / repeat * 1e6,
+        })
+    result["template_cache"] = str(template_cache_stats())
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--repeat", type=int, default=10000)
+    parser.add_argument("--long-vars", type=int, default=500)
+    args = parser.parse_args()
+
+    result = run(args.repeat, args.long_vars)
+    for key, value in result.items():
+        print(f"{key:>28}: {value:.2f}" if isinstance(value, float) else f"{key:>28}: {value}")
+
+
+if __name__ == "__main__":
+    main()
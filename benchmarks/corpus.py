@@ -0,0 +1,177 @@
+"""
+Synthetic inputs for the benchmarks: replays, beatmaps, layouts and variables.
+Everything is generated from a seed, so the corpus is the same on every run.
+"""
+import lzma
+import random
+import struct
+from pathlib import Path
+from typing import List
+
+from core.layout import Layout, Layer
+from core.renderer import TextAlignment
+from core.variable_map import VariableMap
+from core.variables import TextVariable
+from core.widgets import WidgetRect, WidgetText
+from osu.beatmap_store import md5_hex
+
+# Replay header fields after the strings: hit counts, total score, greatest combo, perfect flag, mods
+_SCORE = struct.Struct('<6HIHBI')
+# Windows ticks of 2024-01-01
+_TIMESTAMP = 638396640000000000
+# Frame with this time carries the RNG seed of the play
+_SEED_FRAME_TIME = -12345
+
+
+def _uleb128(value: int) -> bytes:
+    out = bytearray()
+    while True:
+        byte = value & 0x7F
+        value >>= 7
+        if value:
+            out.append(byte | 0x80)
+        else:
+            out.append(byte)
+            return bytes(out)
+
+
+def _osustring(text: str) -> bytes:
+    if not text:
+        return b"\x00"
+    data = text.encode("utf-8")
+    return b"\x0b" + _uleb128(len(data)) + data
+
+
+def make_frames(count: int, seed: int = 0) -> str:
+    """
+    Cursor movement of the replay data in the "w|x|y|keys," format, the cursor circles around the playfield.
+    """
+    rng = random.Random(seed)
+    frames = ["0|256|-500|0", "-1|256|-500|0"]
+    x, y = 256.0, 192.0
+    for i in range(count):
+        x = min(512.0, max(0.0, x + rng.uniform(-24, 24)))
+        y = min(384.0, max(0.0, y + rng.uniform(-18, 18)))
+        frames.append(f"{16 if i % 3 else 17}|{x:.4f}|{y:.4f}|{rng.choice((0, 1, 2, 5, 10))}")
+    frames.append(f"{_SEED_FRAME_TIME}|0|0|{seed}")
+    return ",".join(frames) + ","
+
+
+def make_osr(user_name: str, beatmap_hash: str, frames: int = 5000, seed: int = 0, mods: int = 0) -> bytes:
+    """
+    Creates an osu!standard .osr replay with a valid header and LZMA compressed frames.
+    """
+    rng = random.Random(seed)
+    count_300 = rng.randint(400, 900)
+    count_100, count_50, misses = rng.randint(0, 40), rng.randint(0, 10), rng.randint(0, 5)
+    data = lzma.compress(make_frames(frames, seed).encode("ascii"), format=lzma.FORMAT_ALONE)
+    return b"".join([
+        struct.pack('<BI', 0, 20240101),
+        _osustring(beatmap_hash),
+        _osustring(user_name),
+        _osustring(f"{seed:032x}"),
+        _SCORE.pack(count_300, count_100, count_50, 0, 0, misses, rng.randint(10 ** 5, 10 ** 7),
+                    count_300 + count_100, 0, mods),
+        _osustring("0|1,"),
+        struct.pack('<QI', _TIMESTAMP + seed, len(data)),
+        data,
+        struct.pack('<Q', 1000 + seed),
+    ])
+
+
+def make_osu_file(objects: int) -> bytes:
+    """
+    Creates a simple osu!standard beatmap with the given number of circles.
+    """
+    lines = [
+        "osu file format v14",
+        "",
+        "[General]",
+        "Mode: 0",
+        "",
+        "[Difficulty]",
+        "HPDrainRate:5",
+        "CircleSize:4",
+        "OverallDifficulty:8",
+        "ApproachRate:9",
+        "SliderMultiplier:1.4",
+        "SliderTickRate:1",
+        "",
+        "[TimingPoints]",
+        "0,300,4,2,0,50,1,0",
+        "",
+        "[HitObjects]",
+    ]
+    for i in range(objects):
+        x = 64 + (i * 97) % 384
+        y = 48 + (i * 61) % 288
+        lines.append(f"{x},{y},{1000 + i * 150},1,0,0:0:0:0:")
+    return ("\r\n".join(lines) + "\r\n").encode("utf-8")
+
+
+def write_beatmap(directory: str | Path, objects: int) -> tuple[Path, str]:
+    """
+    Writes a beatmap named by its MD5.
+    :return: Path of the .osu file and its hash.
+    """
+    content = make_osu_file(objects)
+    beatmap_hash = md5_hex(content)
+    path = Path(directory) / f"{beatmap_hash}.osu"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(content)
+    return path, beatmap_hash
+
+
+def write_replays(directory: str | Path, count: int, beatmap_hash: str, frames: int = 5000) -> List[Path]:
+    """
+    Writes count replays of the beatmap played by different players.
+    """
+    directory = Path(directory)
+    directory.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(count):
+        path = directory / f"replay_{i:04}.osr"
+        path.write_bytes(make_osr(f"player_{i % 16}", beatmap_hash, frames, seed=i, mods=(0, 8, 16, 64)[i % 4]))
+        paths.append(path)
+    return paths
+
+
+def make_template(variables: int) -> str:
+    """
+    Text template referencing VAR_0 ... VAR_{variables - 1}.
+    """
+    return " | ".join(f"stat {i}: {{VAR_{i}}}" for i in range(variables)) or "static text"
+
+
+def make_variables(variables: int, seed: int = 0) -> VariableMap:
+    """
+    Values of the variables used by make_template and make_layout.
+    """
+    variable_map = VariableMap()
+    for i in range(variables):
+        variable_map.set(f"VAR_{i}", TextVariable(str(seed * 1000 + i)))
+    return variable_map
+
+
+def make_layout(rects: int, texts: int, variables: int, width: int = 1920, height: int = 1080) -> Layout:
+    """
+    Layout with a static layer of rects and a dynamic layer of texts.
+
+    :param rects: Rects of the static background layer.
+    :param texts: Text widgets, each one references the same variables.
+    :param variables: Variables referenced by every text, 0 makes the text layer static too.
+    """
+    background = []
+    for i in range(rects):
+        rect = WidgetRect().set_x((i * 0.37) % 1).set_y((i * 0.23) % 1).set_width(0.2).set_height(0.1)
+        rect.color = (i * 7 % 256, i * 13 % 256, i * 29 % 256, 255)
+        background.append(rect)
+
+    template = make_template(variables)
+    labels = []
+    for i in range(texts):
+        text = WidgetText(template).set_x(0.5).set_y((i + 0.5) / max(texts, 1))
+        text.alignment = TextAlignment.CENTER
+        text.font_size = 0.5
+        labels.append(text)
+    return Layout(width, height, [Layer(background), Layer(labels)])
@@ -0,0 +1,165 @@
+"""
+Local HTTP server imitating the parts of the osu! API used by OsuAPI, for benchmarks without network access.
+"""
+import json
+import threading
+import time
+import zlib
+from collections import Counter
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict
+from urllib.parse import urlsplit, parse_qs
+
+from osu.api import OsuAPI
+
+TOKEN = "fake-token"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_Server"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json") -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _json(self, data, status: int = 200) -> None:
+        self._send(status, json.dumps(data).encode("utf-8"))
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        self.rfile.read(length)
+        self.server.fake.hit("token")
+        if urlsplit(self.path).path.rstrip("/") != "/oauth/token":
+            return self._json({"error": "not found"}, 404)
+        self._json({"access_token": TOKEN, "expires_in": 86400, "token_type": "Bearer"})
+
+    def do_GET(self):
+        fake = self.server.fake
+        url = urlsplit(self.path)
+        # OsuAPI joins OSU_URL with a slash of its own
+        path = "/" + url.path.lstrip("/")
+        if self.headers.get("Authorization") != f"Bearer {TOKEN}":
+            fake.hit("unauthorized")
+            return self._json({"error": "unauthorized"}, 401)
+        if fake.latency:
+            time.sleep(fake.latency)
+
+        parts = path.strip("/").split("/")
+        if path.startswith("/api/v2/users/@"):
+            fake.hit("user")
+            name = path[len("/api/v2/users/@"):]
+            return self._json({"id": zlib.crc32(name.encode("utf-8")) % 10 ** 7, "username": name,
+                               "country_code": "PL", "avatar_url": f"https://a.ppy.sh/{name}"})
+        if path.startswith("/api/v2/users/") and path.endswith("/scores/best"):
+            fake.hit("user_bests")
+            return self._json([])
+        if path == "/api/v2/beatmaps/lookup":
+            fake.hit("lookup")
+            checksum = parse_qs(url.query).get("checksum", [""])[0]
+            beatmap_id = fake.beatmap_ids.get(checksum)
+            if beatmap_id is None:
+                return self._json({"error": "not found"}, 404)
+            return self._json({"id": beatmap_id, "checksum": checksum, "difficulty_rating": 5.0})
+        if len(parts) == 2 and parts[0] == "osu" and parts[1].isdigit():
+            fake.hit("download")
+            content = fake.beatmaps.get(int(parts[1]))
+            if content is None:
+                return self._send(404, b"", "text/plain")
+            return self._send(200, content, "text/plain")
+        fake.hit("not_found")
+        self._json({"error": "not found"}, 404)
+
+
+class _Server(ThreadingHTTPServer):
+    daemon_threads = True
+    fake: "FakeOsuServer"
+
+
+class FakeOsuServer:
+    """
+    Serves token, user, beatmap lookup and .osu download endpoints on localhost.
+
+    Beatmaps are registered by content, lookups by their MD5 return the id under which the file is downloadable.
+    """
+
+    def __init__(self, beatmaps: Dict[str, bytes] | None = None, latency: float = 0.0):
+        """
+        :param beatmaps: .osu contents keyed by their MD5.
+        :param latency: Seconds added to every API response, imitates the network.
+        """
+        self.latency = latency
+        self.beatmap_ids: Dict[str, int] = {}
+        self.beatmaps: Dict[int, bytes] = {}
+        for beatmap_hash, content in (beatmaps or {}).items():
+            self.add_beatmap(beatmap_hash, content)
+        self.requests: Counter = Counter()
+        self._lock = threading.Lock()
+        self._server: _Server | None = None
+        self._thread: threading.Thread | None = None
+
+    def add_beatmap(self, beatmap_hash: str, content: bytes) -> int:
+        beatmap_id = self.beatmap_ids.setdefault(beatmap_hash, len(self.beatmap_ids) + 1)
+        self.beatmaps[beatmap_id] = content
+        return beatmap_id
+
+    def hit(self, endpoint: str) -> None:
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> "FakeOsuServer":
+        self._server = _Server(("127.0.0.1", 0), _Handler)
+        self._server.fake = self
+        self._thread = threading.Thread(target=self._server.serve_forever, name="fake-osu-api", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+            self._thread.join()
+            self._server = None
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.stop()
+
+    def urls(self) -> Dict[str, str]:
+        """
+        URL arguments of AsyncOsuAPI pointing it at this server, e.g. AsyncOsuAPI(id, secret, **server.urls()).
+        """
+        return {"base_url": f"{self.url}/api/v2", "token_url": f"{self.url}/oauth/token", "osu_url": self.url}
+
+    @contextmanager
+    def patch_api(self, session_path: str | Path):
+        """
+        Points OsuAPI at this server while the block runs.
+        :param session_path: Where the fake token is saved, so the real session file is not overwritten.
+        """
+        names = ("OSU_URL", "BASE_URL", "TOKEN_URL", "SESSION_PATH")
+        previous = {name: getattr(OsuAPI, name) for name in names}
+        OsuAPI.OSU_URL = self.url
+        OsuAPI.BASE_URL = f"{self.url}/api/v2"
+        OsuAPI.TOKEN_URL = f"{self.url}/oauth/token"
+        OsuAPI.SESSION_PATH = str(session_path)
+        try:
+            yield self
+        finally:
+            for name, value in previous.items():
+                setattr(OsuAPI, name, value)
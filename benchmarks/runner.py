@@ -0,0 +1,293 @@
+"""
+Benchmark suite of the hot paths: replay parsing, text templates, pp calculation, rendering, encoding
+and the whole batch pipeline against a local fake osu! API. Inputs are generated by benchmarks.corpus.
+
+Results are saved as JSON, a previous result can be compared with the current run.
+
+Run: python -m benchmarks.runner [--quick] [--output FILE] [--compare BASELINE] [--only NAME ...]
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List
+
+import PIL
+
+from benchmarks.corpus import make_layout, make_template, make_variables, write_beatmap, write_replays
+from benchmarks.fake_api import FakeOsuServer
+from core.config import generate_config
+from core.text_template import TextTemplate
+from osu.api import OsuAPI
+from osu.beatmap_store import BeatmapStore
+from osu.calculate import calculate_play_performance, clear_calculation_caches
+from osu.config import OsuAPICacheConfig
+from osu.replay import OsuReplay
+from pipeline.batch import BatchPipeline
+from pipeline.config import RenderCacheConfig
+from renderer.encoder import ImageEncoder, EncodeOptions
+from renderer.pillow import PillowRenderer
+
+
+def measure(name: str, function: Callable[[], Any], repeat: int, items: int = 1, warmup: int = 1,
+            **params) -> Dict[str, Any]:
+    """
+    Times function repeat times after warmup calls.
+    :param items: Units of work done by one call (e.g. replays), per_item_us is derived from the best run.
+    :param params: Parameters of the benchmark, stored with the result.
+    """
+    for _ in range(warmup):
+        function()
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+    best = min(times)
+    return {
+        "name": name,
+        "params": params,
+        "repeat": repeat,
+        "items": items,
+        "best_s": best,
+        "median_s": statistics.median(times),
+        "mean_s": statistics.fmean(times),
+        "per_item_us": best / items * 1e6,
+    }
+
+
+@contextmanager
+def overrides(section, **values):
+    """
+    Temporarily changes fields of a config section.
+    """
+    previous = {name: getattr(section, name) for name in values}
+    for name, value in values.items():
+        setattr(section, name, value)
+    try:
+        yield
+    finally:
+        for name, value in previous.items():
+            setattr(section, name, value)
+
+
+def bench_replay(workdir: Path, quick: bool) -> List[dict]:
+    replays = 20 if quick else 100
+    results = []
+    for frames in ((1000,) if quick else (1000, 20000)):
+        paths = write_replays(workdir / f"replays_{frames}", replays, "0" * 32, frames)
+
+        def headers():
+            for path in paths:
+                OsuReplay(path, header_only=True)
+
+        def full():
+            for path in paths:
+                with OsuReplay(path) as replay:
+                    replay.frames
+
+        results.append(measure("replay.parse_header", headers, 5, items=replays, frames=frames))
+        results.append(measure("replay.parse_frames", full, 3, items=replays, frames=frames))
+    return results
+
+
+def bench_text_template(quick: bool) -> List[dict]:
+    repeat = 200 if quick else 2000
+    results = []
+    for variables in (3, 50, 500):
+        source = make_template(variables)
+        values = {f"VAR_{i}": i for i in range(variables)}
+        variable_map = make_variables(variables)
+        template = TextTemplate(source)
+
+        def resolve_dict():
+            for _ in range(repeat):
+                template.resolve_dict(values)
+
+        def resolve_varmap():
+            for _ in range(repeat):
+                template.resolve_varmap(variable_map)
+
+        rounds = max(1, repeat // variables)
+        results.append(measure("text_template.tokenize", lambda: [TextTemplate(source) for _ in range(rounds)], 5,
+                               items=rounds, variables=variables))
+        results.append(measure("text_template.resolve_dict", resolve_dict, 5, items=repeat, variables=variables))
+        results.append(measure("text_template.resolve_varmap", resolve_varmap, 5, items=repeat,
+                               variables=variables))
+    return results
+
+
+def bench_calculate(workdir: Path, quick: bool) -> List[dict]:
+    results = []
+    for objects in ((500,) if quick else (500, 3000)):
+        beatmap_path, beatmap_hash = write_beatmap(workdir / "beatmaps", objects)
+        replay_path = write_replays(workdir / f"calculate_{objects}", 1, beatmap_hash, 100)[0]
+        with OsuReplay(replay_path, header_only=True) as replay:
+            def cold():
+                clear_calculation_caches()
+                calculate_play_performance(str(beatmap_path), replay)
+
+            results.append(measure("calculate.cold", cold, 5, objects=objects))
+            results.append(measure("calculate.warm", lambda: calculate_play_performance(str(beatmap_path), replay),
+                                   20, objects=objects))
+    return results
+
+
+def bench_render(quick: bool) -> List[dict]:
+    renderer = PillowRenderer()
+    results = []
+    sizes = ((8, 1, 3), (64, 8, 10)) if quick else ((8, 1, 3), (64, 8, 10), (256, 32, 20))
+    for rects, texts, variables in sizes:
+        layout = make_layout(rects, texts, variables)
+        variable_maps = [make_variables(variables, seed) for seed in range(10)]
+        params = {"rects": rects, "texts": texts, "variables": variables}
+
+        def render_layout():
+            for variable_map in variable_maps:
+                renderer.render_layout(layout, variable_map.overlay())
+
+        def render_many():
+            for _ in renderer.render_many(layout, (variable_map.overlay() for variable_map in variable_maps)):
+                pass
+
+        results.append(measure("render.render_layout", render_layout, 3, items=len(variable_maps), **params))
+        results.append(measure("render.render_many", render_many, 3, items=len(variable_maps), **params))
+    return results
+
+
+def bench_encode(quick: bool) -> List[dict]:
+    renderer = PillowRenderer()
+    image = renderer.render_layout(make_layout(64, 8, 10), make_variables(10))
+    results = []
+    with ImageEncoder(renderer, workers=1) as encoder:
+        for format in ("PNG", "JPEG", "WEBP"):
+            options = EncodeOptions.from_config(format)
+            size = len(encoder.encode(image, options))
+            results.append(measure("encode", lambda: encoder.encode(image, options), 3 if quick else 10,
+                                   format=format, bytes=size))
+    return results
+
+
+def bench_pipeline(workdir: Path, quick: bool) -> List[dict]:
+    replays = 12 if quick else 60
+    beatmap_path, beatmap_hash = write_beatmap(workdir / "pipeline_maps", 1000)
+    paths = write_replays(workdir / "pipeline_replays", replays, beatmap_hash, 5000)
+    results = []
+    with FakeOsuServer({beatmap_hash: beatmap_path.read_bytes()}, latency=0.005) as server, \
+            server.patch_api(workdir / "session.json"), \
+            overrides(OsuAPICacheConfig, enabled=False), overrides(RenderCacheConfig, enabled=False):
+        # Render processes read the same settings from the config file
+        config_path = workdir / "config.toml"
+        generate_config(config_path)
+        for run in range(2 if quick else 3):
+            # Every run starts without downloaded beatmaps
+            store = BeatmapStore(workdir / f"pipeline_store_{run}")
+            output_dir = workdir / f"pipeline_output_{run}"
+            server.requests.clear()
+            with OsuAPI("benchmark", "benchmark") as api:
+                pipeline = BatchPipeline(api, store, io_workers=8, render_workers=0, queue_size=32,
+                                         output_dir=str(output_dir), output_format="PNG",
+                                         config_path=str(config_path))
+                report = pipeline.run(paths)
+            rendered = report.stages[-1].count
+            if rendered != replays:
+                raise RuntimeError(f"Pipeline rendered {rendered} of {replays} replays")
+            results.append({
+                "name": "pipeline.batch",
+                "params": {"replays": replays, "run": run, "render_workers": pipeline.render_workers},
+                "repeat": 1,
+                "items": replays,
+                "best_s": report.wall,
+                "median_s": report.wall,
+                "mean_s": report.wall,
+                "per_item_us": report.wall / replays * 1e6,
+                "replays_per_s": replays / report.wall,
+                "requests": dict(server.requests),
+            })
+    return results
+
+
+BENCHMARKS = {
+    "replay": lambda workdir, quick: bench_replay(workdir, quick),
+    "text_template": lambda workdir, quick: bench_text_template(quick),
+    "calculate": lambda workdir, quick: bench_calculate(workdir, quick),
+    "render": lambda workdir, quick: bench_render(quick),
+    "encode": lambda workdir, quick: bench_encode(quick),
+    "pipeline": lambda workdir, quick: bench_pipeline(workdir, quick),
+}
+
+
+def environment() -> Dict[str, Any]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        "commit": commit,
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S%z"),
+        "python": sys.version.split()[0],
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "pillow": PIL.__version__,
+    }
+
+
+def result_key(result: dict) -> str:
+    params = ",".join(f"{key}={value}" for key, value in sorted(result["params"].items()) if key != "bytes")
+    return f"{result['name']}[{params}]"
+
+
+def compare(baseline: dict, current: dict) -> str:
+    """
+    Table of best times of the benchmarks present in both results, ratio above 1 means the current run is slower.
+    """
+    old = {result_key(result): result for result in baseline["results"]}
+    rows = [(key, old[key]["best_s"], result["best_s"]) for result in current["results"]
+            if (key := result_key(result)) in old]
+    width = max((len(key) for key, _, _ in rows), default=9)
+    lines = [f"Compared with {baseline['environment'].get('commit')}",
+             f"{'benchmark':<{width}} {'before ms':>10} {'after ms':>10} {'ratio':>7}"]
+    for key, before, after in rows:
+        ratio = after / before if before else float("inf")
+        lines.append(f"{key:<{width}} {before * 1000:>10.3f} {after * 1000:>10.3f} {ratio:>7.2f}")
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--quick", action="store_true", help="smaller corpus, for a fast sanity check")
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), help="benchmarks to run, all by default")
+    parser.add_argument("--output", default="benchmark_results.json", help="JSON file with the results")
+    parser.add_argument("--compare", metavar="BASELINE", help="results of an earlier run to compare with")
+    args = parser.parse_args()
+
+    results = []
+    with tempfile.TemporaryDirectory(prefix="hosu-bench-") as tmp:
+        for name in args.only or BENCHMARKS:
+            start = time.perf_counter()
+            results.extend(BENCHMARKS[name](Path(tmp), args.quick))
+            print(f"{name}: {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    current = {"environment": environment(), "quick": args.quick, "results": results}
+    Path(args.output).write_text(json.dumps(current, indent=2), encoding="utf-8")
+
+    width = max(len(result_key(result)) for result in results)
+    for result in results:
+        print(f"{result_key(result):<{width}} best {result['best_s'] * 1000:>10.3f}ms "
+              f"per item {result['per_item_us']:>12.2f}us")
+    print(f"Saved results to {args.output}")
+
+    if args.compare:
+        print(compare(json.loads(Path(args.compare).read_text(encoding="utf-8")), current))
+
+
+if __name__ == "__main__":
+    main()
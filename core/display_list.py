@@ -0,0 +1,105 @@
+from array import array
+from dataclasses import dataclass
+from enum import IntEnum
+from typing import List, Tuple, Any, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from core.layout import Layer, Widget
+
+# Font size 1.0 equals 1/16 of the canvas width
+FONT_SIZE_SCALE = 1 / 16
+
+# Number of floats stored per command: x, y, width, height, font size
+COORDS_STRIDE = 5
+
+
+def font_size_to_px(canvas_width: float, font_size: float) -> float:
+    """
+    Converts relative font size used by widgets to pixels.
+    """
+    return canvas_width * FONT_SIZE_SCALE * font_size
+
+
+class DrawOp(IntEnum):
+    RECT = 0
+    TEXT = 1
+    # Fallback for widgets that cannot be compiled, the widget draws itself on replay
+    WIDGET = 2
+
+
+@dataclass
+class LayerSpan:
+    """
+    Range of commands [start, end) compiled from one layer.
+    """
+    start: int
+    end: int
+    layer: "Layer"
+    static: bool
+
+
+class DisplayList:
+    """
+    Flat, array-backed list of draw commands compiled from a Layout.
+
+    Coordinates are already in pixels and colours already RGBA tuples.
+    Text that depends on variables keeps its TextTemplate and is resolved on replay.
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self.ops = array('B')
+        self.coords = array('d')
+        self.colors: List[Tuple[int, int, int, int]] = []
+        # str or TextTemplate for text, widget for widget fallback, None otherwise
+        self.payloads: List[Any] = []
+        # (alignment, drop shadow) for text, None otherwise
+        self.styles: List[Tuple[Any, bool] | None] = []
+        # Widget each command was compiled from
+        self.sources: List["Widget"] = []
+        self.layers: List[LayerSpan] = []
+        self._layer_start = 0
+        self._source: "Widget | None" = None
+
+    def __len__(self) -> int:
+        return len(self.ops)
+
+    def begin_layer(self) -> None:
+        self._layer_start = len(self.ops)
+
+    def end_layer(self, layer: "Layer", static: bool) -> None:
+        self.layers.append(LayerSpan(self._layer_start, len(self.ops), layer, static))
+
+    def compile_widget(self, widget: "Widget") -> None:
+        self._source = widget
+        try:
+            widget.compile(self)
+        finally:
+            self._source = None
+
+    def add_rect(self, x: float, y: float, width: float, height: float, color: Tuple[int, int, int, int]) -> None:
+        self._add(DrawOp.RECT, (x, y, width, height, 0.0), color, None, None)
+
+    def add_text(self, x: float, y: float, font_size: float, text: Any, color: Tuple[int, int, int, int],
+                 align: Any, drop_shadow: bool) -> None:
+        """
+        :param font_size: Font size in pixels.
+        :param text: Resolved str or TextTemplate resolved on replay.
+        """
+        self._add(DrawOp.TEXT, (x, y, 0.0, 0.0, font_size), color, text, (align, drop_shadow))
+
+    def add_widget(self, widget: "Widget") -> None:
+        self._add(DrawOp.WIDGET, (0.0, 0.0, 0.0, 0.0, 0.0), (0, 0, 0, 0), widget, None)
+
+    def _add(self, op: DrawOp, coords: Tuple[float, float, float, float, float], color: Tuple[int, int, int, int],
+             payload: Any, style: Tuple[Any, bool] | None) -> None:
+        self.ops.append(op)
+        self.coords.extend(coords)
+        self.colors.append(color)
+        self.payloads.append(payload)
+        self.styles.append(style)
+        self.sources.append(self._source)
+
+    def __repr__(self) -> str:
+        return f"DisplayList({self.width}x{self.height}, commands={len(self)}, layers={len(self.layers)})"
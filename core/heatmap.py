@@ -0,0 +1,73 @@
+from typing import Sequence, Tuple
+
+import numpy as np
+
+# osu! playfield size in osu! pixels
+PLAYFIELD_WIDTH = 512
+PLAYFIELD_HEIGHT = 384
+
+ColorStop = Tuple[float, Tuple[int, int, int, int]]
+
+DEFAULT_STOPS: Sequence[ColorStop] = (
+    (0.0, (0, 0, 0, 0)),
+    (0.25, (40, 60, 255, 120)),
+    (0.5, (0, 220, 255, 170)),
+    (0.75, (255, 230, 0, 215)),
+    (1.0, (255, 40, 40, 255)),
+)
+
+
+def color_lut(stops: Sequence[ColorStop]) -> np.ndarray:
+    """
+    Builds 256 entry RGBA lookup table by linear interpolation between color stops.
+    """
+    positions = np.array([position for position, _ in stops], dtype=np.float64)
+    colors = np.array([color for _, color in stops], dtype=np.float64)
+    samples = np.linspace(0.0, 1.0, 256)
+    lut = np.empty((256, 4), dtype=np.uint8)
+    for channel in range(4):
+        lut[:, channel] = np.round(np.interp(samples, positions, colors[:, channel]))
+    return lut
+
+
+def box_blur(values: np.ndarray, radius: int, axis: int) -> np.ndarray:
+    """
+    Averages every value with its neighbours within radius along axis, using a running sum.
+    """
+    if radius <= 0:
+        return values
+    padded = np.pad(values, [(radius, radius) if a == axis else (0, 0) for a in range(values.ndim)], mode="edge")
+    summed = np.cumsum(padded, axis=axis)
+    summed = np.insert(summed, 0, 0.0, axis=axis)
+    window = 2 * radius + 1
+    upper = np.take(summed, np.arange(window, summed.shape[axis]), axis=axis)
+    lower = np.take(summed, np.arange(0, summed.shape[axis] - window), axis=axis)
+    return (upper - lower) / window
+
+
+def cursor_heatmap(x: np.ndarray, y: np.ndarray, bins: Tuple[int, int], blur: int = 2,
+                   stops: Sequence[ColorStop] = DEFAULT_STOPS) -> np.ndarray:
+    """
+    Bins cursor positions into a 2D histogram, blurs it and maps it to colors.
+
+    :param x: Cursor x positions in osu! pixels.
+    :param y: Cursor y positions in osu! pixels.
+    :param bins: Number of (columns, rows) of the histogram.
+    :param blur: Blur radius in bins, applied twice to approximate a gaussian.
+    :param stops: Color gradient from the lowest to the highest density.
+    :return: RGBA image as uint8 array of shape (rows, columns, 4).
+    """
+    columns, rows = max(1, bins[0]), max(1, bins[1])
+    histogram, _, _ = np.histogram2d(y, x, bins=(rows, columns),
+                                     range=((0, PLAYFIELD_HEIGHT), (0, PLAYFIELD_WIDTH)))
+    for _ in range(2):
+        histogram = box_blur(box_blur(histogram, blur, axis=0), blur, axis=1)
+
+    peak = histogram.max()
+    if peak <= 0:
+        return np.zeros((rows, columns, 4), dtype=np.uint8)
+
+    # Log scale keeps rarely visited areas visible next to the hot spots
+    density = np.log1p(histogram) / np.log1p(peak)
+    indices = np.clip(density * 255.0, 0, 255).astype(np.uint8)
+    return color_lut(stops)[indices]
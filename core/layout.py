@@ -1,7 +1,10 @@
+import hashlib
 from abc import ABC
 from dataclasses import dataclass, field
-from typing import List
+from enum import Enum
+from typing import List, Set, Tuple, Any
 
+from core.display_list import DisplayList
 from core.errors import NotImplementedWidgetError
 from core.logger import get_logger
 from core.namespaced_key import NamespacedKey
@@ -9,16 +12,93 @@ from core.namespaced_key import NamespacedKey
 logger = get_logger(__name__)
 
 
+def _canonical(value: Any) -> Any:
+    """
+    Converts a property value into plain, deterministically printable data.
+    """
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, (list, tuple)):
+        return tuple(_canonical(item) for item in value)
+    if isinstance(value, dict):
+        return tuple(sorted((str(key), _canonical(item)) for key, item in value.items()))
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return value
+    return repr(value)
+
+
 class Widget(ABC):
     KEY: NamespacedKey = None
 
-    def draw(self, renderer, variable_map):
+    def __setattr__(self, name, value):
+        super().__setattr__(name, value)
+        # Changing any public property invalidates everything cached from this widget
+        if not name.startswith("_"):
+            super().__setattr__("_revision", self.revision + 1)
+
+    @property
+    def revision(self) -> int:
+        """
+        Counter increased on every change of a public property.
+        """
+        return self.__dict__.get("_revision", 0)
+
+    def get_vars(self) -> Set[str]:
+        """
+        :return: Names of the variables this widget reads while drawing.
+        """
+        return set()
+
+    def fingerprint(self) -> tuple:
+        """
+        Deterministic description of the widget, its key and all public properties.
+        Unlike revision it is the same across processes for equal widgets.
+        """
+        key = str(self.KEY) if self.KEY is not None else self.__class__.__qualname__
+        properties = sorted((name, _canonical(value)) for name, value in vars(self).items()
+                            if not name.startswith("_"))
+        return key, tuple(properties)
+
+    def compile(self, display_list: DisplayList) -> None:
+        """
+        Emits draw commands of this widget into the display list.
+        By default the widget is kept as a whole and draws itself on replay.
+        """
+        display_list.add_widget(self)
+
+    def draw(self, renderer, ctx, variable_map):
         raise NotImplementedWidgetError(renderer.__class__.__name__, self.__class__.__name__)
 
 
 @dataclass
 class Layer:
     widgets: List[Widget] = field(default_factory=list)
+    _analysis: Tuple[tuple, bool] | None = field(default=None, init=False, repr=False, compare=False)
+
+    def get_vars(self) -> Set[str]:
+        names: Set[str] = set()
+        for widget in self.widgets:
+            names |= widget.get_vars()
+        return names
+
+    def signature(self) -> tuple:
+        """
+        Identifies the current state of the layer.
+        Changes when a widget is added, removed, reordered or modified.
+        """
+        return tuple((id(widget), widget.revision) for widget in self.widgets)
+
+    def is_static(self) -> bool:
+        """
+        Static layer does not reference any variable, so it looks the same in every render.
+        Renderers may rasterise it once, PillowRenderer does so for layers which only replace pixels
+        (rects, opaque images) and draws layers blending with the pixels underneath every time.
+        The analysis is cached until the layer changes.
+        """
+        signature = self.signature()
+        if self._analysis is None or self._analysis[0] != signature:
+            self._analysis = (signature, len(self.get_vars()) == 0)
+        return self._analysis[1]
 
 
 @dataclass
@@ -26,3 +106,40 @@ class Layout:
     width: int
     height: int
     layers: List[Layer] = field(default_factory=list)
+    _fingerprint: Tuple[tuple, str] | None = field(default=None, init=False, repr=False, compare=False)
+
+    def get_vars(self) -> Set[str]:
+        names: Set[str] = set()
+        for layer in self.layers:
+            names |= layer.get_vars()
+        return names
+
+    def signature(self) -> tuple:
+        return self.width, self.height, tuple(layer.signature() for layer in self.layers)
+
+    def fingerprint(self) -> str:
+        """
+        Hash of the size, layer order and type and properties of every widget.
+        Equal layouts have equal fingerprints, also in different processes.
+        The hash is cached until the layout changes.
+        """
+        signature = self.signature()
+        if self._fingerprint is None or self._fingerprint[0] != signature:
+            description = (self.width, self.height,
+                           tuple(tuple(widget.fingerprint() for widget in layer.widgets) for layer in self.layers))
+            self._fingerprint = (signature, hashlib.sha256(repr(description).encode("utf-8")).hexdigest())
+        return self._fingerprint[1]
+
+    def compile(self, width: int | None = None, height: int | None = None) -> DisplayList:
+        """
+        Compiles the layout into a flat display list any renderer can replay.
+        :param width: Width of the canvas in pixels, defaults to layout width.
+        :param height: Height of the canvas in pixels, defaults to layout height.
+        """
+        display_list = DisplayList(width or self.width, height or self.height)
+        for layer in self.layers:
+            display_list.begin_layer()
+            for widget in layer.widgets:
+                display_list.compile_widget(widget)
+            display_list.end_layer(layer, layer.is_static())
+        return display_list
@@ -0,0 +1,156 @@
+import hashlib
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict
+
+from core.layout import Layout
+from core.logger import get_logger
+from core.variable_map import VariableMap
+
+logger = get_logger(__name__)
+
+
+def render_key(layout: Layout, variable_map: VariableMap, renderer: tuple, format: str,
+               params: Dict[str, Any]) -> str:
+    """
+    Key of an encoded render: the layout fingerprint, resolved values of the variables
+    the layout uses, the renderer identity and the encoder options.
+
+    :param renderer: Renderer.cache_identity(), e.g. class name and font.
+    """
+    digest = hashlib.sha256()
+    digest.update(layout.fingerprint().encode("ascii"))
+    for name in sorted(layout.get_vars()):
+        variable = variable_map.get_variable(name)
+        digest.update(f"\0{name}={variable.fingerprint() if variable is not None else ''}".encode("utf-8"))
+    digest.update(repr((renderer, format.upper(), sorted(params.items()))).encode("utf-8"))
+    return digest.hexdigest()
+
+
+@dataclass(frozen=True)
+class RenderCacheStats:
+    hits: int
+    misses: int
+    evictions: int
+    entries: int
+    size: int
+    max_size: int
+
+    def __str__(self) -> str:
+        return (f"hits={self.hits} misses={self.misses} evictions={self.evictions} "
+                f"entries={self.entries} size={self.size}/{self.max_size}B")
+
+
+class RenderCache:
+    """
+    Disk cache of encoded renders keyed by render_key.
+
+    Files are sharded by the first two hex characters of the key: <root>/ab/abcdef...
+    and indexed in SQLite with their size and last access. When the total size exceeds
+    max_size the least recently used renders are removed. Several processes can share one cache.
+    """
+
+    def __init__(self, root: str | Path, max_size: int):
+        """
+        :param root: Directory of the cache, created when missing.
+        :param max_size: Maximum total size of stored renders in bytes.
+        """
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(self.root / "index.sqlite", check_same_thread=False, isolation_level=None,
+                                   timeout=30)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS renders (
+                key TEXT PRIMARY KEY,
+                size INTEGER NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS renders_accessed_at ON renders (accessed_at)")
+
+        self._hits = 0
+        self._misses = 0
+        self._evictions = 0
+
+    def path_for(self, key: str) -> Path:
+        return self.root / key[:2] / key
+
+    def get(self, key: str) -> bytes | None:
+        with self._lock:
+            known = self._db.execute("SELECT 1 FROM renders WHERE key = ?", (key,)).fetchone() is not None
+        data = None
+        if known:
+            try:
+                data = self.path_for(key).read_bytes()
+            except OSError:
+                logger.warning(f"Cached render {key} is missing, removing it from the index")
+
+        with self._lock:
+            if data is None:
+                self._misses += 1
+                if known:
+                    self._db.execute("DELETE FROM renders WHERE key = ?", (key,))
+                return None
+            self._hits += 1
+            self._db.execute("UPDATE renders SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return data
+
+    def put(self, key: str, data: bytes) -> None:
+        if len(data) > self.max_size:
+            logger.debug(f"Render {key} is larger than the whole cache, not storing")
+            return
+
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        # Write to a temporary file and rename, readers never see a partial render
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=".tmp-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO renders (key, size, accessed_at) VALUES (?, ?, ?)",
+                             (key, len(data), time.time()))
+            self._evict()
+
+    def _evict(self) -> None:
+        # Must be called with the lock held, the size is read from the index because other processes write too
+        size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM renders").fetchone()[0]
+        while size > self.max_size:
+            rows = self._db.execute("SELECT key, size FROM renders ORDER BY accessed_at LIMIT 16").fetchall()
+            if not rows:
+                return
+            for key, entry_size in rows:
+                if size <= self.max_size:
+                    break
+                self._db.execute("DELETE FROM renders WHERE key = ?", (key,))
+                self.path_for(key).unlink(missing_ok=True)
+                size -= entry_size
+                self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            for (key,) in self._db.execute("SELECT key FROM renders").fetchall():
+                self.path_for(key).unlink(missing_ok=True)
+            self._db.execute("DELETE FROM renders")
+
+    def stats(self) -> RenderCacheStats:
+        with self._lock:
+            entries, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM renders").fetchone()
+            return RenderCacheStats(self._hits, self._misses, self._evictions, entries, size, self.max_size)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,187 @@
+import json
+import threading
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Dict, Iterable, List, Tuple, TYPE_CHECKING
+
+from core.logger import get_logger
+
+if TYPE_CHECKING:
+    from core.layout import Layout, Widget
+
+logger = get_logger(__name__)
+
+
+def widget_key(widget: "Widget") -> str:
+    return str(widget.KEY) if widget.KEY is not None else widget.__class__.__qualname__
+
+
+@dataclass
+class WidgetCost:
+    """
+    Draw cost of one widget instance or of all widgets of one type, times in seconds.
+    """
+    name: str
+    key: str
+    calls: int = 0
+    total: float = 0.0
+    min: float = float("inf")
+    max: float = 0.0
+    # Characters drawn by text commands
+    glyphs: int = 0
+
+    def add(self, elapsed: float, glyphs: int, calls: int = 1) -> None:
+        self.calls += calls
+        self.total += elapsed
+        self.min = min(self.min, elapsed)
+        self.max = max(self.max, elapsed)
+        self.glyphs += glyphs
+
+    def merge(self, other: "WidgetCost") -> None:
+        self.calls += other.calls
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.glyphs += other.glyphs
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.calls if self.calls else 0.0
+
+    def to_dict(self) -> dict:
+        data = asdict(self)
+        data["min"] = self.min if self.calls else 0.0
+        data["mean"] = self.mean
+        return data
+
+
+class WidgetProfiler:
+    """
+    Opt-in record of widget draw costs, enabled with Renderer.enable_profiling().
+
+    Costs are kept per widget instance and per widget type (NamespacedKey).
+    Instances of a registered layout are named by their position, e.g. "1.0 hosu:widget_text"
+    is the first widget of the second layer, so profiles of equal layouts from different processes can be merged.
+    Static layers are drawn only when their bitmap is (re)built, so cached layers show few calls.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._instances: Dict[str, WidgetCost] = {}
+        self._types: Dict[str, WidgetCost] = {}
+        # id of a widget -> (widget, name), the widget is kept so its id is not reused
+        self._names: Dict[int, Tuple["Widget", str]] = {}
+        self._unnamed: Dict[str, int] = {}
+
+    def register(self, layout: "Layout") -> None:
+        """
+        Names the widgets of the layout by their position.
+        """
+        with self._lock:
+            for layer_index, layer in enumerate(layout.layers):
+                for widget_index, widget in enumerate(layer.widgets):
+                    if id(widget) not in self._names:
+                        self._names[id(widget)] = (widget, f"{layer_index}.{widget_index} {widget_key(widget)}")
+
+    def _name(self, widget: "Widget", key: str) -> str:
+        # Must be called with the lock held
+        entry = self._names.get(id(widget))
+        if entry is None:
+            number = self._unnamed.get(key, 0)
+            self._unnamed[key] = number + 1
+            entry = self._names[id(widget)] = (widget, f"{key}#{number}")
+        return entry[1]
+
+    def record(self, widget: "Widget", elapsed: float, glyphs: int = 0) -> None:
+        """
+        Adds one draw of the widget.
+        :param elapsed: Wall time of the draw in seconds.
+        :param glyphs: Characters of text drawn by the widget.
+        """
+        key = widget_key(widget)
+        with self._lock:
+            name = self._name(widget, key)
+            instance = self._instances.get(name)
+            if instance is None:
+                instance = self._instances[name] = WidgetCost(name, key)
+            instance.add(elapsed, glyphs)
+            widget_type = self._types.get(key)
+            if widget_type is None:
+                widget_type = self._types[key] = WidgetCost(key, key)
+            widget_type.add(elapsed, glyphs)
+
+    def instances(self) -> List[WidgetCost]:
+        """
+        Costs per widget instance, the most expensive first.
+        """
+        with self._lock:
+            return sorted(self._instances.values(), key=lambda cost: cost.total, reverse=True)
+
+    def types(self) -> List[WidgetCost]:
+        """
+        Costs per widget type, the most expensive first.
+        """
+        with self._lock:
+            return sorted(self._types.values(), key=lambda cost: cost.total, reverse=True)
+
+    def drain(self) -> Tuple[List[WidgetCost], List[WidgetCost]]:
+        """
+        Removes and returns the (instances, types) costs, e.g. to send them from a worker process.
+        """
+        with self._lock:
+            instances, types = list(self._instances.values()), list(self._types.values())
+            self._instances.clear()
+            self._types.clear()
+        return instances, types
+
+    def merge(self, instances: Iterable[WidgetCost], types: Iterable[WidgetCost]) -> None:
+        """
+        Adds costs recorded by another profiler.
+        """
+        with self._lock:
+            for target, costs in ((self._instances, instances), (self._types, types)):
+                for cost in costs:
+                    current = target.get(cost.name)
+                    if current is None:
+                        target[cost.name] = WidgetCost(cost.name, cost.key)
+                        current = target[cost.name]
+                    current.merge(cost)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._instances.clear()
+            self._types.clear()
+            self._names.clear()
+            self._unnamed.clear()
+
+    def report(self) -> str:
+        """
+        Tables of the costs per widget type and per instance, sorted by total time.
+        """
+        sections = [("widget type", self.types()), ("widget", self.instances())]
+        width = max((len(cost.name) for _, costs in sections for cost in costs), default=0)
+        width = max(width, len(sections[0][0]))
+        lines = []
+        for title, costs in sections:
+            if lines:
+                lines.append("")
+            lines.append(f"{title:<{width}} {'calls':>7} {'total ms':>10} {'mean ms':>9} {'max ms':>8} "
+                         f"{'glyphs':>8}")
+            for cost in costs:
+                lines.append(f"{cost.name:<{width}} {cost.calls:>7} {cost.total * 1000:>10.2f} "
+                             f"{cost.mean * 1000:>9.3f} {cost.max * 1000:>8.3f} {cost.glyphs:>8}")
+        return "\n".join(lines)
+
+    def to_dict(self) -> dict:
+        return {
+            "types": [cost.to_dict() for cost in self.types()],
+            "instances": [cost.to_dict() for cost in self.instances()],
+        }
+
+    def save_json(self, path: str | Path) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        logger.info(f"Saved widget profile to {path}")
+        return path
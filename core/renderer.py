@@ -1,10 +1,17 @@
+import time
 import traceback
 from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
 from enum import Enum
-from typing import Any, Tuple
+from pathlib import Path
+from typing import Any, Tuple, Iterable, Iterator, BinaryIO
 
+from core.display_list import DisplayList, DrawOp, LayerSpan, COORDS_STRIDE, FONT_SIZE_SCALE
 from core.layout import Layout, Layer
 from core.logger import get_logger
+from core.render_cache import RenderCache, render_key
+from core.render_profile import WidgetProfiler, widget_key
+from core.tracing import get_tracer, span, NO_SPAN
 from core.variable_map import VariableMap
 
 logger = get_logger(__name__)
@@ -19,33 +26,73 @@ class TextAlignment(str, Enum):
 RGBA = Tuple[int, int, int, int]
 
 
+@dataclass
+class RenderContext:
+    """
+    Mutable state of a single render.
+    Created by Renderer.begin and passed through every draw call,
+    so one renderer with warm caches can serve many renders at once.
+    """
+    layout: Layout
+    # Characters drawn so far, renderers increase it in draw_text_px
+    glyphs: int = field(default=0, kw_only=True)
+
+    @property
+    def width(self) -> int:
+        return self.layout.width
+
+    @property
+    def height(self) -> int:
+        return self.layout.height
+
+
 # TODO: think about the renderer API, maybe it should be different
 class Renderer(ABC):
     """
     Abstract base class for all renderers (Pillow etc.).
     Defines the API widgets can use to draw text or images.
+
+    Renderer itself holds only caches, all per-render state lives in RenderContext.
     """
 
+    # Records the cost of every widget draw when set, see enable_profiling()
+    profiler: WidgetProfiler | None = None
+
+    def enable_profiling(self, profiler: WidgetProfiler | None = None) -> WidgetProfiler:
+        """
+        Starts recording draw time, call count and drawn glyphs of every widget.
+        :param profiler: Profiler to record into, e.g. shared by several renderers. A new one by default.
+        """
+        self.profiler = profiler if profiler is not None else WidgetProfiler()
+        return self.profiler
+
+    def disable_profiling(self) -> WidgetProfiler | None:
+        profiler, self.profiler = self.profiler, None
+        return profiler
+
     @abstractmethod
-    def begin(self, layout: Layout) -> None:
+    def begin(self, layout: Layout) -> RenderContext:
         """
-        Initializes the renderer on the given layout.
+        Creates a new render of the given layout.
+        :return: Context passed to draw calls and end().
         """
         pass
 
     @abstractmethod
-    def end(self) -> Any:
+    def end(self, ctx: RenderContext) -> Any:
         """
-        Finalizes the renderer on the given layout.
+        Finalizes the render.
         Returns the rendered image.
         """
         pass
 
     @abstractmethod
-    def draw_text(self, position: Tuple[float, float], text: str, font_size: float = 0, color: RGBA = (255, 255, 255, 255),
-                  align: TextAlignment = TextAlignment.LEFT, drop_shadow: bool = False) -> None:
+    def draw_text(self, ctx: RenderContext, position: Tuple[float, float], text: str, font_size: float = 0,
+                  color: RGBA = (255, 255, 255, 255), align: TextAlignment = TextAlignment.LEFT,
+                  drop_shadow: bool = False) -> None:
         """
         Draws text on the given position.
+        :param ctx: Context of the render.
         :param position: Position of the text to be drawn.
         :param text: Text to be drawn.
         :param color: Color of the text to be drawn.
@@ -54,11 +101,12 @@ class Renderer(ABC):
         pass
 
     @abstractmethod
-    def draw_rect(self, position: Tuple[float, float], size: Tuple[int, int], color: RGBA = (255, 255, 255, 255),
-                  fill: bool = True) -> None:
+    def draw_rect(self, ctx: RenderContext, position: Tuple[float, float], size: Tuple[int, int],
+                  color: RGBA = (255, 255, 255, 255), fill: bool = True) -> None:
         """
         Draws rectangle on the given position.
 
+        :param ctx: Context of the render.
         :param position: Position of the rectangle to be drawn.
         :param size: Size of the rectangle to be drawn.
         :param color: Color of the rectangle to be drawn.
@@ -66,26 +114,226 @@ class Renderer(ABC):
         """
         pass
 
+    @abstractmethod
+    def draw_image(self, ctx: RenderContext, position: Tuple[float, float], size: Tuple[float, float],
+                   image: Any) -> None:
+        """
+        Draws image stretched to the destination rectangle, blending it by its alpha channel.
+
+        :param ctx: Context of the render.
+        :param position: Top left corner of the destination rectangle.
+        :param size: Size of the destination rectangle.
+        :param image: RGBA uint8 array of shape (height, width, 4) or a renderer specific image.
+        """
+        pass
+
+    def fill_rect_px(self, ctx: RenderContext, x: float, y: float, width: float, height: float, color: RGBA) -> None:
+        """
+        Fills rectangle given in canvas pixels.
+        Renderers should override it, default implementation goes through draw_rect.
+        """
+        w, h = ctx.width, ctx.height
+        self.draw_rect(ctx, (x / w, y / h), (width / w, height / h), color=color, fill=True)
+
+    def draw_text_px(self, ctx: RenderContext, x: float, y: float, text: str, font_size: float, color: RGBA,
+                     align: TextAlignment, drop_shadow: bool) -> None:
+        """
+        Draws text at position given in canvas pixels with font size in pixels.
+        Renderers should override it, default implementation goes through draw_text.
+        Implementations add the number of drawn characters to ctx.glyphs.
+        """
+        w, h = ctx.width, ctx.height
+        self.draw_text(ctx, (x / w, y / h), text, font_size=font_size / (w * FONT_SIZE_SCALE), color=color,
+                       align=align, drop_shadow=drop_shadow)
+
     # TODO: add method to clear the rendering surface
 
     # TODO: add method to draw line between two points
     # TODO: add method to draw circle at center position with radius
-    # TODO: add method to draw image at destination rectangle
 
     # TODO: add measure text that returns width and height of the text in pixels
 
 
-    def render_layout(self, layout: Layout, variable_map: VariableMap):
-        self.begin(layout)
+    def render_layout(self, layout: Layout, variable_map: VariableMap, cache: RenderCache | None = None,
+                      format: str | None = None, **params):
+        """
+        Renders the layout.
+
+        :param cache: When given, an equal render (same layout fingerprint, variable values, renderer
+                      and encoder options) is returned from the cache without drawing.
+        :param format: When given, returns encoded bytes instead of the image. Required with cache.
+        :param params: Encoder options passed to encode().
+        """
+        with span("render_layout", "render"):
+            # Providers of the used variables run before drawing, independent ones concurrently
+            with span("resolve_variables", "variables"):
+                variable_map.resolve(layout.get_vars())
+
+            key = None
+            if cache is not None:
+                if format is None:
+                    raise ValueError("Cached renders are stored encoded, format is required")
+                with span("render_cache.get", "cache"):
+                    key = render_key(layout, variable_map, self.cache_identity(), format, params)
+                    data = cache.get(key)
+                if data is not None:
+                    logger.debug(f"Render cache hit {key}")
+                    return data
+
+            if self.profiler is not None:
+                self.profiler.register(layout)
+            ctx = self.begin(layout)
+            for index, layer in enumerate(layout.layers):
+                if layer.is_static():
+                    with span(f"static_layer {index}", "layer"):
+                        self.render_static_layer(ctx, layer)
+                else:
+                    with span(f"layer {index}", "layer"):
+                        self.render_layer(ctx, layer, variable_map)
+            result = self.end(ctx)
+            if format is None:
+                return result
+
+            data = self.encode(result, format, **params)
+            if cache is not None:
+                with span("render_cache.put", "cache"):
+                    cache.put(key, data)
+            return data
+
+    def cache_identity(self) -> tuple:
+        """
+        Settings besides the layout and variables which change the rendered pixels, part of render cache keys.
+        """
+        return (self.__class__.__qualname__,)
+
+    def encode(self, result: Any, format: str, **params) -> bytes:
+        """
+        Encodes a rendered image into bytes of the given format (e.g. "PNG").
+        :param result: Value returned by end().
+        :param params: Encoder specific options.
+        """
+        raise NotImplementedError(f"{self.__class__.__name__} does not support encoding")
+
+    def encode_to(self, result: Any, target: str | Path | BinaryIO, format: str, **params) -> None:
+        """
+        Encodes a rendered image directly into a file or a binary stream.
+        Renderers can override it to avoid the intermediate buffer.
+        """
+        data = self.encode(result, format, **params)
+        if isinstance(target, (str, Path)):
+            Path(target).write_bytes(data)
+        else:
+            target.write(data)
+
+    def render_many(self, layout: Layout, variable_maps: Iterable[VariableMap], format: str | None = None,
+                    **params) -> Iterator[Any]:
+        """
+        Renders the same layout once for every variable map.
+        The layout is compiled once and static layers are rasterised once for the whole batch.
+
+        :param layout: Layout shared by all renders.
+        :param variable_maps: Variables of each render, consumed lazily.
+        :param format: When given, yields encoded bytes instead of images.
+        :param params: Encoder options passed to encode().
+        """
+        display_list = layout.compile()
+        names = layout.get_vars()
+        if self.profiler is not None:
+            self.profiler.register(layout)
+        for variable_map in variable_maps:
+            variable_map.resolve(names)
+            result = self.render_display_list(display_list, variable_map)
+            yield result if format is None else self.encode(result, format, **params)
+
+    def warm_up(self, layout: Layout) -> None:
+        """
+        Prepares caches used by the layout (e.g. static layer bitmaps) before the first real render.
+        Useful in long living workers, so the first render is not slower than the rest.
+        """
+        if self.profiler is not None:
+            self.profiler.register(layout)
+        ctx = self.begin(layout)
         for layer in layout.layers:
-            self.render_layer(layer, variable_map)
-        return self.end()
+            if layer.is_static():
+                self.render_static_layer(ctx, layer)
+        self.end(ctx)
+
+    def render_display_list(self, display_list: DisplayList, variable_map: VariableMap):
+        """
+        Renders a layout compiled with Layout.compile.
+        """
+        ctx = self.begin(Layout(display_list.width, display_list.height))
+        self.render_spans(ctx, display_list, display_list.layers, variable_map)
+        return self.end(ctx)
+
+    def render_spans(self, ctx: RenderContext, display_list: DisplayList, spans: Iterable[LayerSpan],
+                     variable_map: VariableMap):
+        for index, layer_span in enumerate(spans):
+            if layer_span.static:
+                with span(f"static_layer {index}", "layer"):
+                    self.render_static_layer(ctx, layer_span.layer)
+            else:
+                with span(f"layer {index}", "layer"):
+                    self.replay(ctx, display_list, layer_span.start, layer_span.end, variable_map)
+
+    def replay(self, ctx: RenderContext, display_list: DisplayList, start: int, end: int, variable_map: VariableMap):
+        """
+        Executes commands [start, end) of the display list.
+        """
+        ops, coords, colors = display_list.ops, display_list.coords, display_list.colors
+        payloads, styles = display_list.payloads, display_list.styles
+        tracer = get_tracer()
+        profiler = self.profiler
+        # Consecutive commands of one widget are profiled as a single draw
+        source, source_start, source_glyphs = None, 0.0, 0
+        for i in range(start, end):
+            op = ops[i]
+            if profiler is not None and display_list.sources[i] is not source:
+                if source is not None:
+                    profiler.record(source, time.perf_counter() - source_start, ctx.glyphs - source_glyphs)
+                source, source_start, source_glyphs = display_list.sources[i], time.perf_counter(), ctx.glyphs
+            try:
+                with tracer.span(widget_key(display_list.sources[i]), "widget") if tracer.enabled else NO_SPAN:
+                    if op == DrawOp.RECT:
+                        offset = i * COORDS_STRIDE
+                        self.fill_rect_px(ctx, coords[offset], coords[offset + 1], coords[offset + 2],
+                                          coords[offset + 3], colors[i])
+                    elif op == DrawOp.TEXT:
+                        offset = i * COORDS_STRIDE
+                        text = payloads[i]
+                        if not isinstance(text, str):
+                            text = text.resolve(variable_map)
+                        align, drop_shadow = styles[i]
+                        self.draw_text_px(ctx, coords[offset], coords[offset + 1], text, coords[offset + 4],
+                                          colors[i], align, drop_shadow)
+                    else:
+                        payloads[i].draw(self, ctx, variable_map)
+            except Exception as e:
+                widget = display_list.sources[i]
+                logger.error(f"Encountered error while rendering widget {widget.__class__.__name__}: {e}")
+                print(traceback.format_exc())
+        if source is not None:
+            profiler.record(source, time.perf_counter() - source_start, ctx.glyphs - source_glyphs)
+
+    def render_static_layer(self, ctx: RenderContext, layer: Layer):
+        """
+        Renders a layer which does not reference any variable.
+        Renderers can override it to rasterise the layer once and reuse the result.
+        """
+        self.render_layer(ctx, layer, VariableMap())
 
-    def render_layer(self, layer: Layer, variable_map: VariableMap):
+    def render_layer(self, ctx: RenderContext, layer: Layer, variable_map: VariableMap):
         logger.debug("Rendering layer")
+        tracer = get_tracer()
+        profiler = self.profiler
         for widget in layer.widgets:
+            if profiler is not None:
+                start, glyphs = time.perf_counter(), ctx.glyphs
             try:
-                widget.draw(self, variable_map)
+                with tracer.span(widget_key(widget), "widget") if tracer.enabled else NO_SPAN:
+                    widget.draw(self, ctx, variable_map)
             except Exception as e:
                 logger.error(f"Encountered error while rendering widget {widget.__class__.__name__}: {e}")
                 print(traceback.format_exc())
+            if profiler is not None:
+                profiler.record(widget, time.perf_counter() - start, ctx.glyphs - glyphs)
@@ -1,6 +1,8 @@
+import re
 from dataclasses import dataclass
-from typing import List, Union, Optional, Callable, Any
+from typing import List, Union, Optional, Callable, Any, Tuple
 
+from core.cache import LRUCache, CacheStats
 from core.logger import get_logger
 from core.variable_map import VariableMap
 
@@ -19,25 +21,35 @@ class Variable:
 
 Token = Union[Literal, Variable]
 
+# Escaped brace | {variable} (closing brace is optional) | text up to the next brace or a lone '}'
+_TOKEN = re.compile(r"(\{\{|\}\})|\{([^}]*)(\}?)|([^{}]+|\})")
+
 
 class TemplateLexer:
+    """
+    Splits a template into literals and {VAR} placeholders.
+    {{ and }} are escape sequences for literal braces.
+
+    The lexer walks the source with an index, the content is never copied.
+    """
+
     def __init__(self, content: str):
-        # We use list of chars to use slices.
-        self.content: List[str] = list(content)
+        self.content: str = content
+        self.position: int = 0
 
     def empty(self) -> bool:
-        return len(self.content) == 0
+        return self.position >= len(self.content)
 
     def peek(self) -> Optional[str]:
-        return self.content[0] if not self.empty() else None
+        return self.content[self.position] if not self.empty() else None
 
     def chop(self, n: int) -> str:
         """
         Chops first n chars from the buffer and returns them as string
         """
-        token = self.content[:n]
-        self.content = self.content[n:]
-        return ''.join(token)
+        start = self.position
+        self.position = min(start + n, len(self.content))
+        return self.content[start:self.position]
 
     def chop_while(self, predicate: Callable[[str], bool]) -> str:
         """
@@ -45,7 +57,7 @@ class TemplateLexer:
         Returns them as string.
         """
         n = 0
-        while n < len(self.content) and predicate(self.content[n]):
+        while self.position + n < len(self.content) and predicate(self.content[self.position + n]):
             n += 1
         return self.chop(n)
 
@@ -54,16 +66,10 @@ class TemplateLexer:
         Chops characters until predicate return true.
         Returns them as string.
         """
-        n = 0
-        while n < len(self.content) and not predicate(self.content[n]):
-            n += 1
-        return self.chop(n)
+        return self.chop_while(lambda c: not predicate(c))
 
     def trim(self) -> None:
-        n = 0
-        while n < len(self.content) and self.content[n].isspace():
-            n += 1
-        self.content = self.content[n:]
+        self.chop_while(str.isspace)
 
     def next_token(self) -> Optional[Token]:
         """
@@ -71,39 +77,67 @@ class TemplateLexer:
         """
         if self.empty():
             return None
-        # If next char is '{' start reading variable
-        # TODO: add escape sequences like \{ and \} or {{ and }}
-        if self.peek() == '{':
-            self.chop(1)  # skip {
-            self.trim()
-            varname = self.chop_until(lambda x: x == '}').rstrip().upper().replace(' ', '_')
-            if self.empty():
+
+        match = _TOKEN.match(self.content, self.position)
+        self.position = match.end()
+        escape, varname, closing, text = match.groups()
+        if escape is not None:
+            return Literal(escape[0])
+        if varname is not None:
+            varname = self._normalize(varname)
+            if not closing:
                 logger.warning(f"Unclosed variable: {varname}")
-                return Variable(varname)
-            self.chop(1)  # skip }
             return Variable(varname)
-        else:
-            # Literal until '{'
-            text = self.chop_until(lambda c: c == '{')
-            return Literal(text)
+        # A lone '}' is kept as text
+        return Literal(text)
+
+    @staticmethod
+    def _normalize(varname: str) -> str:
+        return varname.strip().upper().replace(' ', '_')
 
     def tokenize(self) -> List[Token]:
         tokens: List[Token] = []
         while not self.empty():
             token = self.next_token()
-            if token:
+            # Escapes split literals, adjacent ones are merged back
+            if isinstance(token, Literal) and tokens and isinstance(tokens[-1], Literal):
+                tokens[-1].text += token.text
+            elif token:
                 tokens.append(token)
         return tokens
 
 
 class TextTemplate:
     """
-    Supports plain text and {VAR} placeholders.
+    Supports plain text and {VAR} placeholders, {{ and }} produce literal braces.
+
+    A template is compiled once into a list of parts, literals stay in place and
+    variables are slots filled on resolve, so resolving is a single join.
+    Use TextTemplate.of to share compiled templates across the process.
     """
 
     def __init__(self, text: str):
         self.original = text
-        self.tokens: List[Token] = TemplateLexer(text).tokenize()
+        self.tokens: Tuple[Token, ...] = tuple(TemplateLexer(text).tokenize())
+        self._parts: List[str] = []
+        self._slots: List[Tuple[int, str]] = []
+        for token in self.tokens:
+            if isinstance(token, Variable):
+                self._slots.append((len(self._parts), token.name))
+                self._parts.append("")
+            else:
+                self._parts.append(token.text)
+        self._vars: List[str] = [name for _, name in self._slots]
+        # Plain text resolves to itself
+        self._text: str | None = None if self._slots else "".join(self._parts)
+
+    @classmethod
+    def of(cls, text: str) -> "TextTemplate":
+        """
+        Returns the compiled template of text, shared by all callers.
+        Templates are immutable, so sharing them is safe.
+        """
+        return _templates.get_or_create(text, lambda: cls(text))
 
     def resolve(self, variables: Union[dict[str, Any], VariableMap]) -> str:
         if isinstance(variables, VariableMap):
@@ -113,53 +147,39 @@ class TextTemplate:
         else:
             raise TypeError(f"Unsupported variable container: {type(variables)}")
 
-    #  TODO: make it generic with passing a getter function
-    def resolve_dict(self, variables: dict[str, Any]) -> str:
-        parts: List[str] = []
-        for token in self.tokens:
-            if isinstance(token, Literal):
-                parts.append(token.text)
-            elif isinstance(token, Variable):
-                val = variables.get(token.name)
-                if val is None:
-                    logger.warning(f"Missing variable {{{token.name}}}")
-                    parts.append(f"{{{token.name}}}")
-                else:
-                    parts.append(str(val))
-            else:
-                logger.warning(f"Unsupported token type: {type(token)}")
+    def resolve_with(self, getter: Callable[[str], str]) -> str:
+        """
+        Resolves the template, getter returns text of a variable by its name.
+        """
+        if self._text is not None:
+            return self._text
+        parts = self._parts.copy()
+        for index, name in self._slots:
+            parts[index] = getter(name)
         return "".join(parts)
 
+    def resolve_dict(self, variables: dict[str, Any]) -> str:
+        def getter(name: str) -> str:
+            val = variables.get(name)
+            if val is None:
+                logger.warning(f"Missing variable {{{name}}}")
+                return f"{{{name}}}"
+            return str(val)
+
+        return self.resolve_with(getter)
+
     def resolve_varmap(self, variables: VariableMap) -> str:
-        parts: List[str] = []
-        for token in self.tokens:
-            if isinstance(token, Literal):
-                parts.append(token.text)
-            elif isinstance(token, Variable):
-                if not variables.has(token.name):
-                    logger.warning(f"Missing variable {{{token.name}}}")
-                text = variables.get_text(token.name)
-                parts.append(text)
-            else:
-                logger.warning(f"Unsupported token type: {type(token)}")
-        return "".join(parts)
+        # VariableMap warns about missing variables and keeps the placeholder
+        return self.resolve_with(variables.get_text)
 
     def get_texts(self) -> List[str]:
-        parts: List[str] = []
-        for token in self.tokens:
-            if isinstance(token, Literal):
-                parts.append(token.text)
-        return parts
+        return [token.text for token in self.tokens if isinstance(token, Literal)]
 
     def get_vars(self) -> List[str]:
-        parts: List[str] = []
-        for token in self.tokens:
-            if isinstance(token, Variable):
-                parts.append(token.name)
-        return parts
+        return self._vars.copy()
 
     def get_tokens(self) -> List[Token]:
-        return self.tokens
+        return list(self.tokens)
 
     def __str__(self) -> str:
         """
@@ -168,10 +188,18 @@ class TextTemplate:
         parts: List[str] = []
         for token in self.tokens:
             if isinstance(token, Literal):
-                parts.append(token.text)
+                parts.append(token.text.replace('{', '{{').replace('}', '}}'))
             else:
                 parts.append(f"{{{token.name}}}")
         return "".join(parts)
 
     def __repr__(self) -> str:
         return f"{self.__class__.__name__}{self.__str__()}"
+
+
+# Compiled templates keyed by their source
+_templates: LRUCache[str, TextTemplate] = LRUCache(1024)
+
+
+def template_cache_stats() -> CacheStats:
+    return _templates.stats()
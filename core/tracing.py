@@ -0,0 +1,289 @@
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, List, NamedTuple, TypeVar
+
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+# Histogram buckets, bucket i holds durations in [2^(i-1), 2^i) microseconds, the last one everything above
+HISTOGRAM_BUCKETS = 32
+
+
+class SpanEvent(NamedTuple):
+    """
+    Finished span, times are perf_counter nanoseconds.
+    """
+    name: str
+    category: str
+    start: int
+    duration: int
+    pid: int
+    tid: int
+    thread: str
+    args: Dict[str, Any] | None
+
+
+@dataclass
+class SpanStats:
+    """
+    Durations of all spans with the same name, in seconds.
+    """
+    name: str
+    category: str
+    count: int = 0
+    total: float = 0.0
+    min: float = float("inf")
+    max: float = 0.0
+    histogram: List[int] = field(default_factory=lambda: [0] * HISTOGRAM_BUCKETS)
+
+    def add(self, duration_ns: int) -> None:
+        seconds = duration_ns / 1e9
+        self.count += 1
+        self.total += seconds
+        self.min = min(self.min, seconds)
+        self.max = max(self.max, seconds)
+        self.histogram[min((duration_ns // 1000).bit_length(), HISTOGRAM_BUCKETS - 1)] += 1
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def percentile(self, q: float) -> float:
+        """
+        Upper bound of the histogram bucket containing the q-th percentile (0-100), clamped to max.
+        """
+        if not self.count:
+            return 0.0
+        rank = q / 100 * self.count
+        seen = 0
+        for bucket, count in enumerate(self.histogram):
+            seen += count
+            if seen >= rank and count:
+                return min((1 << bucket) / 1e6, self.max)
+        return self.max
+
+    def __str__(self) -> str:
+        return (f"{self.name}: count={self.count} total={self.total * 1000:.1f}ms mean={self.mean * 1000:.2f}ms "
+                f"p50<={self.percentile(50) * 1000:.2f}ms p95<={self.percentile(95) * 1000:.2f}ms "
+                f"max={self.max * 1000:.2f}ms")
+
+
+class _NoSpan:
+    """
+    Span returned while tracing is disabled, does nothing.
+    """
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        return False
+
+
+NO_SPAN = _NoSpan()
+
+
+class Span:
+    __slots__ = ("tracer", "name", "category", "args", "start")
+
+    def __init__(self, tracer: "Tracer", name: str, category: str, args: Dict[str, Any] | None):
+        self.tracer = tracer
+        self.name = name
+        self.category = category
+        self.args = args
+        self.start = 0
+
+    def __enter__(self):
+        self.start = time.perf_counter_ns()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        duration = time.perf_counter_ns() - self.start
+        if exc_type is not None:
+            self.args = {**(self.args or {}), "error": exc_type.__name__}
+        self.tracer.record(self.name, self.category, self.start, duration, self.args)
+        return False
+
+
+class Tracer:
+    """
+    Collects timed spans of the pipeline stages.
+
+    Every span is aggregated into per-name statistics with a log2 histogram and kept as an event
+    for the Chrome trace export (chrome://tracing or https://ui.perfetto.dev), up to max_events.
+    While disabled span() returns a shared no-op object, so instrumented code pays one attribute check.
+    """
+
+    def __init__(self, enabled: bool = False, max_events: int = 1_000_000):
+        self.enabled = enabled
+        self.max_events = max_events
+        self._lock = threading.Lock()
+        self._events: List[SpanEvent] = []
+        self._stats: Dict[str, SpanStats] = {}
+        self._dropped = 0
+
+    def span(self, name: str, category: str = "", **args):
+        """
+        Context manager timing the block.
+        :param args: Values shown with the event in the trace viewer.
+        """
+        if not self.enabled:
+            return NO_SPAN
+        return Span(self, name, category, args or None)
+
+    def record(self, name: str, category: str, start: int, duration: int, args: Dict[str, Any] | None = None) -> None:
+        """
+        Adds a finished span measured elsewhere, times are perf_counter nanoseconds.
+        """
+        self._add(SpanEvent(name, category, start, duration, os.getpid(), threading.get_ident(),
+                            threading.current_thread().name, args))
+
+    def _add(self, event: SpanEvent) -> None:
+        with self._lock:
+            stats = self._stats.get(event.name)
+            if stats is None:
+                stats = self._stats[event.name] = SpanStats(event.name, event.category)
+            stats.add(event.duration)
+            if len(self._events) < self.max_events:
+                self._events.append(event)
+            else:
+                self._dropped += 1
+
+    def merge(self, events: Iterable[SpanEvent]) -> None:
+        """
+        Adds spans collected by another tracer, e.g. of a worker process.
+        """
+        for event in events:
+            self._add(SpanEvent(*event))
+
+    def drain(self) -> List[SpanEvent]:
+        """
+        Removes and returns the collected events. Statistics are kept.
+        """
+        with self._lock:
+            events, self._events = self._events, []
+        return events
+
+    def stats(self) -> Dict[str, SpanStats]:
+        with self._lock:
+            return dict(self._stats)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._events.clear()
+            self._stats.clear()
+            self._dropped = 0
+
+    def report(self) -> str:
+        """
+        Table of span statistics sorted by total time.
+        """
+        stats = sorted(self.stats().values(), key=lambda s: s.total, reverse=True)
+        width = max((len(s.name) for s in stats), default=4)
+        lines = [f"{'span':<{width}} {'count':>7} {'total ms':>10} {'mean ms':>9} {'p50 ms':>8} {'p95 ms':>8} "
+                 f"{'max ms':>8}"]
+        for s in stats:
+            lines.append(f"{s.name:<{width}} {s.count:>7} {s.total * 1000:>10.1f} {s.mean * 1000:>9.2f} "
+                         f"{s.percentile(50) * 1000:>8.2f} {s.percentile(95) * 1000:>8.2f} {s.max * 1000:>8.2f}")
+        if self._dropped:
+            lines.append(f"{self._dropped} events over the limit of {self.max_events} are not in the trace")
+        return "\n".join(lines)
+
+    def export_chrome_trace(self, path: str | Path) -> Path:
+        """
+        Writes the events in the Chrome trace_event JSON format.
+        """
+        with self._lock:
+            events = list(self._events)
+
+        trace: List[Dict[str, Any]] = []
+        threads: Dict[tuple, str] = {}
+        for event in events:
+            threads.setdefault((event.pid, event.tid), event.thread)
+            entry = {"name": event.name, "cat": event.category, "ph": "X", "ts": event.start / 1000,
+                     "dur": event.duration / 1000, "pid": event.pid, "tid": event.tid}
+            if event.args:
+                entry["args"] = {key: value if isinstance(value, (int, float, bool)) else str(value)
+                                 for key, value in event.args.items()}
+            trace.append(entry)
+        for (pid, tid), name in threads.items():
+            trace.append({"name": "thread_name", "ph": "M", "pid": pid, "tid": tid, "args": {"name": name}})
+
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, f)
+        logger.info(f"Saved trace with {len(events)} spans to {path}")
+        return path
+
+
+_tracer = Tracer()
+
+
+def get_tracer() -> Tracer:
+    """
+    Tracer of the process used by span() and traced().
+    """
+    return _tracer
+
+
+def enable(max_events: int | None = None) -> Tracer:
+    if max_events is not None:
+        _tracer.max_events = max_events
+    _tracer.enabled = True
+    return _tracer
+
+
+def disable() -> None:
+    _tracer.enabled = False
+
+
+def span(name: str, category: str = "", **args):
+    """
+    Times the block with the process tracer:
+
+        with span("download", "api", beatmap_id=beatmap_id):
+            ...
+    """
+    if not _tracer.enabled:
+        return NO_SPAN
+    return Span(_tracer, name, category, args or None)
+
+
+def traced(name: str | None = None, category: str = "") -> Callable[[F], F]:
+    """
+    Decorator timing every call of the function, named by its qualified name by default.
+    Coroutine functions are timed until they finish, not until they suspend.
+    """
+    def decorator(function: F) -> F:
+        span_name = name or function.__qualname__
+
+        if inspect.iscoroutinefunction(function):
+            @functools.wraps(function)
+            async def async_wrapper(*args, **kwargs):
+                if not _tracer.enabled:
+                    return await function(*args, **kwargs)
+                with Span(_tracer, span_name, category, None):
+                    return await function(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _tracer.enabled:
+                return function(*args, **kwargs)
+            with Span(_tracer, span_name, category, None):
+                return function(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
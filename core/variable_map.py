@@ -1,42 +1,295 @@
-from typing import Dict, Self
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, Self, Callable, Any, Iterable, Sequence, Set, List, Tuple, Iterator
 
 from core.logger import get_logger
+from core.tracing import span
 from core.variables import Variable
 
 logger = get_logger(__name__)
 
 
+@dataclass
+class Provider:
+    """
+    Lazily computes a variable or a resource.
+
+    The factory receives the values of its dependencies as positional arguments, in the order of depends_on.
+    A dependency is a resource name or a variable name (variables are passed as Variable objects).
+    """
+    factory: Callable[..., Any]
+    depends_on: Sequence[str]
+
+
 class VariableMap:
-    def __init__(self):
+    """
+    Variables used by a render.
+
+    Besides plain variables the map accepts providers, which compute a variable on the first access,
+    and resources, which are shared values (e.g. a parsed replay) providers can depend on.
+    Every provider runs at most once, resolve() computes independent providers concurrently.
+
+    Maps can be layered: lookups fall through to the parent and writes stay local,
+    so a batch keeps shared variables in one global scope and creates a cheap overlay per render.
+    A provider is computed and memoized by the scope which registered it, seeing only that scope
+    and its parents. E.g. a provider of the global scope is computed once for the whole batch.
+    """
+
+    def __init__(self, parent: "VariableMap | None" = None, max_workers: int = 8):
+        """
+        :param parent: Scope consulted for names which are not set in this map.
+        :param max_workers: Maximum number of providers computed at the same time by resolve().
+        """
+        self.parent = parent
+        self.max_workers = max_workers
         self._vars: Dict[str, Variable] = {}
+        self._providers: Dict[str, Provider] = {}
+        self._resources: Dict[str, Provider] = {}
+        # Computed resources, None when the resource failed
+        self._resource_values: Dict[str, Any] = {}
+        # Providers which already ran, including the failed ones
+        self._computed: Set[str] = set()
+        self._lock = threading.Lock()
+        self._key_locks: Dict[str, threading.Lock] = {}
+        self._version = 0
+
+    def overlay(self) -> "VariableMap":
+        """
+        Creates an empty scope on top of this map, e.g. for a single render of a batch.
+        """
+        return VariableMap(parent=self, max_workers=self.max_workers)
+
+    @property
+    def version(self) -> int:
+        """
+        Counter increased on every write to this map or any of its parents.
+        Lazily computed values do not change it, they are the same for the same version.
+        """
+        return self._version + (self.parent.version if self.parent is not None else 0)
+
+    def _scopes(self) -> Iterator["VariableMap"]:
+        scope = self
+        while scope is not None:
+            yield scope
+            scope = scope.parent
 
     def set(self, name: str, var: Variable) -> Self:
         name = name.upper()
-        self._vars[name] = var
+        with self._lock:
+            self._vars[name] = var
+            # Explicit value replaces a provider
+            self._providers.pop(name, None)
+            self._version += 1
+        return self
+
+    def provide(self, name: str, factory: Callable[..., Variable], depends_on: Iterable[str] = ()) -> Self:
+        """
+        Registers a variable computed on demand.
+
+        :param name: Name of the variable.
+        :param factory: Returns the Variable, called with the values of depends_on.
+        :param depends_on: Names of resources or variables the factory needs.
+        """
+        name = name.upper()
+        self._add_provider(self._providers, name, Provider(factory, tuple(depends_on)))
+        self._vars.pop(name, None)
+        return self
+
+    def provide_resource(self, name: str, factory: Callable[..., Any], depends_on: Iterable[str] = ()) -> Self:
+        """
+        Registers a shared value computed on demand, e.g. API response or parsed file.
+        Resource names are case-sensitive and take precedence over variables in depends_on.
+        """
+        self._add_provider(self._resources, name, Provider(factory, tuple(depends_on)))
         return self
 
+    def _add_provider(self, providers: Dict[str, Provider], name: str, provider: Provider) -> None:
+        with self._lock:
+            previous = providers.get(name)
+            providers[name] = provider
+            cycle = self._find_cycle(name)
+            if cycle:
+                if previous is None:
+                    del providers[name]
+                else:
+                    providers[name] = previous
+                raise ValueError(f"Circular dependency: {' -> '.join(cycle)}")
+            self._computed.discard(name)
+            self._resource_values.pop(name, None)
+            self._version += 1
+
+    def _is_resource(self, name: str) -> bool:
+        return any(name in scope._resources for scope in self._scopes())
+
+    def _key(self, name: str) -> str:
+        """
+        Normalized name of a dependency, resources first.
+        """
+        return name if self._is_resource(name) else name.upper()
+
+    def _owner(self, key: str) -> "VariableMap | None":
+        """
+        Nearest scope which sets or provides the normalized name.
+        """
+        for scope in self._scopes():
+            if key in scope._resources or key in scope._vars or key in scope._providers:
+                return scope
+        return None
+
+    def _provider(self, key: str) -> Tuple["VariableMap | None", Provider | None]:
+        """
+        Scope owning the normalized name and its provider, None when it is a plain variable or unknown.
+        """
+        owner = self._owner(key)
+        if owner is None:
+            return None, None
+        return owner, owner._resources.get(key) or owner._providers.get(key)
+
+    def _find_cycle(self, start: str) -> List[str] | None:
+        stack = [(self, start, [start])]
+        while stack:
+            scope, name, path = stack.pop()
+            owner, provider = scope._provider(name)
+            if provider is None:
+                continue
+            for dependency in map(owner._key, provider.depends_on):
+                if dependency == start and owner is self:
+                    return path + [dependency]
+                if dependency not in path:
+                    stack.append((owner, dependency, path + [dependency]))
+        return None
+
     def get_variable(self, name: str) -> Variable | None:
         name = name.upper()
-        if name not in self._vars:
+        owner = self._owner(name)
+        if owner is None:
+            return None
+        if name not in owner._vars and name in owner._providers:
+            owner._compute(name)
+        return owner._vars.get(name)
+
+    def get_resource(self, name: str) -> Any:
+        """
+        :return: Value of the resource, computed on the first access. None if it is unknown or failed.
+        """
+        owner = self._owner(name)
+        if owner is None or name not in owner._resources:
             return None
-        return self._vars[name]
+        owner._compute(name)
+        return owner._resource_values.get(name)
+
+    def _dependency(self, name: str) -> Any:
+        if self._is_resource(name):
+            value = self.get_resource(name)
+        else:
+            value = self.get_variable(name)
+        if value is None:
+            raise LookupError(f"dependency '{name}' is not available")
+        return value
+
+    def _compute(self, name: str) -> None:
+        """
+        Runs the provider of name owned by this scope unless it already ran.
+        Concurrent callers wait for the first one.
+        """
+        if name in self._computed:
+            return
+        with self._lock:
+            lock = self._key_locks.setdefault(name, threading.Lock())
+        with lock:
+            if name in self._computed:
+                return
+            is_resource = name in self._resources
+            provider = self._resources[name] if is_resource else self._providers[name]
+            try:
+                # Dependencies are computed before the span starts, so it measures only this provider
+                dependencies = [self._dependency(dependency) for dependency in provider.depends_on]
+                with span(f"provide {name}", "variables"):
+                    value = provider.factory(*dependencies)
+            except Exception as e:
+                logger.error(f"Cannot provide {'resource' if is_resource else 'variable'} '{name}': {e}")
+                value = None
+            if is_resource:
+                self._resource_values[name] = value
+            elif value is not None:
+                self._vars[name] = value
+            self._computed.add(name)
+
+    def resolve(self, names: Iterable[str] | None = None) -> Self:
+        """
+        Computes providers of the given variables and everything they depend on.
+        Providers whose dependencies are ready run concurrently.
+
+        :param names: Variables to resolve, e.g. Layout.get_vars(). All visible providers when None.
+        """
+        if names is None:
+            names = {name for scope in self._scopes() for name in scope._providers}
+
+        # Dependency closure of the requested names, keyed by the owning scope and the normalized name
+        pending: Dict[Tuple[int, str], Tuple[VariableMap, Provider]] = {}
+        stack: List[Tuple[VariableMap, str]] = [(self, name) for name in names]
+        while stack:
+            scope, name = stack.pop()
+            key = scope._key(name)
+            owner, provider = scope._provider(key)
+            if provider is None or (id(owner), key) in pending or key in owner._computed:
+                continue
+            pending[(id(owner), key)] = (owner, provider)
+            stack.extend((owner, dependency) for dependency in provider.depends_on)
+
+        def blocked(owner: VariableMap, provider: Provider) -> bool:
+            for dependency in provider.depends_on:
+                key = owner._key(dependency)
+                dependency_owner = owner._owner(key)
+                if dependency_owner is not None and (id(dependency_owner), key) in pending:
+                    return True
+            return False
+
+        executor: ThreadPoolExecutor | None = None
+        try:
+            while pending:
+                # Providers whose dependencies are all computed
+                ready = [entry for entry, (owner, provider) in pending.items() if not blocked(owner, provider)]
+                if not ready:
+                    raise ValueError(f"Circular dependency between {', '.join(key for _, key in pending)}")
+                tasks = [(pending.pop(entry)[0], entry[1]) for entry in ready]
+                if len(tasks) == 1 or self.max_workers <= 1:
+                    for owner, key in tasks:
+                        owner._compute(key)
+                    continue
+                if executor is None:
+                    executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="hosu-vars")
+                list(executor.map(lambda task: task[0]._compute(task[1]), tasks))
+        finally:
+            if executor is not None:
+                executor.shutdown()
+        return self
 
     def __getitem__(self, name: str) -> Variable | None:
         return self.get_variable(name)
 
+    def names(self) -> Set[str]:
+        """
+        Names of all variables visible from this scope.
+        """
+        return {name for scope in self._scopes() for name in scope._vars.keys() | scope._providers.keys()}
+
     def __len__(self) -> int:
-        return len(self._vars)
+        return len(self.names())
 
     def has(self, name: str) -> bool:
         name = name.upper()
-        return name in self._vars
+        return any(name in scope._vars or name in scope._providers for scope in self._scopes())
 
     def get_text(self, name: str) -> str:
         name = name.upper()
-        if name not in self._vars:
+        variable = self.get_variable(name)
+        if variable is None:
             logger.warning(f"Variable '{name}' not found in VariableMap")
             return f"{{{name}}}"
-        return self._vars[name].get_text()
+        return variable.get_text()
 
     def __repr__(self) -> str:
-        return f"VariableMap({self._vars})"
+        parent = f", parent={self.parent!r}" if self.parent is not None else ""
+        return f"VariableMap({self._vars}, providers={list(self._providers)}, resources={list(self._resources)}{parent})"
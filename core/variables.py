@@ -1,7 +1,10 @@
+import hashlib
 from abc import ABC, abstractmethod
 from enum import Enum, auto
 from typing import Any
 
+import numpy as np
+
 from core.logger import get_logger
 
 logger = get_logger(__name__)
@@ -12,6 +15,7 @@ class VariableType(Enum):
     TEXT = auto()
     NUMBER = auto()
     IMAGE_URL = auto()
+    FRAMES = auto()
 
 
 # TODO: add Generic Variable[T]
@@ -30,6 +34,12 @@ class Variable(ABC):
     def get_text(self) -> str:
         pass
 
+    def fingerprint(self) -> str:
+        """
+        Deterministic description of the value, used to key cached renders.
+        """
+        return f"{self.variable_type.name}:{self.get_text()}"
+
     # TODO: __eq__ and __hash__ methods
 
 
@@ -77,3 +87,35 @@ class ImageURLVariable(Variable):
 
     def __repr__(self) -> str:
         return f"ImageURLVariable(url=\"{self.url}\")"
+
+
+class FramesVariable(Variable):
+    """
+    Replay frames (e.g. osu.replay_frames.ReplayFrames) with x and y cursor position arrays.
+    """
+
+    def __init__(self, frames: Any):
+        super().__init__(VariableType.FRAMES)
+        self.frames = frames
+        self._fingerprint: str | None = None
+
+    def get_value(self) -> Any:
+        return self.frames
+
+    def get_text(self) -> str:
+        return f"{len(self.frames)} frames"
+
+    def fingerprint(self) -> str:
+        # Hash of the frame arrays, computed once
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for name in ("time", "x", "y", "keys"):
+                values = getattr(self.frames, name, None)
+                if values is not None:
+                    digest.update(name.encode("ascii"))
+                    digest.update(np.ascontiguousarray(values).tobytes())
+            self._fingerprint = f"{self.variable_type.name}:{digest.hexdigest()}"
+        return self._fingerprint
+
+    def __repr__(self) -> str:
+        return f"FramesVariable({len(self.frames)} frames)"
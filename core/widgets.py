@@ -1,6 +1,8 @@
 import logging
-from typing import Self, Union, Tuple
+from typing import Self, Union, Tuple, Set, Sequence
 
+from core.display_list import DisplayList, font_size_to_px
+from core.heatmap import cursor_heatmap, DEFAULT_STOPS, ColorStop
 from core.layout import Widget
 from core.namespaced_key import NamespacedKey
 from core.registry.widget_registry import RegisterWidget
@@ -11,6 +13,10 @@ from core.utils import parse_color
 logger = logging.getLogger(__name__)
 
 
+def _to_rgba(color) -> RGBA:
+    return int(color[0]), int(color[1]), int(color[2]), int(color[3])
+
+
 @RegisterWidget
 class WidgetText(Widget):
     KEY = NamespacedKey("HoSu", "widget_text")
@@ -26,11 +32,11 @@ class WidgetText(Widget):
         self.color: RGBA = (255, 255, 255, 255)
         self.drop_shadow: bool = False
 
-        self._template = TextTemplate(template)
+        self._template = TextTemplate.of(template)
 
     def set_text(self, text: str) -> Self:
         self.content = text
-        self._template = TextTemplate(text)
+        self._template = TextTemplate.of(text)
         return self
 
     def set_x(self, x: float) -> Self:
@@ -58,13 +64,23 @@ class WidgetText(Widget):
         self.drop_shadow = True
         return self
 
-    def draw(self, renderer, variable_map):
+    def get_vars(self) -> Set[str]:
+        return set(self._template.get_vars())
+
+    def compile(self, display_list: DisplayList) -> None:
+        # Text without variables is resolved once at compile time
+        text = self._template if self._template.get_vars() else self._template.resolve_dict({})
+        display_list.add_text(self.x * display_list.width, self.y * display_list.height,
+                              font_size_to_px(display_list.width, self.font_size), text,
+                              _to_rgba(self.color), self.alignment, self.drop_shadow)
+
+    def draw(self, renderer, ctx, variable_map):
         # Resolve the variables before rendering
         text = self._template.resolve(variable_map)
 
         # Render the text
         c = (int(self.color[0]), int(self.color[1]), int(self.color[2]), int(self.color[3]))
-        renderer.draw_text((self.x, self.y), text, color=c, align=self.alignment, font_size=self.font_size, drop_shadow=self.drop_shadow)
+        renderer.draw_text(ctx, (self.x, self.y), text, color=c, align=self.alignment, font_size=self.font_size, drop_shadow=self.drop_shadow)
 
 
 @RegisterWidget
@@ -109,10 +125,84 @@ class WidgetRect(Widget):
         logger.info(f"Color = {self.color}")
         return self
 
-    def draw(self, renderer, variable_map):
+    def compile(self, display_list: DisplayList) -> None:
+        display_list.add_rect(self.x * display_list.width, self.y * display_list.height,
+                              self.width * display_list.width, self.height * display_list.height,
+                              _to_rgba(self.color))
+
+    def draw(self, renderer, ctx, variable_map):
         c = (int(self.color[0]), int(self.color[1]), int(self.color[2]), int(self.color[3]))
-        renderer.draw_rect((self.x, self.y), (self.width, self.height), color=c, fill=True)
+        renderer.draw_rect(ctx, (self.x, self.y), (self.width, self.height), color=c, fill=True)
 
     def set_opacity(self, param: float) -> Self:
-        self.color[3] = int(255 * param)
+        # Assign a new list, so the change is tracked by the widget revision
+        self.color = [self.color[0], self.color[1], self.color[2], int(255 * param)]
+        return self
+
+
+@RegisterWidget
+class WidgetCursorHeatmap(Widget):
+    """
+    Heatmap of cursor positions of a replay.
+    Reads frames (with x and y arrays) from a FramesVariable.
+    """
+    KEY = NamespacedKey("hosu", "widget_cursor_heatmap")
+
+    def __init__(self, source: str = "FRAMES"):
+        super().__init__()
+        self.source: str = source.upper()
+        self.x: float = 0.0
+        self.y: float = 0.0
+        self.width: float = 1.0
+        self.height: float = 1.0
+        # Size of one histogram bin in canvas pixels
+        self.bin_size: int = 4
+        self.blur: int = 2
+        self.stops: Sequence[ColorStop] = DEFAULT_STOPS
+
+    def set_source(self, source: str) -> Self:
+        self.source = source.upper()
+        return self
+
+    def set_x(self, x: float) -> Self:
+        self.x = x
+        return self
+
+    def set_y(self, y: float) -> Self:
+        self.y = y
+        return self
+
+    def set_width(self, width: float) -> Self:
+        self.width = width
+        return self
+
+    def set_height(self, height: float) -> Self:
+        self.height = height
+        return self
+
+    def set_bin_size(self, bin_size: int) -> Self:
+        self.bin_size = max(1, bin_size)
+        return self
+
+    def set_blur(self, blur: int) -> Self:
+        self.blur = blur
         return self
+
+    def set_stops(self, stops: Sequence[ColorStop]) -> Self:
+        self.stops = stops
+        return self
+
+    def get_vars(self) -> Set[str]:
+        return {self.source}
+
+    def draw(self, renderer, ctx, variable_map):
+        variable = variable_map.get_variable(self.source)
+        if variable is None:
+            logger.warning(f"Missing variable {{{self.source}}}")
+            return
+        frames = variable.get_value()
+
+        # Histogram is computed at bin resolution and scaled up by the renderer in one blit
+        bins = (int(self.width * ctx.width) // self.bin_size, int(self.height * ctx.height) // self.bin_size)
+        image = cursor_heatmap(frames.x, frames.y, bins, blur=self.blur, stops=self.stops)
+        renderer.draw_image(ctx, (self.x, self.y), (self.width, self.height), image)
@@ -1,81 +1,146 @@
+import argparse
 import os
 from pathlib import Path
 
 from PIL import Image
 
+from core import tracing
 from core.config import generate_config, load_config
-from core.layout import Layout, Layer
 from core.logger import get_logger
-from core.renderer import TextAlignment
-from core.utils import dump_json
-from core.variable_map import VariableMap
-from core.variables import TextVariable, NumberVariable, ImageURLVariable
-from core.widgets import WidgetRect, WidgetText
+from core.render_profile import WidgetProfiler
 from osu.api import OsuAPI
-from osu.calculate import calculate_play_performance
-from osu.config import OsuAPIConfig
-from osu.replay import OsuReplay
+from osu.beatmap_store import BeatmapStore
+from osu.config import OsuAPIConfig, BeatmapStoreConfig, LocalBeatmapsConfig
+from osu.local_beatmaps import LocalBeatmapIndex
+from osu.osu_db import OsuDb
+from pipeline.batch import BatchPipeline, find_replays
+from pipeline.config import BatchConfig, TracingConfig, WidgetProfileConfig
+from pipeline.thumbnail import default_layout, play_providers, shared_variables, BeatmapResolver
+from renderer.encoder import ImageEncoder, EncodeOptions
 from renderer.pillow import PillowRenderer
 
 logger = get_logger("Hosu")
 
+CONFIG_PATH = Path("config/config.toml")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description="Hosu - osu! replay thumbnail generator")
+    # TODO: add example/replay.osr
+    parser.add_argument("replay", nargs="?", default="data/replay.osr", help="replay to render")
+    parser.add_argument("--batch", metavar="DIR_OR_GLOB",
+                        help="render every replay in a directory (recursively) or matching a glob")
+    parser.add_argument("--io-workers", type=int, help="threads parsing replays and talking to the API")
+    parser.add_argument("--render-workers", type=int, help="processes rendering thumbnails, 0 means one per CPU")
+    parser.add_argument("--queue-size", type=int, help="prepared replays waiting for a render process")
+    parser.add_argument("--output", help="output file, or output directory in the batch mode")
+    parser.add_argument("--format", help="image format: PNG, JPEG or WEBP")
+    parser.add_argument("--trace", nargs="?", const="", metavar="PATH",
+                        help="time every stage and save a Chrome trace (chrome://tracing, ui.perfetto.dev)")
+    parser.add_argument("--songs", help="osu! Songs folder, its beatmaps are used instead of downloading them")
+    parser.add_argument("--osu-db", help="osu!.db of the osu! client, finds beatmaps in Songs without scanning it")
+    parser.add_argument("--profile-widgets", nargs="?", const="", metavar="PATH",
+                        help="record draw cost of every widget and save it as JSON")
+    return parser.parse_args()
+
+
+def render_single(replay_path: str, api: OsuAPI, beatmap_store: BeatmapStore, output: str | None = None,
+                  format: str | None = None, profiler: WidgetProfiler | None = None,
+                  local_beatmaps: LocalBeatmapIndex | None = None, osu_db: OsuDb | None = None) -> None:
+    vars = shared_variables()
+    # Replay, player, beatmap and pp are computed only if the layout shows them
+    play_providers(replay_path, api, BeatmapResolver(api, beatmap_store, local_beatmaps, osu_db), vars)
+
+    # TODO: for later we should use RendererFactory to create renderers
+    # RendererFactory.create_renderer("pillow")
+    renderer = PillowRenderer()
+    if profiler is not None:
+        renderer.enable_profiling(profiler)
+    img: Image.Image = renderer.render_layout(default_layout(), vars)
+
+    options = EncodeOptions.from_config(format)
+    # A single image has nothing to overlap its encoding with, it is encoded on this thread
+    with ImageEncoder(renderer) as encoder:
+        path = encoder.encode(img, options, output or f"data/benger.{options.extension}")
+    logger.info(f"Saved thumbnail to {path}")
+
+
+def render_batch(args: argparse.Namespace, api: OsuAPI, beatmap_store: BeatmapStore,
+                 profiler: WidgetProfiler | None = None, local_beatmaps: LocalBeatmapIndex | None = None,
+                 osu_db: OsuDb | None = None) -> None:
+    replays = find_replays(args.batch)
+    if not replays:
+        logger.warning(f"No replays found in {args.batch}")
+        return
+
+    pipeline = BatchPipeline(
+        api, beatmap_store,
+        io_workers=args.io_workers if args.io_workers is not None else BatchConfig.io_workers,
+        render_workers=args.render_workers if args.render_workers is not None else BatchConfig.render_workers,
+        queue_size=args.queue_size if args.queue_size is not None else BatchConfig.queue_size,
+        output_dir=args.output or BatchConfig.output_dir,
+        output_format=args.format or BatchConfig.output_format,
+        config_path=str(CONFIG_PATH),
+        profiler=profiler,
+        local_beatmaps=local_beatmaps,
+        osu_db=osu_db,
+    )
+    pipeline.run(replays)
+
+
 def main():
+    args = parse_args()
+
     # Current working directory
     cwd = Path(os.getcwd())
     logger.info(f"Current working directory: {cwd}")
     logger.info("Hello Hosu!")
 
-    config_path = Path("config/config.toml")
-    load_config(config_path)
+    load_config(CONFIG_PATH)
+
+    trace = args.trace is not None or TracingConfig.enabled
+    if trace:
+        tracing.enable(TracingConfig.max_events)
 
-    vars = VariableMap()
-    vars.set("SCORE", NumberVariable(123))
-    vars.set("PLAYER", TextVariable("Moderr"))
-    vars.set("BACKGROUND", ImageURLVariable("https://xd.click/czeslaw.png"))
+    profiler = None
+    if args.profile_widgets is not None or WidgetProfileConfig.enabled:
+        profiler = WidgetProfiler()
 
     api = OsuAPI(OsuAPIConfig.client_id, OsuAPIConfig.client_secret)
+    beatmap_store = BeatmapStore(BeatmapStoreConfig.path, verify=BeatmapStoreConfig.verify)
 
-    # TODO: use replay from run arguments
-    # TODO: add example/replay.osr
-    replay = OsuReplay("data/replay.osr")
-    dump_json(replay.toJSON(), 'data/replay.json')
-    user = api.get_user(replay.user_name)
-    dump_json(user.json, 'data/user.json')
-    beatmap = api.lookup_beatmap(replay.beatmap_hash)
-    dump_json(beatmap.json, 'data/beatmap.json')
-
-    # TODO: cache beatmap files storage/
-    osu_file = api.download_beatmap(beatmap.id)
-    with open("data/beatmap.osu", "w", encoding="utf-8") as f:
-        f.write(osu_file)
-
-    performance = calculate_play_performance("data/beatmap.osu", replay)
-    vars.set("PP", TextVariable(f"{performance.pp:.0f}"))
-    vars.set("STARS", TextVariable(f"{performance.star_rating:.2f}"))
-
-    layout = Layout(1920, 1080, [
-        Layer([
-            # TODO: remove the repetitive set_
-            WidgetRect().set_color("#07090C").set_width(1).set_height(1),
-            WidgetRect().set_color("#0A0F16").set_x(0.5).set_y(0.06).set_width(1).set_height(0.12),
-            WidgetRect().set_color("#0B121A").set_x(0.5).set_y(0.15).set_width(1).set_height(0.10),
-            WidgetRect().set_color("#0C151E").set_x(0.5).set_y(0.23).set_width(1).set_height(0.10),
-            WidgetRect().set_color("#0E1923").set_x(0.5).set_y(0.31).set_width(1).set_height(0.10),
-            WidgetRect().set_color("#101E29").set_x(0.5).set_y(0.39).set_width(1).set_height(0.10),
-            WidgetRect().set_color("#122330").set_x(0.5).set_y(0.47).set_width(1).set_height(0.10),
-            WidgetRect().set_color("#152A3A").set_x(0.5).set_y(0.55).set_width(1).set_height(0.10)
-        ]),
-        Layer([
-            WidgetText().set_x(0.5).set_y(0.5).set_alignment(TextAlignment.CENTER).set_text("Moj pp to {PP}")
-        ])
-    ])
+    local_beatmaps = None
+    songs_path = args.songs or LocalBeatmapsConfig.songs_path
+    if songs_path:
+        local_beatmaps = LocalBeatmapIndex(LocalBeatmapsConfig.index_path, workers=LocalBeatmapsConfig.workers)
+        # An explicitly given folder is always brought up to date
+        if args.songs or LocalBeatmapsConfig.scan_on_start:
+            local_beatmaps.scan(songs_path)
 
-    # TODO: for later we should use RendererFactory to create renderers
-    # RendererFactory.create_renderer("pillow")
-    renderer = PillowRenderer()
-    img: Image.Image = renderer.render_layout(layout, vars)
-    img.show()
-    img.save("data/benger.png")
+    osu_db = None
+    osu_db_path = args.osu_db or LocalBeatmapsConfig.osu_db_path
+    if osu_db_path:
+        osu_db = OsuDb(osu_db_path, songs_path or None)
+
+    try:
+        with api:
+            if args.batch:
+                render_batch(args, api, beatmap_store, profiler, local_beatmaps, osu_db)
+            else:
+                render_single(args.replay, api, beatmap_store, args.output, args.format, profiler, local_beatmaps,
+                              osu_db)
+    finally:
+        if local_beatmaps is not None:
+            local_beatmaps.close()
+        if osu_db is not None:
+            osu_db.close()
+        if profiler is not None:
+            logger.info("Widget profile\n" + profiler.report())
+            profiler.save_json(args.profile_widgets or WidgetProfileConfig.output)
+        if trace:
+            tracer = tracing.get_tracer()
+            logger.info("Trace summary\n" + tracer.report())
+            tracer.export_chrome_trace(args.trace or TracingConfig.output)
 
 
 if __name__ == "__main__":
@@ -1,17 +1,62 @@
 import json
 import os.path
+import threading
 import time
 
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
 from core.logger import get_logger
+from core.tracing import span, traced
+from osu.config import OsuAPIConfig, OsuAPICacheConfig
 from osu.data import User, Beatmap
-from osu.errors import OsuAPIAuthError
+from osu.errors import OsuAPIAuthError, OsuAPIError
+from osu.response_cache import ResponseCache
 from osu.utils import format_token_expiry
 
 logger = get_logger(__name__)
 
 
+# TODO: use pathlib Path
+def load_session_file(path: str) -> dict | None:
+    """
+    Reads a session saved by save_session_file.
+    :return: Session data or None when there is no readable session file.
+    """
+    if not os.path.exists(path):
+        return None  # there is no session
+
+    try:
+        with open(path) as f:
+            session = json.load(f)
+        if "token" not in session:
+            raise ValueError("missing token")
+        return session
+    except Exception as e:
+        logger.warning(f"Recover error: {e}")
+        return None  # encountered error while recovering session
+
+
+def save_session_file(path: str, client_id: str, token: str, expires_at: float) -> None:
+    """
+    Saves session data to file, so other OsuAPI instances and processes can reuse the token.
+    DOES NOT CHECK IS THE SESSION ALIVE!
+    """
+    # TODO: mkdirs if not exists
+
+    data = {
+        "client_id": client_id,
+        "token": token,
+        "expires_at": expires_at,
+    }
+
+    with open(path, 'w') as f:
+        json.dump(data, f, indent=4)
+
+    logger.info("OsuAPI session saved")
+
+
 class OsuAPI:
     """
     OsuAPI is a wrapper around the osu! API.
@@ -21,12 +66,17 @@ class OsuAPI:
     TOKEN_URL = "https://osu.ppy.sh/oauth/token"
     SESSION_PATH = "data/session.json"
     # TODO: add session path using Path from pathlib
+    # Responses worth retrying with backoff
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
 
-    def __init__(self, client_id: str, client_secret: str):
+    def __init__(self, client_id: str, client_secret: str, http: requests.Session | None = None,
+                 cache: ResponseCache | None = None):
         """
         Initializes the API wrapper.
         :param client_id: OAuth2 ID obtained from the osu API website.
         :param client_secret: OAuth2 client secret obtained from the osu API website.
+        :param http: Optional HTTP session, by default a pooled one is created from OsuAPIConfig.
+        :param cache: Optional response cache, by default one is created from OsuAPICacheConfig when enabled.
         """
         if client_id is None or len(client_id) == 0 or client_secret is None or len(client_secret) == 0:
             raise ValueError("client_id and client_secret are required")
@@ -35,10 +85,53 @@ class OsuAPI:
         self.client_secret = client_secret
         self.access_token: str | None = None
         self.token_expires_at: float = -1.0
-        # TODO: add _http session later for connection pooling
+        self.timeout: float = OsuAPIConfig.timeout
+        self._http: requests.Session = http if http is not None else self._create_http()
+        if cache is None and OsuAPICacheConfig.enabled:
+            cache = ResponseCache(OsuAPICacheConfig.path, int(OsuAPICacheConfig.max_size_mb * 1024 * 1024))
+        self.cache: ResponseCache | None = cache
+        # Guards token creation when the API is shared between threads
+        self._auth_lock = threading.Lock()
 
         logger.info("OsuAPI initialized")
 
+    @staticmethod
+    def _create_http() -> requests.Session:
+        """
+        Creates a keep-alive HTTP session with a connection pool
+        which retries with exponential backoff on rate limits and server errors.
+        """
+        retry = Retry(
+            total=OsuAPIConfig.max_retries,
+            backoff_factor=OsuAPIConfig.retry_backoff,
+            status_forcelist=OsuAPI.RETRY_STATUSES,
+            allowed_methods=frozenset({"GET", "POST"}),
+            respect_retry_after_header=True,
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_connections=OsuAPIConfig.pool_size, pool_maxsize=OsuAPIConfig.pool_size,
+                              max_retries=retry)
+        http = requests.Session()
+        http.mount("https://", adapter)
+        http.mount("http://", adapter)
+        return http
+
+    def close(self) -> None:
+        """
+        Closes pooled connections and the response cache.
+        """
+        self._http.close()
+        if self.cache is not None:
+            logger.info(f"OsuAPI response cache: {self.cache.stats()}")
+            self.cache.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    @traced("api.authenticate", "api")
     def authenticate(self) -> None:
         """
         Authenticates with the osu API using the client credentials.
@@ -61,6 +154,7 @@ class OsuAPI:
         self._create_session()
         logger.info(format_token_expiry(self.token_expires_at))
 
+    @traced("api.create_session", "api")
     def _create_session(self):
         logger.info("OsuAPI creating session...")
         data = {
@@ -71,7 +165,7 @@ class OsuAPI:
         }
 
         try:
-            response = requests.request("POST", OsuAPI.TOKEN_URL, data=data, timeout=10)
+            response = self._http.post(OsuAPI.TOKEN_URL, data=data, timeout=self.timeout)
         except requests.RequestException as e:
             raise OsuAPIAuthError(f"Network error during authentication: {e}")
         except ValueError as e:
@@ -96,26 +190,19 @@ class OsuAPI:
         Recovers when there's an active session file `SESSION_PATH`
         :return: True when session is recovered else False
         """
-        # TODO: use pathlib Path
-        if not os.path.exists(OsuAPI.SESSION_PATH):
-            return False  # there is no session
-
-        try:
-            with open(OsuAPI.SESSION_PATH) as f:
-                session = json.load(f)
+        session = load_session_file(OsuAPI.SESSION_PATH)
+        if session is None:
+            return False  # there is no session or it cannot be read
 
-                self.client_id = session.get("client_id", self.client_id)
-                self.access_token = session["token"]
-                self.token_expires_at = session.get("expires_at", -1.0)
+        self.client_id = session.get("client_id", self.client_id)
+        self.access_token = session["token"]
+        self.token_expires_at = session.get("expires_at", -1.0)
 
-                if time.time() >= self.token_expires_at:
-                    logger.info("OsuAPI session expired")
-                    return False  # session is expired
+        if time.time() >= self.token_expires_at:
+            logger.info("OsuAPI session expired")
+            return False  # session is expired
 
-                return True
-        except Exception as e:
-            logger.warning(f"Recover error: {e}")
-            return False  # encountered error while recovering session
+        return True
 
     def is_session_alive(self) -> bool:
         """
@@ -129,52 +216,116 @@ class OsuAPI:
         """
         Refreshes token if expired
         """
-        if not self.is_session_alive():
-            self.authenticate()
+        if self.is_session_alive():
+            return
+        with self._auth_lock:
+            # Another thread could have authenticated while we waited
+            if not self.is_session_alive():
+                self.authenticate()
+
+    def _reauthenticate(self, rejected_token: str | None) -> None:
+        """
+        Creates a new session after the server rejected the token.
+        """
+        with self._auth_lock:
+            # Another thread already replaced the rejected token
+            if self.access_token != rejected_token:
+                return
+            logger.warning("OsuAPI token rejected, authenticating again")
+            self.access_token = None
+            self.token_expires_at = -1.0
+            self._create_session()
+
+    def _request(self, url: str, headers: dict[str, str] | None = None) -> requests.Response:
+        """
+        Sends authorized GET request through the pooled session.
+        Can raise OsuAPIError on network errors.
+        """
+        headers = {
+            **(headers or {}),
+            "Authorization": f"Bearer {self.access_token}"
+        }
+        try:
+            with span("api.request", "api", url=url):
+                return self._http.get(url, headers=headers, timeout=self.timeout)
+        except requests.RequestException as e:
+            raise OsuAPIError(f"Network error during GET {url}: {e}")
 
     # god written deep human intelligence error
-    def _get(self, endpoint: str, sure=False):
+    def _get(self, endpoint: str, sure=False, ttl: float | None = None):
+        """
+        :param ttl: When given, the response is served from and stored into the cache
+                    and considered fresh for ttl seconds.
+        """
         # TODO: just strip leading slash from endpoint
         if endpoint.startswith('/') and not sure:
             raise RuntimeError("Are you sure?")
 
+        stale = None
+        if self.cache is not None and ttl is not None:
+            body, stale = self.cache.lookup(endpoint, ttl)
+            if body is not None:
+                return body
+
         self._ensure_token()
         # REQUEST
         url = f"{OsuAPI.BASE_URL}/{endpoint}"
-        payload = {}
-        headers = {
-            "Authorization": f"Bearer {self.access_token}"
-        }
 
-        # TODO: add timeout, error handling, if code not authenticated create session again
-        # TODO: use requests.Session for connection pooling
-        response = requests.request("GET", url, headers=headers, data=payload)
+        # Stale entries with validators are revalidated instead of downloaded again
+        headers = {}
+        if stale is not None:
+            if stale.etag is not None:
+                headers["If-None-Match"] = stale.etag
+            if stale.last_modified is not None:
+                headers["If-Modified-Since"] = stale.last_modified
+
+        token = self.access_token
+        response = self._request(url, headers)
+        if response.status_code == 401:
+            # Token was revoked or expired earlier than expected
+            self._reauthenticate(token)
+            response = self._request(url, headers)
+        if response.status_code == 304 and stale is not None:
+            self.cache.revalidated(endpoint)
+            return stale.body
         if response.status_code != 200:
             raise RuntimeError(f"OsuAPI GET failed: {response.text}")
-        return response.json()
 
+        body = response.json()
+        if self.cache is not None and ttl is not None:
+            self.cache.put(endpoint, body, response.headers.get("ETag"), response.headers.get("Last-Modified"))
+        return body
+
+    @traced("api.get_user", "api")
     def get_user(self, user_name: str) -> User:
-        json_data = self._get(f"users/@{user_name}")
+        json_data = self._get(f"users/@{user_name}", ttl=OsuAPICacheConfig.user_ttl)
         return User(json_data)
 
+    @traced("api.get_user_bests", "api")
     def get_user_bests(self, user_id: str):
-        return self._get(f"users/{user_id}/scores/best")
+        return self._get(f"users/{user_id}/scores/best", ttl=OsuAPICacheConfig.user_bests_ttl)
 
+    @traced("api.lookup_beatmap", "api")
     def lookup_beatmap(self, checksum: str) -> Beatmap:
-        json_data = self._get(f"beatmaps/lookup?checksum={checksum}")
+        json_data = self._get(f"beatmaps/lookup?checksum={checksum}", ttl=OsuAPICacheConfig.beatmap_lookup_ttl)
         return Beatmap(json_data)
 
     def download_beatmap(self, beatmap_id: int) -> str:
-        url = f"{OsuAPI.OSU_URL}/osu/{beatmap_id}"
-        payload = {}
-        headers = {
-            "Authorization": f"Bearer {self.access_token}"
-        }
+        return self._download_beatmap(beatmap_id).text
 
-        response = requests.request("GET", url, headers=headers, data=payload)
+    def download_beatmap_bytes(self, beatmap_id: int) -> bytes:
+        """
+        Downloads the .osu file without decoding it, so its MD5 matches the beatmap checksum.
+        """
+        return self._download_beatmap(beatmap_id).content
+
+    @traced("api.download_beatmap", "api")
+    def _download_beatmap(self, beatmap_id: int) -> requests.Response:
+        url = f"{OsuAPI.OSU_URL}/osu/{beatmap_id}"
+        response = self._request(url)
         if response.status_code != 200:
             raise RuntimeError(f"OsuAPI GET failed: {response.text}")
-        return response.text
+        return response
 
     # TODO: use pathlib Path
     def _save_session(self, filename: str) -> None:
@@ -182,15 +333,4 @@ class OsuAPI:
         Saves current session data to file.
         DOES NOT CHECK IS THE SESSION ALIVE!
         """
-        # TODO: mkdirs if not exists
-
-        data = {
-            "client_id": self.client_id,
-            "token": self.access_token,
-            "expires_at": self.token_expires_at,
-        }
-
-        with open(filename, 'w') as f:
-            json.dump(data, f, indent=4)
-
-        logger.info("OsuAPI session saved")
+        save_session_file(filename, self.client_id, self.access_token, self.token_expires_at)
@@ -0,0 +1,203 @@
+import asyncio
+import time
+from typing import Any
+
+import aiohttp
+
+from core.logger import get_logger
+from core.tracing import span, traced
+from osu.api import OsuAPI, load_session_file, save_session_file
+from osu.config import OsuAPIConfig
+from osu.data import User, Beatmap
+from osu.errors import OsuAPIAuthError, OsuAPIError
+from osu.utils import format_token_expiry
+
+logger = get_logger(__name__)
+
+
+class AsyncOsuAPI:
+    """
+    Asyncio version of OsuAPI with the same surface.
+
+    All coroutines share one token and one connection pool,
+    and at most `max_concurrency` requests are in flight at once.
+    Use it as an async context manager to close the connections.
+    """
+
+    def __init__(self, client_id: str, client_secret: str, max_concurrency: int | None = None,
+                 base_url: str | None = None, token_url: str | None = None, osu_url: str | None = None,
+                 session_path: str | None = None):
+        """
+        :param client_id: OAuth2 ID obtained from the osu API website.
+        :param client_secret: OAuth2 client secret obtained from the osu API website.
+        :param max_concurrency: Limit of concurrent requests, defaults to OsuAPIConfig.max_concurrency.
+        :param base_url: API root, defaults to OsuAPIConfig.api_url.
+        :param token_url: OAuth2 token endpoint, defaults to OsuAPIConfig.token_url.
+        :param osu_url: Website root serving .osu downloads, defaults to OsuAPIConfig.osu_url.
+        :param session_path: Token file shared with OsuAPI, defaults to OsuAPI.SESSION_PATH.
+        """
+        if client_id is None or len(client_id) == 0 or client_secret is None or len(client_secret) == 0:
+            raise ValueError("client_id and client_secret are required")
+
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token: str | None = None
+        self.token_expires_at: float = -1.0
+        self.timeout: float = OsuAPIConfig.timeout
+        self.base_url = (base_url or OsuAPIConfig.api_url).rstrip("/")
+        self.token_url = token_url or OsuAPIConfig.token_url
+        self.osu_url = (osu_url or OsuAPIConfig.osu_url).rstrip("/")
+        self.session_path = session_path or OsuAPI.SESSION_PATH
+
+        self._semaphore = asyncio.Semaphore(max_concurrency or OsuAPIConfig.max_concurrency)
+        # Only one coroutine creates the token, the others wait for it
+        self._auth_lock = asyncio.Lock()
+        self._http: aiohttp.ClientSession | None = None
+
+        logger.info("AsyncOsuAPI initialized")
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_val, exc_tb):
+        await self.close()
+
+    async def close(self) -> None:
+        if self._http is not None:
+            await self._http.close()
+            self._http = None
+
+    def _get_http(self) -> aiohttp.ClientSession:
+        # Created lazily, ClientSession has to be created inside a running event loop
+        if self._http is None:
+            connector = aiohttp.TCPConnector(limit=OsuAPIConfig.pool_size)
+            self._http = aiohttp.ClientSession(connector=connector,
+                                               timeout=aiohttp.ClientTimeout(total=self.timeout))
+        return self._http
+
+    def is_session_alive(self) -> bool:
+        return self.access_token is not None and time.time() < self.token_expires_at
+
+    @traced("api.authenticate", "api")
+    async def authenticate(self) -> None:
+        """
+        Recovers the token saved by any OsuAPI instance or requests a new one.
+        Can raise OsuAPIAuthError if an error occurs.
+        """
+        async with self._auth_lock:
+            if self.is_session_alive():
+                return
+            if self._recover_session():
+                logger.info("Recovered AsyncOsuAPI session")
+            else:
+                await self._create_session()
+            logger.info(format_token_expiry(self.token_expires_at))
+
+    def _recover_session(self) -> bool:
+        session = load_session_file(self.session_path)
+        if session is None:
+            return False
+        self.client_id = session.get("client_id", self.client_id)
+        self.access_token = session["token"]
+        self.token_expires_at = session.get("expires_at", -1.0)
+        return self.is_session_alive()
+
+    @traced("api.create_session", "api")
+    async def _create_session(self) -> None:
+        logger.info("AsyncOsuAPI creating session...")
+        data = {
+            "client_id": self.client_id,
+            "client_secret": self.client_secret,
+            "grant_type": "client_credentials",
+            "scope": "public",
+        }
+
+        try:
+            async with self._get_http().post(self.token_url, data=data) as response:
+                if response.status != 200:
+                    raise OsuAPIAuthError(f"OsuAPI authentication failed: {await response.text()}")
+                session = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise OsuAPIAuthError(f"Network error during authentication: {e}")
+        except ValueError as e:
+            raise OsuAPIAuthError(f"Invalid JSON response during authentication: {e}")
+
+        self.access_token = session.get("access_token")
+        self.token_expires_at = time.time() + session.get("expires_in", 0)
+        if self.access_token is None or not self.is_session_alive():
+            raise OsuAPIAuthError("OsuAPI authentication failed: invalid token data")
+
+        save_session_file(self.session_path, self.client_id, self.access_token, self.token_expires_at)
+        logger.info("AsyncOsuAPI authenticated")
+
+    async def _reauthenticate(self, rejected_token: str | None) -> None:
+        async with self._auth_lock:
+            if self.access_token != rejected_token:
+                return  # another coroutine already replaced the token
+            logger.warning("AsyncOsuAPI token rejected, authenticating again")
+            self.access_token = None
+            self.token_expires_at = -1.0
+            await self._create_session()
+
+    async def _request(self, url: str, as_json: bool) -> Any:
+        """
+        Sends authorized GET request.
+        Retries with backoff on rate limits and server errors, authenticates again once on 401.
+        """
+        if not self.is_session_alive():
+            await self.authenticate()
+
+        reauthenticated = False
+        attempt = 0
+        while True:
+            token = self.access_token
+            headers = {"Authorization": f"Bearer {token}"}
+            try:
+                async with self._semaphore:
+                    with span("api.request", "api", url=url):
+                        async with self._get_http().get(url, headers=headers) as response:
+                            status = response.status
+                            retry_after = response.headers.get("Retry-After")
+                            if status == 200:
+                                return await response.json(content_type=None) if as_json else await response.text()
+                            body = await response.text()
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                raise OsuAPIError(f"Network error during GET {url}: {e}")
+
+            if status == 401 and not reauthenticated:
+                reauthenticated = True
+                await self._reauthenticate(token)
+                continue
+
+            if status in OsuAPI.RETRY_STATUSES and attempt < OsuAPIConfig.max_retries:
+                delay = OsuAPIConfig.retry_backoff * (2 ** attempt)
+                if retry_after is not None and retry_after.isdigit():
+                    delay = max(delay, float(retry_after))
+                attempt += 1
+                logger.warning(f"OsuAPI GET {url} returned {status}, retrying in {delay:.2f}s")
+                await asyncio.sleep(delay)
+                continue
+
+            raise RuntimeError(f"OsuAPI GET failed: {body}")
+
+    async def _get(self, endpoint: str) -> Any:
+        endpoint = endpoint.lstrip('/')
+        return await self._request(f"{self.base_url}/{endpoint}", as_json=True)
+
+    @traced("api.get_user", "api")
+    async def get_user(self, user_name: str) -> User:
+        json_data = await self._get(f"users/@{user_name}")
+        return User(json_data)
+
+    @traced("api.get_user_bests", "api")
+    async def get_user_bests(self, user_id: str):
+        return await self._get(f"users/{user_id}/scores/best")
+
+    @traced("api.lookup_beatmap", "api")
+    async def lookup_beatmap(self, checksum: str) -> Beatmap:
+        json_data = await self._get(f"beatmaps/lookup?checksum={checksum}")
+        return Beatmap(json_data)
+
+    @traced("api.download_beatmap", "api")
+    async def download_beatmap(self, beatmap_id: int) -> str:
+        return await self._request(f"{self.osu_url}/osu/{beatmap_id}", as_json=False)
@@ -0,0 +1,96 @@
+import hashlib
+import os
+import tempfile
+from pathlib import Path
+
+from core.logger import get_logger
+from osu.errors import BeatmapHashMismatchError
+
+logger = get_logger(__name__)
+
+
+def md5_hex(data: bytes) -> str:
+    return hashlib.md5(data).hexdigest()
+
+
+def md5_file(path: Path) -> str:
+    digest = hashlib.md5()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BeatmapStore:
+    """
+    Content-addressed store of .osu files.
+
+    Every file is kept under its MD5 hash (the same hash osu! writes into replays)
+    and sharded by the first two hex characters: <root>/ab/abcdef....osu
+    Files are written atomically, so concurrent jobs never see a partial file.
+    """
+
+    def __init__(self, root: str | Path, verify: bool = True):
+        """
+        :param root: Directory of the store, created when missing.
+        :param verify: Whether to check the hash of a file before serving it.
+        """
+        self.root = Path(root)
+        self.verify = verify
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def path_for(self, md5: str) -> Path:
+        md5 = md5.lower()
+        return self.root / md5[:2] / f"{md5}.osu"
+
+    def has(self, md5: str) -> bool:
+        return self.path_for(md5).exists()
+
+    def get(self, md5: str) -> Path | None:
+        """
+        :param md5: MD5 hash of the beatmap, e.g. OsuReplay.beatmap_hash.
+        :return: Path to the stored .osu file or None when it is not stored.
+        """
+        path = self.path_for(md5)
+        if not path.exists():
+            return None
+
+        if self.verify and md5_file(path) != md5.lower():
+            logger.warning(f"Stored beatmap {path} does not match its hash, removing it")
+            path.unlink(missing_ok=True)
+            return None
+
+        return path
+
+    def put(self, content: bytes, expected_md5: str | None = None) -> Path:
+        """
+        Stores .osu file content under its MD5 hash.
+        :param content: Raw bytes of the .osu file.
+        :param expected_md5: Hash the content must have. Mismatching content is rejected and not stored,
+                             a beatmap of another version would give wrong pp for the replay.
+        :return: Path to the stored file.
+        :raises BeatmapHashMismatchError: When the content does not have expected_md5.
+        """
+        md5 = md5_hex(content)
+        if expected_md5 is not None and md5 != expected_md5.lower():
+            # Usually the beatmap was updated after the replay was played
+            raise BeatmapHashMismatchError(expected_md5, md5)
+
+        path = self.path_for(md5)
+        if path.exists():
+            return path
+
+        path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{md5}.", suffix=".tmp")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(content)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            Path(tmp_path).unlink(missing_ok=True)
+            raise
+
+        logger.info(f"Stored beatmap {md5}")
+        return path
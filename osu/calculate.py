@@ -1,15 +1,62 @@
+import threading
 from dataclasses import dataclass
+from typing import Tuple
 
 import rosu_pp_py as rosu
 
+from core.cache import LRUCache, CacheStats
+from core.tracing import span, traced
+from osu.config import CalculateConfig
 from osu.replay import OsuReplay
 
+# Parsed beatmaps keyed by beatmap MD5
+_beatmaps: LRUCache[str, rosu.Beatmap] | None = None
+# Difficulty attributes keyed by (beatmap MD5, mods bitmask)
+_difficulties: LRUCache[Tuple[str, int], rosu.DifficultyAttributes] | None = None
+_caches_lock = threading.Lock()
+
+
+def _get_caches() -> Tuple[LRUCache[str, rosu.Beatmap], LRUCache[Tuple[str, int], rosu.DifficultyAttributes]]:
+    """
+    Returns the process-wide calculation caches, created on first use so their sizes come from the loaded config.
+    """
+    global _beatmaps, _difficulties
+    with _caches_lock:
+        if _beatmaps is None:
+            _beatmaps = LRUCache(CalculateConfig.beatmap_cache_size)
+            _difficulties = LRUCache(CalculateConfig.difficulty_cache_size)
+        return _beatmaps, _difficulties
+
+
 @dataclass
 class Performance:
     pp: float
     star_rating: float
 
-def calculate_play_performance(beatmap_path: str, replay: OsuReplay) -> Performance:
+
+def load_beatmap(beatmap_path: str, beatmap_hash: str) -> rosu.Beatmap:
+    """
+    Returns parsed beatmap, the file is parsed only once per hash.
+    """
+    def parse() -> rosu.Beatmap:
+        with span("calculate.parse_beatmap", "calculate"):
+            return rosu.Beatmap(path=beatmap_path)
+
+    return _get_caches()[0].get_or_create(beatmap_hash, parse)
+
+
+@traced("calculate", "calculate")
+def calculate_play_performance(beatmap_path: str, replay: OsuReplay, beatmap_hash: str | None = None) -> Performance:
+    """
+    Calculates pp and star rating of the replay.
+    Difficulty attributes are reused for every play on the same beatmap with the same mods.
+
+    :param beatmap_path: Path to the .osu file of the beatmap.
+    :param replay: The play.
+    :param beatmap_hash: MD5 of the beatmap file, defaults to replay.beatmap_hash.
+    """
+    beatmap_hash = beatmap_hash or replay.beatmap_hash
+
     perf = rosu.Performance(
         accuracy=replay.accuracy * 100,
         lazer=False,
@@ -19,8 +66,29 @@ def calculate_play_performance(beatmap_path: str, replay: OsuReplay) -> Performa
     )
     perf.set_mods(replay.mods)
 
-    map = rosu.Beatmap(path=beatmap_path)
-    max_attrs = perf.calculate(perf.calculate(map))
+    # Difficulty created from the performance shares its settings (mods, lazer)
+    def calculate_difficulty() -> rosu.DifficultyAttributes:
+        beatmap = load_beatmap(beatmap_path, beatmap_hash)
+        with span("calculate.difficulty", "calculate"):
+            return perf.difficulty().calculate(beatmap)
+
+    difficulty = _get_caches()[1].get_or_create((beatmap_hash, replay.mods), calculate_difficulty)
+    with span("calculate.performance", "calculate"):
+        max_attrs = perf.calculate(difficulty)
 
     p = Performance(pp=max_attrs.pp, star_rating=max_attrs.difficulty.stars)
     return p
+
+
+def calculation_cache_stats() -> Tuple[CacheStats, CacheStats]:
+    """
+    :return: Stats of the (beatmap, difficulty) caches.
+    """
+    beatmaps, difficulties = _get_caches()
+    return beatmaps.stats(), difficulties.stats()
+
+
+def clear_calculation_caches() -> None:
+    beatmaps, difficulties = _get_caches()
+    beatmaps.clear()
+    difficulties.clear()
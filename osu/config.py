@@ -7,7 +7,59 @@ class OsuAPIConfig(BaseConfigSection):
     client_secret: str = ""
     api_url: str = "https://osu.ppy.sh/api/v2"
     token_url: str = "https://osu.ppy.sh/oauth/token"
+    # Beatmap downloads (/osu/{id}) are served outside the API
+    osu_url: str = "https://osu.ppy.sh"
     timeout: float = 10.0
+    pool_size: int = 10
+    max_concurrency: int = 8
+    max_retries: int = 3
+    retry_backoff: float = 0.5
     save_session: bool = True
     session_path: str = "data/session.json"
 
+
+@ConfigSection(name="osu_api_cache")
+class OsuAPICacheConfig(BaseConfigSection):
+    enabled: bool = True
+    path: str = "data/api_cache.sqlite"
+    max_size_mb: float = 64.0
+    # Time to live of cached responses in seconds
+    user_ttl: float = 600.0
+    user_bests_ttl: float = 600.0
+    # Beatmap looked up by checksum never changes
+    beatmap_lookup_ttl: float = 365 * 24 * 3600.0
+
+
+@ConfigSection(name="beatmap_store")
+class BeatmapStoreConfig(BaseConfigSection):
+    path: str = "storage/beatmaps"
+    # Check the hash of a stored file before using it
+    verify: bool = True
+
+
+@ConfigSection(name="calculate")
+class CalculateConfig(BaseConfigSection):
+    # Parsed beatmaps kept in memory
+    beatmap_cache_size: int = 64
+    # Difficulty attributes kept in memory, one per beatmap and mods combination
+    difficulty_cache_size: int = 256
+
+
+@ConfigSection(name="replay_index")
+class ReplayIndexConfig(BaseConfigSection):
+    path: str = "data/replay_index.sqlite"
+    # Threads parsing replay headers during a scan
+    workers: int = 8
+
+
+@ConfigSection(name="local_beatmaps")
+class LocalBeatmapsConfig(BaseConfigSection):
+    # osu! Songs folder, beatmaps found there are used instead of downloading them
+    songs_path: str = ""
+    index_path: str = "data/local_beatmaps.sqlite"
+    # Threads hashing beatmaps during a scan
+    workers: int = 8
+    # Index new and modified beatmaps on every start
+    scan_on_start: bool = True
+    # osu!.db of the osu! client, its beatmaps are found without scanning Songs (Songs next to it unless songs_path is set)
+    osu_db_path: str = ""
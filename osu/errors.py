@@ -7,3 +7,13 @@ class OsuAPIError(HosuError):
 
 class OsuAPIAuthError(OsuAPIError):
     pass
+
+
+class BeatmapHashMismatchError(HosuError):
+    """ Raised when downloaded beatmap content does not have the hash it was requested by """
+
+    def __init__(self, expected_md5: str, actual_md5: str):
+        self.expected_md5 = expected_md5
+        self.actual_md5 = actual_md5
+        super().__init__(f"Beatmap content hash {actual_md5} does not match expected {expected_md5}, "
+                         f"the beatmap was probably updated after the replay was played.")
@@ -0,0 +1,31 @@
+import os
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Tuple
+
+# Condition selecting the paths under a root, parameters are given by prefix_params().
+# LIKE ignores ASCII case, it would also match sibling folders differing only in case.
+PREFIX_CONDITION = "substr(path, 1, ?) = ?"
+
+
+@dataclass(frozen=True)
+class ScanResult:
+    """
+    Files of one scan of a persistent file index.
+    """
+    indexed: int
+    unchanged: int
+    removed: int
+    failed: int
+
+    def __str__(self) -> str:
+        return f"indexed={self.indexed} unchanged={self.unchanged} removed={self.removed} failed={self.failed}"
+
+
+def prefix_params(root: Path) -> Tuple[int, str]:
+    """
+    :param root: Resolved root of a scan.
+    :return: Parameters of PREFIX_CONDITION.
+    """
+    prefix = str(root) + os.sep
+    return len(prefix), prefix
@@ -0,0 +1,263 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import Iterator, List, Tuple
+
+from core.logger import get_logger
+from osu.file_index import PREFIX_CONDITION, ScanResult, prefix_params
+
+logger = get_logger(__name__)
+
+# Metadata fields read from .osu files, keyed by (section, key)
+_METADATA = {
+    ("General", "Mode"): "mode",
+    ("Metadata", "Title"): "title",
+    ("Metadata", "Artist"): "artist",
+    ("Metadata", "Creator"): "creator",
+    ("Metadata", "Version"): "version",
+    ("Metadata", "BeatmapID"): "beatmap_id",
+    ("Metadata", "BeatmapSetID"): "beatmapset_id",
+}
+_INTEGER_FIELDS = {"mode", "beatmap_id", "beatmapset_id"}
+# Sections after the metadata, parsing stops at the first of them
+_END_SECTIONS = {"Events", "TimingPoints", "HitObjects"}
+
+
+@dataclass
+class LocalBeatmap:
+    """
+    Indexed .osu file of a local Songs folder.
+    """
+    md5: str
+    path: str
+    mode: int
+    title: str
+    artist: str
+    creator: str
+    version: str
+    # 0 for unsubmitted beatmaps
+    beatmap_id: int
+    beatmapset_id: int
+
+
+_COLUMNS = [f.name for f in fields(LocalBeatmap)]
+
+
+def read_local_beatmap(path: str | Path) -> LocalBeatmap:
+    """
+    Hashes the .osu file and reads its metadata, the file is read only once.
+    """
+    with open(path, "rb") as f:
+        content = f.read()
+
+    values = {"mode": 0, "title": "", "artist": "", "creator": "", "version": "", "beatmap_id": 0,
+              "beatmapset_id": 0}
+    section = None
+    for line in content.decode("utf-8", errors="replace").lstrip("\ufeff").splitlines():
+        line = line.strip()
+        if line.startswith("[") and line.endswith("]"):
+            section = line[1:-1]
+            if section in _END_SECTIONS:
+                break
+            continue
+        key, separator, value = line.partition(":")
+        name = _METADATA.get((section, key.strip())) if separator else None
+        if name is None:
+            continue
+        value = value.strip()
+        if name in _INTEGER_FIELDS:
+            value = int(value) if value.lstrip("-").isdigit() else 0
+        values[name] = value
+
+    return LocalBeatmap(hashlib.md5(content).hexdigest(), str(path), **values)
+
+
+class LocalBeatmapIndex:
+    """
+    Persistent SQLite index of .osu files in an osu! Songs folder, keyed by their MD5
+    (the hash osu! writes into replays), so beatmaps of replays are found without the API.
+
+    Scans hash files in parallel and only the ones whose mtime or size changed since the previous scan.
+    """
+
+    def __init__(self, path: str, workers: int = 8):
+        """
+        :param path: Path to the SQLite database file.
+        :param workers: Number of threads hashing beatmaps during a scan.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS beatmaps (
+                md5 TEXT NOT NULL,
+                path TEXT PRIMARY KEY,
+                mode INTEGER NOT NULL,
+                title TEXT NOT NULL,
+                artist TEXT NOT NULL,
+                creator TEXT NOT NULL,
+                version TEXT NOT NULL,
+                beatmap_id INTEGER NOT NULL,
+                beatmapset_id INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS beatmaps_md5 ON beatmaps (md5)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS beatmaps_beatmap_id ON beatmaps (beatmap_id)")
+        self._db.commit()
+
+    def scan(self, root: str | Path) -> ScanResult:
+        """
+        Indexes all .osu files under root, e.g. the osu! Songs folder.
+        New and modified files are hashed, files that disappeared or can no longer be read are removed from the index.
+        """
+        root = Path(root).resolve()
+        found = {str(path): stat for path, stat in self._walk(root)}
+
+        with self._lock:
+            known = {
+                path: (mtime_ns, size)
+                for path, mtime_ns, size in self._db.execute(
+                    f"SELECT path, mtime_ns, size FROM beatmaps WHERE {PREFIX_CONDITION}", prefix_params(root)
+                )
+            }
+
+        changed = [(path, stat) for path, stat in found.items()
+                   if known.get(path) != (stat.st_mtime_ns, stat.st_size)]
+        removed = [path for path in known if path not in found]
+
+        rows = []
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hosu-songs") as executor:
+            for (path, _), row in zip(changed, executor.map(self._read, changed)):
+                if row is None:
+                    failed += 1
+                    if path in known:
+                        # Keeping the stale row would hash the file again on every scan
+                        removed.append(path)
+                else:
+                    rows.append(row)
+
+        with self._lock:
+            with self._db:
+                self._db.executemany("DELETE FROM beatmaps WHERE path = ?", ((path,) for path in removed))
+                self._insert(rows)
+
+        result = ScanResult(len(rows), len(found) - len(changed), len(removed), failed)
+        logger.info(f"Scanned beatmaps in {root}: {result}")
+        return result
+
+    def _insert(self, rows: List[tuple]) -> None:
+        # Must be called with the lock held
+        placeholders = ", ".join("?" for _ in range(len(_COLUMNS) + 2))
+        self._db.executemany(
+            f"INSERT OR REPLACE INTO beatmaps ({', '.join(_COLUMNS)}, mtime_ns, size) VALUES ({placeholders})",
+            rows,
+        )
+
+    def _walk(self, root: Path) -> Iterator[Tuple[Path, os.stat_result]]:
+        # Songs has a folder per beatmap set, the folders are listed concurrently
+        try:
+            entries = list(os.scandir(root))
+        except OSError as e:
+            logger.warning(f"Cannot list beatmaps in {root}: {e}")
+            return
+        directories = []
+        for entry in entries:
+            try:
+                if entry.is_dir(follow_symlinks=False):
+                    directories.append(Path(entry.path))
+                elif entry.name.lower().endswith(".osu") and entry.is_file():
+                    yield Path(entry.path), entry.stat()
+            except OSError:
+                continue
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hosu-songs") as executor:
+            for found in executor.map(self._walk_tree, directories):
+                yield from found
+
+    @staticmethod
+    def _walk_tree(root: Path) -> List[Tuple[Path, os.stat_result]]:
+        # os.scandir reuses the directory entries, rglob would stat every file twice
+        found = []
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            try:
+                entries = list(os.scandir(directory))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(Path(entry.path))
+                    elif entry.name.lower().endswith(".osu") and entry.is_file():
+                        found.append((Path(entry.path), entry.stat()))
+                except OSError:
+                    continue
+        return found
+
+    @staticmethod
+    def _read(item: Tuple[str, os.stat_result]) -> tuple | None:
+        path, stat = item
+        try:
+            beatmap = read_local_beatmap(path)
+        except Exception as e:
+            logger.warning(f"Skipping beatmap {path}: {e}")
+            return None
+        return tuple(getattr(beatmap, column) for column in _COLUMNS) + (stat.st_mtime_ns, stat.st_size)
+
+    def get(self, md5: str) -> LocalBeatmap | None:
+        """
+        :param md5: MD5 hash of the beatmap, e.g. OsuReplay.beatmap_hash.
+        :return: Indexed beatmap whose file still has that hash, None when there is none.
+        """
+        md5 = md5.lower()
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {', '.join(_COLUMNS)}, mtime_ns, size FROM beatmaps WHERE md5 = ?", (md5,)
+            ).fetchall()
+
+        for row in rows:
+            beatmap = LocalBeatmap(*row[:len(_COLUMNS)])
+            try:
+                stat = os.stat(beatmap.path)
+            except OSError:
+                self._forget(beatmap.path)
+                continue
+            if (stat.st_mtime_ns, stat.st_size) == tuple(row[len(_COLUMNS):]):
+                return beatmap
+            # Edited since the last scan, index the new content
+            row = self._read((beatmap.path, stat))
+            if row is None:
+                self._forget(beatmap.path)
+                continue
+            with self._lock:
+                with self._db:
+                    self._insert([row])
+            if row[0] == md5:
+                return LocalBeatmap(*row[:len(_COLUMNS)])
+        return None
+
+    def path(self, md5: str) -> Path | None:
+        beatmap = self.get(md5)
+        return Path(beatmap.path) if beatmap is not None else None
+
+    def _forget(self, path: str) -> None:
+        with self._lock:
+            with self._db:
+                self._db.execute("DELETE FROM beatmaps WHERE path = ?", (path,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM beatmaps").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
@@ -0,0 +1,265 @@
+import mmap
+import struct
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Dict, Iterator, List, Tuple
+
+from core.logger import get_logger
+from core.tracing import span
+from osu.beatmap_store import md5_file
+from osu.replay import unpack_osustring
+
+logger = get_logger(__name__)
+
+# Format changes of osu!.db, by the client version written in the header
+# Difficulty settings are singles instead of bytes and star ratings are stored
+_VERSION_FLOAT_DIFFICULTY = 20140609
+# Beatmap entries are no longer prefixed by their size
+_VERSION_NO_ENTRY_SIZE = 20191106
+# Star ratings are Int-Float pairs instead of Int-Double pairs
+_VERSION_FLOAT_STARS = 20250107
+
+_INT = struct.Struct('<i')
+_SHORT = struct.Struct('<h')
+# Player name is read between the two parts of the header
+_HEADER = struct.Struct('<ii?q')
+# ranked status, circles, sliders, spinners, last modification, AR, CS, HP, OD, slider velocity
+_COUNTS_BYTE_DIFFICULTY = struct.Struct('<BHHHq4Bd')
+_COUNTS_FLOAT_DIFFICULTY = struct.Struct('<BHHHq4fd')
+# 0x08, mods, 0x0D, stars as double or 0x0C, stars as single
+_STARS_DOUBLE = struct.Struct('<BiBd')
+_STARS_FLOAT = struct.Struct('<BiBf')
+# drain time (s), total time (ms), preview time (ms), timing point count
+_TIMES = struct.Struct('<iiii')
+# BPM, offset, inherited
+_TIMING_POINT_SIZE = 17
+# beatmap id, beatmap set id, thread id, 4 grades, local offset, stack leniency, mode
+_IDS = struct.Struct('<iiiBBBBhfB')
+# unplayed, last played, is osz2
+_PLAYED = struct.Struct('<?q?')
+# last checked against repository, ignore sound, ignore skin, disable storyboard, disable video, visual override
+_FLAGS = struct.Struct('<q?????')
+# last modification time, mania scroll speed
+_TAIL = struct.Struct('<iB')
+
+_MODES = 4
+
+
+@dataclass(slots=True)
+class OsuDbBeatmap:
+    """
+    Beatmap entry of osu!.db. Slots keep an index of a large collection small.
+    """
+    md5: str
+    artist: str
+    title: str
+    creator: str
+    version: str
+    audio_file: str
+    osu_file: str
+    # Folder inside Songs
+    folder: str
+    ranked_status: int
+    hit_circles: int
+    sliders: int
+    spinners: int
+    approach_rate: float
+    circle_size: float
+    hp_drain: float
+    overall_difficulty: float
+    slider_velocity: float
+    # Star rating without mods of the beatmap mode, None when osu! did not calculate it
+    stars: float | None
+    drain_time: int
+    total_time: int
+    beatmap_id: int
+    beatmapset_id: int
+    mode: int
+    # Offsets of the star rating lists of all modes in the file, see OsuDb.star_ratings
+    _star_offsets: Tuple[int, ...]
+
+    @property
+    def relative_path(self) -> Path:
+        return Path(self.folder) / self.osu_file
+
+
+class OsuDb:
+    """
+    Reader of the osu! client beatmap database (osu!.db).
+
+    The file is memory-mapped and entries are decoded one by one while iterating,
+    index() keeps them in a dictionary keyed by MD5 (the hash osu! writes into replays),
+    so beatmaps of replays are found without hashing the Songs folder or calling the API.
+
+    Reference:
+    https://github.com/ppy/osu/wiki/Legacy-database-file-structure
+    """
+
+    def __init__(self, path: str | Path, songs_path: str | Path | None = None, verify: bool = True):
+        """
+        :param path: Path to osu!.db.
+        :param songs_path: Songs folder the beatmap folders are relative to, the Songs folder next to osu!.db by default.
+        :param verify: Whether path() checks the hash of the file, osu!.db is stale when a beatmap was edited.
+        """
+        self.path_to_db = Path(path)
+        self.songs_path = Path(songs_path) if songs_path else self.path_to_db.parent / "Songs"
+        self.verify = verify
+        with open(self.path_to_db, "rb") as f:
+            self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self._buffer = memoryview(self._mmap)
+        self._index: Dict[str, OsuDbBeatmap] | None = None
+        self._lock = threading.Lock()
+
+        try:
+            self.version, self.folder_count, self.account_unlocked, self.unlock_date = \
+                _HEADER.unpack_from(self._buffer, 0)
+            self.player_name, offset = unpack_osustring(self._buffer, _HEADER.size)
+            self.beatmap_count = _INT.unpack_from(self._buffer, offset)[0]
+        except Exception as e:
+            self.close()
+            raise RuntimeError(f"OsuDb: cannot read {self.path_to_db}: {e}")
+        self._entries_offset = offset + _INT.size
+
+    def __iter__(self) -> Iterator[OsuDbBeatmap]:
+        """
+        Decodes beatmap entries in the file order.
+        """
+        offset = self._entries_offset
+        for _ in range(self.beatmap_count):
+            beatmap, offset = self._read_beatmap(offset)
+            yield beatmap
+
+    def _read_beatmap(self, offset: int) -> Tuple[OsuDbBeatmap, int]:
+        buffer = self._buffer
+        version = self.version
+        if version < _VERSION_NO_ENTRY_SIZE:
+            offset += _INT.size
+
+        artist, offset = unpack_osustring(buffer, offset)
+        _, offset = unpack_osustring(buffer, offset)  # artist in unicode
+        title, offset = unpack_osustring(buffer, offset)
+        _, offset = unpack_osustring(buffer, offset)  # title in unicode
+        creator, offset = unpack_osustring(buffer, offset)
+        difficulty, offset = unpack_osustring(buffer, offset)
+        audio_file, offset = unpack_osustring(buffer, offset)
+        md5, offset = unpack_osustring(buffer, offset)
+        osu_file, offset = unpack_osustring(buffer, offset)
+
+        counts = _COUNTS_FLOAT_DIFFICULTY if version >= _VERSION_FLOAT_DIFFICULTY else _COUNTS_BYTE_DIFFICULTY
+        ranked_status, circles, sliders, spinners, _, ar, cs, hp, od, slider_velocity = \
+            counts.unpack_from(buffer, offset)
+        offset += counts.size
+
+        star_offsets: Tuple[int, ...] = ()
+        if version >= _VERSION_FLOAT_DIFFICULTY:
+            pair_size = self._star_pair().size
+            starts = []
+            for _ in range(_MODES):
+                starts.append(offset)
+                offset += _INT.size + _INT.unpack_from(buffer, offset)[0] * pair_size
+            star_offsets = tuple(starts)
+
+        drain_time, total_time, _, timing_points = _TIMES.unpack_from(buffer, offset)
+        offset += _TIMES.size + timing_points * _TIMING_POINT_SIZE
+
+        beatmap_id, beatmapset_id, _, _, _, _, _, _, _, mode = _IDS.unpack_from(buffer, offset)
+        offset += _IDS.size
+
+        _, offset = unpack_osustring(buffer, offset)  # song source
+        _, offset = unpack_osustring(buffer, offset)  # tags
+        offset += _SHORT.size  # online offset
+        _, offset = unpack_osustring(buffer, offset)  # title font
+        offset += _PLAYED.size
+        folder, offset = unpack_osustring(buffer, offset)
+        offset += _FLAGS.size
+        if version < _VERSION_FLOAT_DIFFICULTY:
+            offset += _SHORT.size  # unknown
+        offset += _TAIL.size
+
+        stars = None
+        if star_offsets and mode < _MODES:
+            stars = self._read_star_ratings(star_offsets[mode]).get(0)
+
+        beatmap = OsuDbBeatmap(md5, artist, title, creator, difficulty, audio_file, osu_file, folder, ranked_status,
+                               circles, sliders, spinners, float(ar), float(cs), float(hp), float(od),
+                               slider_velocity, stars, drain_time, total_time, beatmap_id, beatmapset_id, mode,
+                               star_offsets)
+        return beatmap, offset
+
+    def _star_pair(self) -> struct.Struct:
+        return _STARS_FLOAT if self.version >= _VERSION_FLOAT_STARS else _STARS_DOUBLE
+
+    def _read_star_ratings(self, offset: int) -> Dict[int, float]:
+        pair = self._star_pair()
+        count = _INT.unpack_from(self._buffer, offset)[0]
+        offset += _INT.size
+        ratings = {}
+        for _ in range(count):
+            _, mods, _, stars = pair.unpack_from(self._buffer, offset)
+            ratings[mods] = stars
+            offset += pair.size
+        return ratings
+
+    def star_ratings(self, beatmap: OsuDbBeatmap, mode: int | None = None) -> Dict[int, float]:
+        """
+        Star ratings calculated by osu!, keyed by the mods bitmask. osu! stores only difficulty changing mods.
+        :param mode: Gameplay mode (0-3), the mode of the beatmap by default.
+        """
+        mode = beatmap.mode if mode is None else mode
+        if not beatmap._star_offsets or not 0 <= mode < _MODES:
+            return {}
+        return self._read_star_ratings(beatmap._star_offsets[mode])
+
+    def index(self) -> Dict[str, OsuDbBeatmap]:
+        """
+        Reads all entries once and keeps them keyed by MD5.
+        """
+        with self._lock:
+            if self._index is None:
+                with span("osu_db.index", "osu_db"):
+                    index = {}
+                    for beatmap in self:
+                        if beatmap.md5:
+                            index[beatmap.md5] = beatmap
+                    self._index = index
+                logger.info(f"Indexed {len(index)} beatmaps of {self.path_to_db} (version {self.version})")
+            return self._index
+
+    def get(self, md5: str) -> OsuDbBeatmap | None:
+        return self.index().get(md5.lower())
+
+    def path(self, md5: str) -> Path | None:
+        """
+        :param md5: MD5 hash of the beatmap, e.g. OsuReplay.beatmap_hash.
+        :return: Path of the .osu file in the Songs folder, None when it is unknown or no longer matches the hash.
+        """
+        beatmap = self.get(md5)
+        if beatmap is None:
+            return None
+        path = self.songs_path / beatmap.relative_path
+        if not path.is_file():
+            return None
+        if self.verify and md5_file(path) != md5.lower():
+            logger.warning(f"Beatmap {path} was modified after osu!.db was written")
+            return None
+        return path
+
+    def by_beatmapset(self, beatmapset_id: int) -> List[OsuDbBeatmap]:
+        return [beatmap for beatmap in self.index().values() if beatmap.beatmapset_id == beatmapset_id]
+
+    def __len__(self) -> int:
+        return self.beatmap_count
+
+    def close(self) -> None:
+        self._buffer.release()
+        try:
+            self._mmap.close()
+        except BufferError:
+            pass  # an entry is still being decoded, the map is closed when collected
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
@@ -1,7 +1,22 @@
 import base64
+import lzma
+import mmap
 import os
 import struct
-from typing import BinaryIO
+from pathlib import Path
+from typing import BinaryIO, Tuple
+
+from core.logger import get_logger
+from core.tracing import span
+from osu.replay_frames import ReplayFrames, decode_frames
+
+logger = get_logger(__name__)
+
+# Fixed size parts of the replay header
+_MODE_VERSION = struct.Struct('<BI')
+_SCORE = struct.Struct('<6HIHBI')  # hit counts, total score, greatest combo, perfect flag, mods
+_TIMESTAMP_LENGTH = struct.Struct('<QI')
+_LONG = struct.Struct('<Q')
 
 
 def read_byte(file: BinaryIO) -> int:
@@ -20,6 +35,20 @@ def read_long(file: BinaryIO) -> int:
     return struct.unpack('<Q', file.read(8))[0]
 
 
+def read_uleb128(file: BinaryIO) -> int:
+    """
+    Reads unsigned LEB128 encoded integer.
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = read_byte(file)
+        result |= (byte & 0x7F) << shift
+        if byte & 0x80 == 0:
+            return result
+        shift += 7
+
+
 def read_osustring(file: BinaryIO) -> str:
     """
     osu! string format has three parts.
@@ -42,50 +71,180 @@ def read_osustring(file: BinaryIO) -> str:
     if marker != 0x0B:
         raise ValueError("Invalid Osu! string marker (expected 0x0B or 0x00)")
 
-    length = read_byte(file)
+    length = read_uleb128(file)
     return file.read(length).decode('utf-8')
 
 
+def unpack_uleb128(buffer, offset: int) -> Tuple[int, int]:
+    """
+    Decodes unsigned LEB128 integer from a buffer.
+    :return: The integer and offset right after it.
+    """
+    result = 0
+    shift = 0
+    while True:
+        byte = buffer[offset]
+        offset += 1
+        result |= (byte & 0x7F) << shift
+        if byte & 0x80 == 0:
+            return result, offset
+        shift += 7
+
+
+def unpack_osustring(buffer, offset: int) -> Tuple[str, int]:
+    """
+    Decodes osu! string (see read_osustring) from a buffer.
+    :return: The string and offset right after it.
+    """
+    marker = buffer[offset]
+    if marker == 0x00:
+        return "", offset + 1
+    if marker != 0x0B:
+        raise ValueError("Invalid Osu! string marker (expected 0x0B or 0x00)")
+
+    length, offset = unpack_uleb128(buffer, offset + 1)
+    end = offset + length
+    if end > len(buffer):
+        raise ValueError("Osu! string exceeds the buffer")
+    return bytes(buffer[offset:end]).decode('utf-8'), end
+
+
 class OsuReplay:
     # TODO: change str to Path
-    def __init__(self, path: str):
+    def __init__(self, source: str | Path | bytes | bytearray | memoryview, header_only: bool = False):
+        """
+        Parses an .osr replay.
+
+        Files are memory-mapped and the frame data is exposed as a zero-copy slice.
+
+        :param source: Path to the replay file or its content.
+        :param header_only: Parse only the header and do not keep the frame data,
+                            useful when scanning many replays.
+        """
+        self._mmap: mmap.mmap | None = None
+        self._view: memoryview | None = None
+        self._compressed_data: memoryview | None = None
+        self._frames: ReplayFrames | None = None
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            with span("replay.parse", "replay"):
+                self._parse(memoryview(source), header_only)
+            return
+
+        path = str(source)
         # Check does replay file exists
         if not os.path.exists(path):
             raise FileNotFoundError(f"OsuReplay: file '{path}' does not exists.")
         # Try to read and parse replay file
         try:
             with open(path, "rb") as replay:
-                self.mode = self._read_mode(replay)
-                self.osu_version = read_int(replay)
-                self.beatmap_hash = read_osustring(replay)  # beatmap MD5 hash
-                self.user_name = read_osustring(replay)
-                self.replay_hash = read_osustring(replay)  # replay MD5 hash
-
-                self.count_300 = read_short(replay)
-                self.count_100 = read_short(replay)
-                self.count_50 = read_short(replay)
-                self.count_gekis = read_short(replay)
-                self.count_katus = read_short(replay)
-                self.count_misses = read_short(replay)
-                self.accuracy = (self.count_50 * 50 + self.count_100 * 100 + self.count_300 * 300) / (300 * (self.count_50 + self.count_100 + self.count_300 + self.count_misses))
-                self.total_score = read_int(replay)
-                self.greatest_combo = read_short(replay)
-                self.is_perfect = read_byte(replay)
-                self.mods = read_int(replay)
-                self.life_bar = read_osustring(replay)
-                self.timestamp = read_long(replay)  # windows ticks
-
-                data_length = read_int(replay)
-                self.compressed_data = replay.read(data_length)
-                # self.online_score_id = read_long(replay)
+                self._mmap = mmap.mmap(replay.fileno(), 0, access=mmap.ACCESS_READ)
+        except Exception as e:
+            raise RuntimeError(f"OsuReplay: cannot open replay file: {e}")
+
+        try:
+            with span("replay.parse", "replay"):
+                self._parse(memoryview(self._mmap), header_only)
+        except Exception:
+            self.release()
+            raise
+        if header_only:
+            self.release()
+
+    def _parse(self, buffer: memoryview, header_only: bool) -> None:
+        try:
+            mode, self.osu_version = _MODE_VERSION.unpack_from(buffer, 0)
+            self.mode = self._mode_name(mode)
+            offset = _MODE_VERSION.size
+            self.beatmap_hash, offset = unpack_osustring(buffer, offset)  # beatmap MD5 hash
+            self.user_name, offset = unpack_osustring(buffer, offset)
+            self.replay_hash, offset = unpack_osustring(buffer, offset)  # replay MD5 hash
+
+            (self.count_300, self.count_100, self.count_50, self.count_gekis, self.count_katus, self.count_misses,
+             self.total_score, self.greatest_combo, self.is_perfect, self.mods) = _SCORE.unpack_from(buffer, offset)
+            offset += _SCORE.size
+            self.accuracy = (self.count_50 * 50 + self.count_100 * 100 + self.count_300 * 300) / (300 * (self.count_50 + self.count_100 + self.count_300 + self.count_misses))
+
+            self.life_bar, offset = unpack_osustring(buffer, offset)
+            self.timestamp, data_length = _TIMESTAMP_LENGTH.unpack_from(buffer, offset)  # windows ticks
+            offset += _TIMESTAMP_LENGTH.size
+
+            self.data_offset = offset
+            self.data_length = data_length
+            if offset + data_length > len(buffer):
+                raise ValueError("replay data exceeds the file")
+            offset += data_length
+
+            self.online_score_id = _LONG.unpack_from(buffer, offset)[0] if offset + _LONG.size <= len(buffer) else 0
         except Exception as e:
             raise RuntimeError(f"OsuReplay: cannot open replay file: {e}")
 
-    def _read_mode(self, replay) -> str:
+        if not header_only:
+            self._view = buffer
+            self._compressed_data = buffer[self.data_offset:self.data_offset + self.data_length]
+
+    @property
+    def compressed_data(self) -> memoryview:
+        """
+        LZMA compressed frame data as a zero-copy view into the replay.
+        """
+        if self._compressed_data is None:
+            raise RuntimeError("OsuReplay: frame data is not available (parsed header only or released)")
+        return self._compressed_data
+
+    @property
+    def has_data(self) -> bool:
+        return self._compressed_data is not None
+
+    @property
+    def frames(self) -> ReplayFrames:
+        """
+        Decoded replay frames, decompressed and parsed on the first access.
+        Malformed frame data gives no frames, so the header can still be rendered.
+        """
+        if self._frames is None:
+            with span("replay.decode_frames", "replay"):
+                try:
+                    self._frames = decode_frames(self.compressed_data)
+                except (lzma.LZMAError, EOFError, ValueError) as e:
+                    logger.warning(f"Replay {self.replay_hash} has malformed frame data: {e}")
+                    self._frames = ReplayFrames.empty()
+        return self._frames
+
+    def release_frames(self) -> None:
+        """
+        Frees decoded frames, they are decoded again on the next access.
+        """
+        self._frames = None
+
+    def release(self) -> None:
+        """
+        Releases the frame data and the memory map of the file.
+        """
+        if self._compressed_data is not None:
+            self._compressed_data.release()
+            self._compressed_data = None
+        if self._view is not None:
+            self._view.release()
+            self._view = None
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                pass  # a slice is still used outside, the map is closed when collected
+            self._mmap = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.release()
+
+    @staticmethod
+    def _mode_name(mode: int) -> str:
         """
         Determines the mode of given replay
         """
-        mode: int = read_byte(replay)
         return {
             0: 'osu!',
             1: 'osu!taiko',
@@ -114,6 +273,6 @@ class OsuReplay:
             "mods": self.mods,
             "life_bar": self.life_bar,
             "timestamp": self.timestamp,
-            "compressed_data": base64.b64encode(self.compressed_data).decode("utf-8"),
+            "online_score_id": self.online_score_id,
+            "compressed_data": base64.b64encode(self.compressed_data).decode("utf-8") if self.has_data else None,
         }
-
@@ -0,0 +1,214 @@
+import os
+import sqlite3
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, fields
+from pathlib import Path
+from typing import List, Iterator, Tuple
+
+from core.logger import get_logger
+from osu.file_index import PREFIX_CONDITION, ScanResult, prefix_params
+from osu.replay import OsuReplay
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class ReplayRecord:
+    """
+    Header fields of one indexed replay.
+    """
+    replay_hash: str
+    path: str
+    beatmap_hash: str
+    user_name: str
+    mode: str
+    mods: int
+    count_300: int
+    count_100: int
+    count_50: int
+    count_gekis: int
+    count_katus: int
+    count_misses: int
+    total_score: int
+    greatest_combo: int
+    timestamp: int
+
+    @classmethod
+    def from_replay(cls, path: str, replay: OsuReplay) -> "ReplayRecord":
+        return cls(replay.replay_hash, path, replay.beatmap_hash, replay.user_name, replay.mode, replay.mods,
+                   replay.count_300, replay.count_100, replay.count_50, replay.count_gekis, replay.count_katus,
+                   replay.count_misses, replay.total_score, replay.greatest_combo, replay.timestamp)
+
+
+_COLUMNS = [f.name for f in fields(ReplayRecord)]
+# Columns of the replays table, paths are kept in the files table
+_REPLAY_COLUMNS = [column for column in _COLUMNS if column != "path"]
+# Record columns selected from replays joined with files, a replay in many files gets one of its paths
+_SELECT = ", ".join("MIN(f.path)" if column == "path" else f"r.{column}" for column in _COLUMNS)
+
+
+class ReplayIndex:
+    """
+    Persistent SQLite index of .osr headers keyed by replay hash.
+
+    A replay copied to several folders is stored once, the files table maps every path to its replay
+    and keeps the mtime and size the path was parsed with. Scans parse only replay headers, in parallel,
+    and only for files whose mtime or size changed since the previous scan.
+    """
+
+    def __init__(self, path: str, workers: int = 8):
+        """
+        :param path: Path to the SQLite database file.
+        :param workers: Number of threads parsing replays during a scan.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        columns = [row[1] for row in self._db.execute("PRAGMA table_info(replays)")]
+        if "path" in columns:
+            # Index of an older version keyed by path, it is rebuilt by the next scan
+            logger.warning(f"Rebuilding replay index {path} keyed by replay hash")
+            self._db.execute("DROP TABLE replays")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS replays (
+                replay_hash TEXT PRIMARY KEY,
+                beatmap_hash TEXT NOT NULL,
+                user_name TEXT NOT NULL,
+                mode TEXT NOT NULL,
+                mods INTEGER NOT NULL,
+                count_300 INTEGER NOT NULL,
+                count_100 INTEGER NOT NULL,
+                count_50 INTEGER NOT NULL,
+                count_gekis INTEGER NOT NULL,
+                count_katus INTEGER NOT NULL,
+                count_misses INTEGER NOT NULL,
+                total_score INTEGER NOT NULL,
+                greatest_combo INTEGER NOT NULL,
+                timestamp INTEGER NOT NULL
+            )
+        """)
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                replay_hash TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS files_replay_hash ON files (replay_hash)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS replays_beatmap_hash ON replays (beatmap_hash)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS replays_user_name ON replays (user_name COLLATE NOCASE)")
+        self._db.commit()
+
+    def scan(self, root: str | Path, pattern: str = "*.osr") -> ScanResult:
+        """
+        Indexes all replays under root.
+        New and modified files are parsed, files that disappeared or can no longer be parsed are removed
+        from the index, together with replays no other file contains.
+        """
+        root = Path(root).resolve()
+        found = {str(path): stat for path, stat in self._walk(root, pattern)}
+
+        with self._lock:
+            known = {
+                path: (mtime_ns, size)
+                for path, mtime_ns, size in self._db.execute(
+                    f"SELECT path, mtime_ns, size FROM files WHERE {PREFIX_CONDITION}", prefix_params(root)
+                )
+            }
+
+        changed = [(path, stat) for path, stat in found.items()
+                   if known.get(path) != (stat.st_mtime_ns, stat.st_size)]
+        removed = [path for path in known if path not in found]
+
+        records = []
+        files = []
+        failed = 0
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for (path, _), parsed in zip(changed, executor.map(self._parse, changed)):
+                if parsed is None:
+                    failed += 1
+                    if path in known:
+                        # Keeping the stale row would parse the file again on every scan
+                        removed.append(path)
+                else:
+                    records.append(parsed[0])
+                    files.append(parsed[1])
+
+        placeholders = ", ".join("?" for _ in _REPLAY_COLUMNS)
+        with self._lock:
+            with self._db:
+                self._db.executemany("DELETE FROM files WHERE path = ?", ((path,) for path in removed))
+                self._db.executemany(
+                    f"INSERT OR REPLACE INTO replays ({', '.join(_REPLAY_COLUMNS)}) VALUES ({placeholders})",
+                    records,
+                )
+                self._db.executemany(
+                    "INSERT OR REPLACE INTO files (path, replay_hash, mtime_ns, size) VALUES (?, ?, ?, ?)", files
+                )
+                # Replays whose last file was removed or now contains another replay
+                self._db.execute("DELETE FROM replays WHERE replay_hash NOT IN (SELECT replay_hash FROM files)")
+
+        result = ScanResult(len(files), len(found) - len(changed), len(removed), failed)
+        logger.info(f"Scanned replays in {root}: {result}")
+        return result
+
+    @staticmethod
+    def _walk(root: Path, pattern: str) -> Iterator[Tuple[Path, os.stat_result]]:
+        for path in root.rglob(pattern):
+            try:
+                stat = path.stat()
+            except OSError:
+                continue
+            if path.is_file():
+                yield path, stat
+
+    @staticmethod
+    def _parse(item: Tuple[str, os.stat_result]) -> Tuple[tuple, tuple] | None:
+        path, stat = item
+        try:
+            replay = OsuReplay(path, header_only=True)
+        except Exception as e:
+            logger.warning(f"Skipping replay {path}: {e}")
+            return None
+        record = ReplayRecord.from_replay(path, replay)
+        row = tuple(getattr(record, column) for column in _REPLAY_COLUMNS)
+        return row, (path, record.replay_hash, stat.st_mtime_ns, stat.st_size)
+
+    def _query(self, where: str, params: tuple) -> List[ReplayRecord]:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {_SELECT} FROM replays r JOIN files f ON f.replay_hash = r.replay_hash "
+                f"WHERE {where} GROUP BY r.replay_hash ORDER BY r.timestamp", params
+            ).fetchall()
+        return [ReplayRecord(*row) for row in rows]
+
+    def get(self, replay_hash: str) -> ReplayRecord | None:
+        records = self._query("r.replay_hash = ?", (replay_hash,))
+        return records[0] if records else None
+
+    def paths(self, replay_hash: str) -> List[str]:
+        """
+        :return: All indexed files containing the replay.
+        """
+        with self._lock:
+            rows = self._db.execute("SELECT path FROM files WHERE replay_hash = ? ORDER BY path",
+                                    (replay_hash,)).fetchall()
+        return [path for path, in rows]
+
+    def by_beatmap(self, beatmap_hash: str) -> List[ReplayRecord]:
+        return self._query("r.beatmap_hash = ?", (beatmap_hash,))
+
+    def by_player(self, user_name: str) -> List[ReplayRecord]:
+        return self._query("r.user_name = ? COLLATE NOCASE", (user_name,))
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM replays").fetchone()[0]
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
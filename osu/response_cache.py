@@ -0,0 +1,165 @@
+import json
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any
+
+from core.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class CachedResponse:
+    body: Any
+    stored_at: float
+    etag: str | None
+    last_modified: str | None
+
+    def is_fresh(self, ttl: float) -> bool:
+        return time.time() - self.stored_at < ttl
+
+    def can_revalidate(self) -> bool:
+        return self.etag is not None or self.last_modified is not None
+
+
+@dataclass(frozen=True)
+class ResponseCacheStats:
+    hits: int
+    misses: int
+    stale: int
+    revalidated: int
+    evictions: int
+    entries: int
+    size: int
+    max_size: int
+
+    def __str__(self) -> str:
+        return (f"hits={self.hits} misses={self.misses} stale={self.stale} revalidated={self.revalidated} "
+                f"evictions={self.evictions} entries={self.entries} size={self.size}/{self.max_size}B")
+
+
+class ResponseCache:
+    """
+    Persistent cache of osu! API JSON responses stored in SQLite.
+
+    Entries are keyed by endpoint with its parameters. Freshness is decided by the caller
+    through a TTL, so every endpoint can have its own. Stale entries are kept with their
+    ETag/Last-Modified validators to be revalidated. Total size is capped with LRU eviction.
+    """
+
+    def __init__(self, path: str, max_size: int):
+        """
+        :param path: Path to the SQLite database file.
+        :param max_size: Maximum total size of stored bodies in bytes.
+        """
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.path = path
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                body TEXT NOT NULL,
+                etag TEXT,
+                last_modified TEXT,
+                stored_at REAL NOT NULL,
+                accessed_at REAL NOT NULL,
+                size INTEGER NOT NULL
+            )
+        """)
+        self._db.execute("CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)")
+        self._size = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+
+        self._hits = 0
+        self._misses = 0
+        self._stale = 0
+        self._revalidated = 0
+        self._evictions = 0
+
+    def lookup(self, key: str, ttl: float) -> tuple[Any | None, CachedResponse | None]:
+        """
+        Looks up a response.
+        :return: (body, None) when fresh, (None, entry) when stale, (None, None) when missing.
+        """
+        entry = self._read(key)
+        if entry is None:
+            with self._lock:
+                self._misses += 1
+            return None, None
+        if entry.is_fresh(ttl):
+            with self._lock:
+                self._hits += 1
+            return entry.body, None
+        with self._lock:
+            self._stale += 1
+        return None, entry
+
+    def _read(self, key: str) -> CachedResponse | None:
+        with self._lock:
+            row = self._db.execute(
+                "SELECT body, stored_at, etag, last_modified FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                return None
+            self._db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        return CachedResponse(json.loads(row[0]), row[1], row[2], row[3])
+
+    def put(self, key: str, body: Any, etag: str | None = None, last_modified: str | None = None) -> None:
+        data = json.dumps(body, separators=(",", ":"))
+        size = len(data.encode("utf-8"))
+        if size > self.max_size:
+            logger.debug(f"Response {key} is larger than the whole cache, not storing")
+            return
+
+        now = time.time()
+        with self._lock:
+            row = self._db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                self._size -= row[0]
+            self._db.execute(
+                "INSERT OR REPLACE INTO responses (key, body, etag, last_modified, stored_at, accessed_at, size) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, data, etag, last_modified, now, now, size),
+            )
+            self._size += size
+            self._evict()
+
+    def revalidated(self, key: str) -> None:
+        """
+        Marks a stale entry as fresh again after the server confirmed it did not change.
+        """
+        now = time.time()
+        with self._lock:
+            self._revalidated += 1
+            self._db.execute("UPDATE responses SET stored_at = ?, accessed_at = ? WHERE key = ?", (now, now, key))
+
+    def _evict(self) -> None:
+        # Must be called with the lock held
+        while self._size > self.max_size:
+            row = self._db.execute("SELECT key, size FROM responses ORDER BY accessed_at LIMIT 1").fetchone()
+            if row is None:
+                self._size = 0
+                return
+            self._db.execute("DELETE FROM responses WHERE key = ?", (row[0],))
+            self._size -= row[1]
+            self._evictions += 1
+
+    def clear(self) -> None:
+        with self._lock:
+            self._db.execute("DELETE FROM responses")
+            self._size = 0
+
+    def stats(self) -> ResponseCacheStats:
+        with self._lock:
+            entries = self._db.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+            return ResponseCacheStats(self._hits, self._misses, self._stale, self._revalidated, self._evictions,
+                                      entries, self._size, self.max_size)
+
+    def close(self) -> None:
+        with self._lock:
+            self._db.close()
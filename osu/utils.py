@@ -22,13 +22,13 @@ def format_token_expiry(expiry_timestamp: float) -> str:
 
     parts = []
     if days:
-        parts.append(f"{days} day{"s" if days != 1 else ""}")
+        parts.append(f"{days} day{'s' if days != 1 else ''}")
     if hours:
-        parts.append(f"{hours} hour{"s" if hours != 1 else ""}")
+        parts.append(f"{hours} hour{'s' if hours != 1 else ''}")
     if minutes:
-        parts.append(f"{minutes} minute{"s" if minutes != 1 else ""}")
+        parts.append(f"{minutes} minute{'s' if minutes != 1 else ''}")
     if seconds and not days:
-        parts.append(f"{seconds} second{"s" if seconds != 1 else ""}")
+        parts.append(f"{seconds} second{'s' if seconds != 1 else ''}")
 
     formatted = ", ".join(parts)
     return f"Token expires in {formatted}"
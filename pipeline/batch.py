@@ -0,0 +1,419 @@
+import functools
+import glob
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, Future, wait
+from concurrent.futures.process import BrokenProcessPool
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import List, Iterable
+
+from core import tracing
+
+from core.config import load_config
+from core.layout import Layout
+from core.logger import get_logger
+from core.render_cache import RenderCache
+from core.render_profile import WidgetProfiler, WidgetCost
+from core.variable_map import VariableMap
+from osu.api import OsuAPI
+from osu.beatmap_store import BeatmapStore
+from osu.calculate import calculate_play_performance
+from osu.data import User
+from osu.local_beatmaps import LocalBeatmapIndex
+from osu.osu_db import OsuDb
+from osu.replay import OsuReplay
+from pipeline.config import RenderCacheConfig
+from pipeline.thumbnail import default_layout, play_variables, shared_variables, BeatmapResolver, USER_VARIABLES
+from renderer.encoder import ImageEncoder, EncodeOptions
+from renderer.pillow import PillowRenderer
+
+logger = get_logger(__name__)
+
+
+@dataclass
+class PreparedPlay:
+    """
+    Replay with everything fetched by the I/O stage, sent to a render process.
+    """
+    replay_path: str
+    beatmap_path: str
+    beatmap_hash: str
+    user: User | None
+    # Output file path relative to the output directory, without extension
+    output_name: str
+
+
+@dataclass
+class RenderedPlay:
+    replay_path: str
+    output_path: str
+    # (start, end) timestamps of the stages run by the render process
+    calculate: tuple[float, float]
+    render: tuple[float, float]
+    encode: tuple[float, float]
+    # Spans of the render process when tracing is enabled
+    spans: List[tracing.SpanEvent] = field(default_factory=list)
+    # (instances, types) widget costs of the render process when profiling is enabled
+    widget_costs: tuple[List[WidgetCost], List[WidgetCost]] | None = None
+    # Why the play was not rendered and the stage which failed, None on success
+    error: str | None = None
+    failed_stage: str | None = None
+
+
+@dataclass
+class StageStats:
+    """
+    Throughput of one pipeline stage.
+    """
+    name: str
+    count: int = 0
+    failed: int = 0
+    busy: float = 0.0
+    first_start: float | None = None
+    last_end: float | None = None
+    _lock: threading.Lock = field(default_factory=threading.Lock, repr=False)
+
+    def record(self, start: float, end: float, ok: bool = True) -> None:
+        with self._lock:
+            if ok:
+                self.count += 1
+            else:
+                self.failed += 1
+            self.busy += end - start
+            self.first_start = start if self.first_start is None else min(self.first_start, start)
+            self.last_end = end if self.last_end is None else max(self.last_end, end)
+
+    @property
+    def wall(self) -> float:
+        if self.first_start is None:
+            return 0.0
+        return self.last_end - self.first_start
+
+    @property
+    def rate(self) -> float:
+        """
+        Processed replays per second of the stage wall time.
+        """
+        return self.count / self.wall if self.wall > 0 else 0.0
+
+
+@dataclass
+class BatchReport:
+    stages: List[StageStats]
+    total: int
+    wall: float
+
+    def format(self) -> str:
+        lines = [f"{'stage':<10} {'ok':>6} {'failed':>6} {'busy s':>9} {'wall s':>9} {'replays/s':>10}"]
+        for stage in self.stages:
+            lines.append(f"{stage.name:<10} {stage.count:>6} {stage.failed:>6} {stage.busy:>9.2f} "
+                         f"{stage.wall:>9.2f} {stage.rate:>10.2f}")
+        done = self.stages[-1].count if self.stages else 0
+        rate = done / self.wall if self.wall > 0 else 0.0
+        lines.append(f"{'total':<10} {done:>6} {self.total - done:>6} {'':>9} {self.wall:>9.2f} {rate:>10.2f}")
+        return "\n".join(lines)
+
+
+def find_replays(source: str) -> List[Path]:
+    """
+    :param source: Directory searched recursively for .osr files or a glob pattern.
+    """
+    path = Path(source)
+    if path.is_dir():
+        return sorted(path.rglob("*.osr"))
+    return sorted(Path(p) for p in glob.glob(source, recursive=True) if p.lower().endswith(".osr"))
+
+
+def output_names(replay_paths: List[Path]) -> dict[Path, str]:
+    """
+    Names thumbnails by the replay path relative to the deepest folder containing all replays,
+    so replays with the same file name in different folders do not overwrite each other.
+    :return: Output path without extension keyed by replay path.
+    """
+    if not replay_paths:
+        return {}
+    resolved = {path: path.resolve() for path in replay_paths}
+    try:
+        root = Path(os.path.commonpath([str(path.parent) for path in resolved.values()]))
+    except ValueError:
+        # Replays on different drives share no folder
+        return {path: f"{path.stem}_{index}" for index, path in enumerate(replay_paths)}
+    return {path: resolved_path.relative_to(root).with_suffix("").as_posix()
+            for path, resolved_path in resolved.items()}
+
+
+# State of a render process, created once by the pool initializer
+_worker_layout: Layout | None = None
+_worker_renderer: PillowRenderer | None = None
+_worker_output: tuple[str, EncodeOptions] | None = None
+# Variables shared by all renders of the process, every render adds its own overlay
+_worker_variables: VariableMap | None = None
+_worker_cache: RenderCache | None = None
+_worker_encoder: ImageEncoder | None = None
+
+
+def _init_render_worker(config_path: str | None, output_dir: str, output_format: str, trace: bool = False,
+                        profile: bool = False) -> None:
+    global _worker_layout, _worker_renderer, _worker_output, _worker_variables, _worker_cache, _worker_encoder
+    if config_path is not None:
+        load_config(Path(config_path))
+    # Spawned processes start with the default settings, tracing follows the main process
+    tracing.get_tracer().enabled = trace
+    _worker_layout = default_layout()
+    _worker_renderer = PillowRenderer()
+    if profile:
+        _worker_renderer.enable_profiling()
+    # Fonts and static layers are ready before the first replay arrives
+    try:
+        _worker_renderer.warm_up(_worker_layout)
+    except Exception as e:
+        logger.warning(f"Render worker warm up failed: {e}")
+    _worker_output = (output_dir, EncodeOptions.from_config(output_format))
+    # Encodes a play on its own thread while the process renders the next play of the task
+    _worker_encoder = ImageEncoder(_worker_renderer, workers=1)
+    _worker_variables = shared_variables()
+    if RenderCacheConfig.enabled:
+        _worker_cache = RenderCache(RenderCacheConfig.path, int(RenderCacheConfig.max_size_mb * 1024 * 1024))
+
+
+def _render_play(play: PreparedPlay) -> tuple[RenderedPlay, Future | None]:
+    """
+    Calculates and renders the play. Without the render cache the image is submitted to the encoder
+    and the returned future completes when its file is written.
+    """
+    output_dir, options = _worker_output
+    output_path = Path(output_dir) / f"{play.output_name}.{options.extension}"
+    output_path.parent.mkdir(parents=True, exist_ok=True)
+
+    with OsuReplay(play.replay_path) as replay:
+        calculate_start = time.time()
+        performance = calculate_play_performance(play.beatmap_path, replay, play.beatmap_hash)
+        render_start = time.time()
+        variable_map = play_variables(replay, performance, play.user, _worker_variables.overlay())
+        if _worker_cache is not None:
+            # Encoded inside render_layout, a replay rendered before is not drawn again
+            data = _worker_renderer.render_layout(_worker_layout, variable_map, cache=_worker_cache,
+                                                  format=options.format, **options.params())
+        else:
+            image = _worker_renderer.render_layout(_worker_layout, variable_map)
+        replay.release_frames()
+
+    encode_start = time.time()
+    result = RenderedPlay(play.replay_path, str(output_path), (calculate_start, render_start),
+                          (render_start, encode_start), (encode_start, encode_start))
+    if _worker_cache is not None:
+        output_path.write_bytes(data)
+        result.encode = (encode_start, time.time())
+        return result, None
+    return result, _worker_encoder.submit(image, options, output_path)
+
+
+def _encoded(result: RenderedPlay) -> None:
+    # Runs on the encoder thread as soon as the file is written
+    result.encode = (result.encode[0], time.time())
+
+
+def _finish_encode(result: RenderedPlay, future: Future, previous_end: float) -> None:
+    """
+    :param previous_end: When the previous encode of the task finished, the single encoder thread
+                         starts the next image only after that.
+    """
+    try:
+        future.result()
+    except Exception as e:
+        result.error = f"Cannot encode {result.output_path}: {e}"
+        result.failed_stage = "encode"
+    if result.encode[1] == result.encode[0]:
+        # The done callback has not run yet, the encode has only just finished
+        _encoded(result)
+    result.encode = (min(max(result.encode[0], previous_end), result.encode[1]), result.encode[1])
+
+
+def _render_plays(plays: List[PreparedPlay]) -> List[RenderedPlay]:
+    """
+    Renders plays of one task. A play is encoded on the encoder thread while the next one is rendered,
+    its future is collected after that render.
+    """
+    results = []
+    pending: tuple[RenderedPlay, Future] | None = None
+    encoded_at = 0.0
+    for play in plays:
+        try:
+            result, future = _render_play(play)
+        except Exception as e:
+            now = time.time()
+            result, future = RenderedPlay(play.replay_path, "", (now, now), (now, now), (now, now),
+                                          error=f"Cannot render {play.replay_path}: {e}", failed_stage="render"), None
+        if future is not None:
+            future.add_done_callback(lambda _, result=result: _encoded(result))
+        if pending is not None:
+            _finish_encode(*pending, encoded_at)
+            encoded_at = pending[0].encode[1]
+        pending = (result, future) if future is not None else None
+        results.append(result)
+    if pending is not None:
+        _finish_encode(*pending, encoded_at)
+
+    # Spans and widget costs of the whole task travel back with its last play and are merged in the main process
+    profiler = _worker_renderer.profiler
+    results[-1].spans = tracing.get_tracer().drain()
+    results[-1].widget_costs = profiler.drain() if profiler is not None else None
+    return results
+
+
+class BatchPipeline:
+    """
+    Renders thumbnails for many replays in stages.
+
+    1. I/O thread pool parses replay headers, fetches the player and resolves the beatmap
+       (response cache, beatmap store, local Songs index, download).
+    2. Prepared replays wait in a bounded queue, so the I/O stage cannot run far ahead.
+    3. Process pool calculates pp, renders and encodes. Each process warms its fonts and
+       static layers once in the pool initializer, and encodes a play on a thread while
+       it renders the next one.
+
+    Render processes are spawned, not forked: a fork could copy a lock held by an I/O thread
+    (HTTP pool, SQLite, logging) and deadlock. They load the settings from config_path.
+    """
+
+    # Render tasks submitted per render process, keeps every process busy without piling up work
+    IN_FLIGHT_PER_WORKER = 2
+    # Most plays sent to a render process at once, encoding of one overlaps rendering of the next.
+    # Tasks take only plays already waiting in the queue, a slow I/O stage sends them one by one.
+    PLAYS_PER_TASK = 4
+
+    def __init__(self, api: OsuAPI, store: BeatmapStore, io_workers: int, render_workers: int, queue_size: int,
+                 output_dir: str, output_format: str, config_path: str | None = None,
+                 profiler: WidgetProfiler | None = None, local_beatmaps: LocalBeatmapIndex | None = None,
+                 osu_db: OsuDb | None = None):
+        """
+        :param profiler: When given, render processes profile widget draws and their costs are merged into it.
+        :param local_beatmaps: Index of a local Songs folder, its beatmaps are not downloaded.
+        :param osu_db: Beatmap database of the osu! client, its beatmaps are not downloaded or looked up.
+        """
+        self.api = api
+        self.resolver = BeatmapResolver(api, store, local_beatmaps, osu_db)
+        self.io_workers = io_workers
+        self.render_workers = render_workers or os.cpu_count() or 1
+        self.queue_size = queue_size
+        self.output_dir = output_dir
+        # Fails early on an unsupported format
+        self.output_format = EncodeOptions.from_config(output_format).format
+        self.config_path = config_path
+        self.profiler = profiler
+        # The player is fetched from the API only for a layout showing it
+        self.fetch_users = not USER_VARIABLES.isdisjoint(default_layout().get_vars())
+
+    def run(self, replay_paths: Iterable[Path]) -> BatchReport:
+        replay_paths = list(replay_paths)
+        Path(self.output_dir).mkdir(parents=True, exist_ok=True)
+        logger.info(f"Batch: {len(replay_paths)} replays, {self.io_workers} I/O threads, "
+                    f"{self.render_workers} render processes")
+
+        io_stats = StageStats("io")
+        calculate_stats = StageStats("calculate")
+        render_stats = StageStats("render")
+        encode_stats = StageStats("encode")
+
+        names = output_names(replay_paths)
+        prepared: queue.Queue = queue.Queue(maxsize=self.queue_size)
+        done = object()
+        start = time.time()
+
+        def prepare(path: Path) -> None:
+            prepare_start = time.time()
+            try:
+                with tracing.span("prepare", "io"):
+                    replay = OsuReplay(path, header_only=True)
+                    user = self.api.get_user(replay.user_name) if self.fetch_users else None
+                    beatmap_path = self.resolver.resolve(replay.beatmap_hash)
+                    play = PreparedPlay(str(path), str(beatmap_path), replay.beatmap_hash, user, names[path])
+            except Exception as e:
+                logger.error(f"Cannot prepare {path}: {e}")
+                io_stats.record(prepare_start, time.time(), ok=False)
+                return
+            io_stats.record(prepare_start, time.time())
+            # Blocks while the render stage is behind
+            prepared.put(play)
+
+        def produce() -> None:
+            with ThreadPoolExecutor(max_workers=self.io_workers, thread_name_prefix="hosu-io") as io_pool:
+                wait([io_pool.submit(prepare, path) for path in replay_paths])
+            prepared.put(done)
+
+        in_flight = threading.BoundedSemaphore(self.render_workers * self.IN_FLIGHT_PER_WORKER)
+
+        stages = {"calculate": calculate_stats, "render": render_stats, "encode": encode_stats}
+
+        def rendered(plays: List[PreparedPlay], future: Future) -> None:
+            in_flight.release()
+            try:
+                results: List[RenderedPlay] = future.result()
+            except Exception as e:
+                logger.error(f"Render failed: {e}")
+                for _ in plays:
+                    render_stats.record(time.time(), time.time(), ok=False)
+                return
+            for result in results:
+                for name, window in (("calculate", result.calculate), ("render", result.render),
+                                     ("encode", result.encode)):
+                    stages[name].record(*window, ok=name != result.failed_stage)
+                    if name == result.failed_stage:
+                        break
+                tracing.get_tracer().merge(result.spans)
+                if result.widget_costs is not None and self.profiler is not None:
+                    self.profiler.merge(*result.widget_costs)
+                if result.error is not None:
+                    logger.error(result.error)
+                else:
+                    logger.info(f"Rendered {result.output_path}")
+
+        def next_task() -> List[PreparedPlay]:
+            # Blocks for the first play only, an empty task means the I/O stage is done
+            play = prepared.get()
+            if play is done:
+                return []
+            plays = [play]
+            while len(plays) < self.PLAYS_PER_TASK:
+                try:
+                    play = prepared.get_nowait()
+                except queue.Empty:
+                    break
+                if play is done:
+                    # Seen again by the next call
+                    prepared.put(done)
+                    break
+                plays.append(play)
+            return plays
+
+        producer = threading.Thread(target=produce, name="hosu-producer", daemon=True)
+        with ProcessPoolExecutor(max_workers=self.render_workers, mp_context=multiprocessing.get_context("spawn"),
+                                 initializer=_init_render_worker,
+                                 initargs=(self.config_path, self.output_dir, self.output_format,
+                                           tracing.get_tracer().enabled, self.profiler is not None)) as render_pool:
+            producer.start()
+            futures: List[Future] = []
+            while plays := next_task():
+                in_flight.acquire()
+                try:
+                    future = render_pool.submit(_render_plays, plays)
+                except BrokenProcessPool as e:
+                    # Keep draining the queue, so the I/O stage can finish
+                    in_flight.release()
+                    for play in plays:
+                        logger.error(f"Cannot render {play.replay_path}: {e}")
+                        render_stats.record(time.time(), time.time(), ok=False)
+                    continue
+                future.add_done_callback(functools.partial(rendered, plays))
+                futures.append(future)
+            wait(futures)
+        producer.join()
+
+        report = BatchReport([io_stats, calculate_stats, render_stats, encode_stats], len(replay_paths),
+                             time.time() - start)
+        logger.info("Batch finished\n" + report.format())
+        return report
@@ -0,0 +1,37 @@
+from core.config import ConfigSection, BaseConfigSection
+
+
+@ConfigSection(name="batch")
+class BatchConfig(BaseConfigSection):
+    # Threads parsing replays and talking to the API
+    io_workers: int = 8
+    # Processes calculating pp and rendering, 0 means one per CPU
+    render_workers: int = 0
+    # Prepared replays waiting for a render worker
+    queue_size: int = 32
+    output_dir: str = "output"
+    output_format: str = "PNG"
+
+
+@ConfigSection(name="render_cache")
+class RenderCacheConfig(BaseConfigSection):
+    # Encoded thumbnails keyed by layout and variable values, reused when the same play is rendered again
+    enabled: bool = True
+    path: str = "data/render_cache"
+    max_size_mb: float = 512.0
+
+
+@ConfigSection(name="tracing")
+class TracingConfig(BaseConfigSection):
+    # Times every stage (API calls, parsing, pp, layers, widgets, encoding) and saves a Chrome trace
+    enabled: bool = False
+    output: str = "data/trace.json"
+    # Spans kept for the trace file, statistics include also the ones above the limit
+    max_events: int = 1000000
+
+
+@ConfigSection(name="widget_profile")
+class WidgetProfileConfig(BaseConfigSection):
+    # Records draw time, calls and glyphs of every widget, see the report to find expensive widgets
+    enabled: bool = False
+    output: str = "data/widget_profile.json"
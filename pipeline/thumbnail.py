@@ -0,0 +1,145 @@
+import threading
+from pathlib import Path
+
+from core.layout import Layout, Layer
+from core.renderer import TextAlignment
+from core.variable_map import VariableMap
+from core.variables import TextVariable, NumberVariable, FramesVariable, ImageURLVariable
+from core.widgets import WidgetRect, WidgetText, WidgetCursorHeatmap
+from osu.api import OsuAPI
+from osu.beatmap_store import BeatmapStore
+from osu.calculate import Performance, calculate_play_performance
+from osu.data import User
+from osu.local_beatmaps import LocalBeatmapIndex
+from osu.osu_db import OsuDb
+from osu.replay import OsuReplay
+
+# Variables of play_variables() which need the player fetched from the API
+USER_VARIABLES = frozenset({"AVATAR", "COUNTRY"})
+BACKGROUND_URL = "https://xd.click/czeslaw.png"
+
+
+def default_layout() -> Layout:
+    """
+    Creates the default thumbnail layout.
+    """
+    return Layout(1920, 1080, [
+        Layer([
+            # TODO: remove the repetitive set_
+            WidgetRect().set_color("#07090C").set_width(1).set_height(1),
+            WidgetRect().set_color("#0A0F16").set_x(0.5).set_y(0.06).set_width(1).set_height(0.12),
+            WidgetRect().set_color("#0B121A").set_x(0.5).set_y(0.15).set_width(1).set_height(0.10),
+            WidgetRect().set_color("#0C151E").set_x(0.5).set_y(0.23).set_width(1).set_height(0.10),
+            WidgetRect().set_color("#0E1923").set_x(0.5).set_y(0.31).set_width(1).set_height(0.10),
+            WidgetRect().set_color("#101E29").set_x(0.5).set_y(0.39).set_width(1).set_height(0.10),
+            WidgetRect().set_color("#122330").set_x(0.5).set_y(0.47).set_width(1).set_height(0.10),
+            WidgetRect().set_color("#152A3A").set_x(0.5).set_y(0.55).set_width(1).set_height(0.10)
+        ]),
+        Layer([
+            WidgetCursorHeatmap("FRAMES").set_x(0.3).set_y(0.2).set_width(0.4).set_height(0.4)
+        ]),
+        Layer([
+            WidgetText().set_x(0.5).set_y(0.5).set_alignment(TextAlignment.CENTER).set_text("Moj pp to {PP}")
+        ])
+    ])
+
+
+def shared_variables(variable_map: VariableMap | None = None) -> VariableMap:
+    """
+    Sets variables which are the same for every play, e.g. the scope shared by all renders of a batch.
+    """
+    variable_map = variable_map if variable_map is not None else VariableMap()
+    variable_map.set("BACKGROUND", ImageURLVariable(BACKGROUND_URL))
+    return variable_map
+
+
+def play_variables(replay: OsuReplay, performance: Performance, user: User | None = None,
+                   variable_map: VariableMap | None = None) -> VariableMap:
+    """
+    Sets variables describing the play.
+
+    :param user: Player fetched from the API, adds AVATAR and COUNTRY when given.
+    """
+    variable_map = variable_map if variable_map is not None else VariableMap()
+    variable_map.set("PLAYER", TextVariable(replay.user_name))
+    if user is not None:
+        variable_map.set("AVATAR", ImageURLVariable(user.avatar_url))
+        variable_map.set("COUNTRY", TextVariable(user.country_code))
+    variable_map.set("SCORE", NumberVariable(replay.total_score))
+    variable_map.set("FRAMES", FramesVariable(replay.frames))
+    variable_map.set("PP", TextVariable(f"{performance.pp:.0f}"))
+    variable_map.set("STARS", TextVariable(f"{performance.star_rating:.2f}"))
+    return variable_map
+
+
+def play_providers(replay_path: str | Path, api: OsuAPI, resolver: "BeatmapResolver",
+                   variable_map: VariableMap | None = None) -> VariableMap:
+    """
+    Registers lazy providers of the play variables.
+    Only variables used by the rendered layout are computed, e.g. the beatmap is not downloaded
+    when neither PP nor STARS is shown. The player and the beatmap are fetched concurrently.
+    """
+    variable_map = variable_map if variable_map is not None else VariableMap()
+    variable_map.provide_resource("replay", lambda: OsuReplay(replay_path))
+    variable_map.provide_resource("user", lambda replay: api.get_user(replay.user_name), ["replay"])
+    variable_map.provide_resource("beatmap_path", lambda replay: resolver.resolve(replay.beatmap_hash), ["replay"])
+    variable_map.provide_resource(
+        "performance",
+        lambda replay, beatmap_path: calculate_play_performance(str(beatmap_path), replay, replay.beatmap_hash),
+        ["replay", "beatmap_path"],
+    )
+
+    variable_map.provide("PLAYER", lambda replay: TextVariable(replay.user_name), ["replay"])
+    variable_map.provide("SCORE", lambda replay: NumberVariable(replay.total_score), ["replay"])
+    variable_map.provide("FRAMES", lambda replay: FramesVariable(replay.frames), ["replay"])
+    variable_map.provide("AVATAR", lambda user: ImageURLVariable(user.avatar_url), ["user"])
+    variable_map.provide("COUNTRY", lambda user: TextVariable(user.country_code), ["user"])
+    variable_map.provide("PP", lambda performance: TextVariable(f"{performance.pp:.0f}"), ["performance"])
+    variable_map.provide("STARS", lambda performance: TextVariable(f"{performance.star_rating:.2f}"), ["performance"])
+    return variable_map
+
+
+class BeatmapResolver:
+    """
+    Resolves a beatmap hash to a local .osu file.
+    Beatmaps are served from the BeatmapStore, then from osu!.db and the local Songs index,
+    others are looked up and downloaded once, even when many threads ask for the same beatmap at the same time.
+    """
+
+    def __init__(self, api: OsuAPI, store: BeatmapStore, local: LocalBeatmapIndex | None = None,
+                 osu_db: OsuDb | None = None):
+        """
+        :param local: Index of a local osu! Songs folder consulted before the API.
+        :param osu_db: Beatmap database of the osu! client, consulted before the Songs index and the API.
+        """
+        self.api = api
+        self.store = store
+        self.local = local
+        self.osu_db = osu_db
+        self._locks: dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    def resolve(self, beatmap_hash: str) -> Path:
+        path = self.store.get(beatmap_hash)
+        if path is not None:
+            return path
+        if self.osu_db is not None:
+            path = self.osu_db.path(beatmap_hash)
+            if path is not None:
+                return path
+        if self.local is not None:
+            path = self.local.path(beatmap_hash)
+            if path is not None:
+                return path
+
+        with self._locks_lock:
+            lock = self._locks.setdefault(beatmap_hash, threading.Lock())
+        with lock:
+            # Another thread could have downloaded it while we waited
+            path = self.store.get(beatmap_hash)
+            if path is not None:
+                return path
+            # Not in Songs or changed there: only the API knows whether the hash is still downloadable,
+            # a beatmap id from osu!.db could point to a newer version of the beatmap
+            beatmap = self.api.lookup_beatmap(beatmap_hash)
+            return self.store.put(self.api.download_beatmap_bytes(beatmap.id), beatmap_hash)
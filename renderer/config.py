@@ -1,7 +1,26 @@
-from core.config import ConfigSection
+from core.config import ConfigSection, BaseConfigSection
 
 
 @ConfigSection(name="renderer_pillow")
-class RendererPillowConfig:
+class RendererPillowConfig(BaseConfigSection):
     font_path: str = "resources/fonts/Roboto.ttf"
+    font_cache_size: int = 32
+    static_layer_cache_size: int = 16
 
+
+@ConfigSection(name="encoder")
+class EncoderConfig(BaseConfigSection):
+    # Threads encoding rendered images
+    workers: int = 2
+    # Images waiting for an encoder before submitting blocks the renderer
+    max_pending: int = 8
+    format: str = "PNG"
+    # zlib level 0-9, lower is faster and bigger
+    png_compress_level: int = 6
+    png_optimize: bool = False
+    jpeg_quality: int = 90
+    jpeg_optimize: bool = False
+    webp_quality: int = 90
+    webp_lossless: bool = False
+    # 0-6, lower is faster and bigger
+    webp_method: int = 4
@@ -0,0 +1,194 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, Future
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List
+
+from core.logger import get_logger
+from core.renderer import Renderer
+from renderer.config import EncoderConfig
+
+logger = get_logger(__name__)
+
+# Format aliases accepted by EncodeOptions
+_FORMATS = {"PNG": "PNG", "JPEG": "JPEG", "JPG": "JPEG", "WEBP": "WEBP"}
+_EXTENSIONS = {"PNG": "png", "JPEG": "jpg", "WEBP": "webp"}
+
+
+@dataclass(frozen=True)
+class EncodeOptions:
+    """
+    Output format and its settings. Settings of other formats are ignored.
+    """
+    format: str = "PNG"
+    # PNG zlib level 0-9
+    compress_level: int = 6
+    # PNG and JPEG extra pass for smaller files
+    optimize: bool = False
+    # JPEG and WebP quality 0-100
+    quality: int = 90
+    # WebP
+    lossless: bool = False
+    method: int = 4
+
+    def __post_init__(self):
+        format = _FORMATS.get(self.format.upper())
+        if format is None:
+            raise ValueError(f"Unsupported output format: {self.format} (expected PNG, JPEG or WEBP)")
+        object.__setattr__(self, "format", format)
+
+    @classmethod
+    def from_config(cls, format: str | None = None) -> "EncodeOptions":
+        """
+        Options of the format (EncoderConfig.format by default) taken from EncoderConfig.
+        """
+        format = _FORMATS.get((format or EncoderConfig.format).upper(), format or EncoderConfig.format)
+        match format:
+            case "PNG":
+                return cls(format, compress_level=EncoderConfig.png_compress_level,
+                           optimize=EncoderConfig.png_optimize)
+            case "JPEG":
+                return cls(format, quality=EncoderConfig.jpeg_quality, optimize=EncoderConfig.jpeg_optimize)
+            case _:
+                return cls(format, quality=EncoderConfig.webp_quality, lossless=EncoderConfig.webp_lossless,
+                           method=EncoderConfig.webp_method)
+
+    @property
+    def extension(self) -> str:
+        return _EXTENSIONS[self.format]
+
+    def params(self) -> Dict[str, Any]:
+        """
+        Encoder parameters passed to Renderer.encode.
+        """
+        match self.format:
+            case "PNG":
+                return {"compress_level": self.compress_level, "optimize": self.optimize}
+            case "JPEG":
+                return {"quality": self.quality, "optimize": self.optimize}
+            case _:
+                return {"quality": self.quality, "lossless": self.lossless, "method": self.method}
+
+
+@dataclass(frozen=True)
+class EncodeStats:
+    """
+    Encode latency of one format in seconds.
+    """
+    format: str
+    count: int
+    total: float
+    min: float
+    max: float
+    bytes: int
+
+    @property
+    def mean(self) -> float:
+        return self.total / self.count if self.count else 0.0
+
+    def __str__(self) -> str:
+        return (f"{self.format}: count={self.count} mean={self.mean * 1000:.1f}ms min={self.min * 1000:.1f}ms "
+                f"max={self.max * 1000:.1f}ms avg_size={self.bytes // max(1, self.count)}B")
+
+
+class ImageEncoder:
+    """
+    Encodes rendered images on a dedicated thread pool, so the next image can be rendered meanwhile.
+    Pillow releases the GIL while compressing, so encoding really runs in parallel.
+
+    At most max_pending images wait for encoding, submit blocks above that,
+    which keeps memory bounded when rendering is faster than encoding.
+    """
+
+    def __init__(self, renderer: Renderer, workers: int | None = None, max_pending: int | None = None):
+        """
+        :param renderer: Renderer which produced the images, it implements the encoding.
+        :param workers: Encoding threads, EncoderConfig.workers by default.
+        :param max_pending: Images submitted but not encoded yet, EncoderConfig.max_pending by default.
+        """
+        self.renderer = renderer
+        self._executor = ThreadPoolExecutor(max_workers=workers or EncoderConfig.workers,
+                                            thread_name_prefix="hosu-encoder")
+        self._pending = threading.BoundedSemaphore(max_pending or EncoderConfig.max_pending)
+        self._lock = threading.Lock()
+        self._stats: Dict[str, EncodeStats] = {}
+
+    def encode(self, image: Any, options: EncodeOptions, target: str | Path | None = None) -> bytes | Path:
+        """
+        Encodes the image on the calling thread.
+        :param target: File to write, the image is encoded into memory when None.
+        :return: Encoded bytes, or the path of the written file.
+        """
+        start = time.perf_counter()
+        if target is None:
+            result = self.renderer.encode(image, options.format, **options.params())
+            size = len(result)
+        else:
+            result = Path(target)
+            result.parent.mkdir(parents=True, exist_ok=True)
+            self.renderer.encode_to(image, result, options.format, **options.params())
+            size = result.stat().st_size
+        self._record(options.format, time.perf_counter() - start, size)
+        return result
+
+    def submit(self, image: Any, options: EncodeOptions, target: str | Path | None = None) -> Future:
+        """
+        Encodes the image on the encoder threads. The image must not be modified until the future is done.
+        :return: Future of encode() result.
+        """
+        self._pending.acquire()
+        try:
+            future = self._executor.submit(self.encode, image, options, target)
+        except BaseException:
+            self._pending.release()
+            raise
+        future.add_done_callback(lambda _: self._pending.release())
+        return future
+
+    def encode_many(self, images: Iterable[Any], options: EncodeOptions,
+                    targets: Iterable[str | Path] | None = None) -> Iterator[bytes | Path]:
+        """
+        Encodes images of a lazy iterable (e.g. Renderer.render_many) in order.
+        The next image is rendered while the previous ones are being encoded.
+        """
+        targets = iter(targets) if targets is not None else None
+        futures: List[Future] = []
+        for image in images:
+            futures.append(self.submit(image, options, next(targets) if targets is not None else None))
+            # Yield everything finished so far, keeping the order
+            while futures and futures[0].done():
+                yield futures.pop(0).result()
+        for future in futures:
+            yield future.result()
+
+    def _record(self, format: str, elapsed: float, size: int) -> None:
+        with self._lock:
+            stats = self._stats.get(format)
+            if stats is None:
+                self._stats[format] = EncodeStats(format, 1, elapsed, elapsed, elapsed, size)
+            else:
+                self._stats[format] = EncodeStats(format, stats.count + 1, stats.total + elapsed,
+                                                  min(stats.min, elapsed), max(stats.max, elapsed),
+                                                  stats.bytes + size)
+
+    def stats(self) -> Dict[str, EncodeStats]:
+        """
+        Encode latency per format.
+        """
+        with self._lock:
+            return dict(self._stats)
+
+    def close(self) -> None:
+        """
+        Waits for submitted images and stops the encoder threads.
+        """
+        self._executor.shutdown(wait=True)
+        for stats in self.stats().values():
+            logger.info(f"Encoded {stats}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
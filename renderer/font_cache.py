@@ -0,0 +1,62 @@
+import threading
+from typing import Tuple
+
+from PIL import ImageFont
+
+from core.cache import LRUCache, CacheStats
+from core.logger import get_logger
+from renderer.config import RendererPillowConfig
+
+logger = get_logger(__name__)
+
+# (font path, pixel size, variant name)
+FontKey = Tuple[str, float, str | None]
+
+
+class FontCache:
+    """
+    Keeps parsed FreeType fonts in a bounded LRU cache,
+    so a font file is parsed once per (path, size, variant) instead of once per draw call.
+    """
+
+    def __init__(self, max_size: int):
+        self._fonts: LRUCache[FontKey, ImageFont.FreeTypeFont] = LRUCache(max_size)
+
+    def get(self, path: str, size: float, variant: str | None = None) -> ImageFont.FreeTypeFont:
+        """
+        Returns a font loaded from path with the given pixel size.
+        :param path: Path to the font file.
+        :param size: Font size in pixels.
+        :param variant: Optional named variation (e.g. "Bold") of a variable font.
+        """
+        key: FontKey = (path, size, variant)
+        return self._fonts.get_or_create(key, lambda: self._load(path, size, variant))
+
+    @staticmethod
+    def _load(path: str, size: float, variant: str | None) -> ImageFont.FreeTypeFont:
+        logger.debug(f"Loading font {path} size={size} variant={variant}")
+        font = ImageFont.truetype(path, size)
+        if variant is not None:
+            font.set_variation_by_name(variant)
+        return font
+
+    def stats(self) -> CacheStats:
+        return self._fonts.stats()
+
+    def clear(self) -> None:
+        self._fonts.clear()
+
+
+_shared_font_cache: FontCache | None = None
+_shared_font_cache_lock = threading.Lock()
+
+
+def get_font_cache() -> FontCache:
+    """
+    Returns the process-wide font cache shared by all renderers and threads.
+    """
+    global _shared_font_cache
+    with _shared_font_cache_lock:
+        if _shared_font_cache is None:
+            _shared_font_cache = FontCache(RendererPillowConfig.font_cache_size)
+        return _shared_font_cache
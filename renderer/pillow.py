@@ -1,29 +1,78 @@
-from typing import Tuple, Any
+import io
+import weakref
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Tuple, Iterable, Iterator, BinaryIO
 
-from PIL import Image, ImageDraw, ImageFont
+import PIL
+import numpy as np
+from PIL import Image, ImageDraw
 
-from core.layout import Layout
+from core.cache import LRUCache
+from core.display_list import DrawOp, COORDS_STRIDE, font_size_to_px
+from core.layout import Layout, Layer
 from core.logger import get_logger
-from core.renderer import Renderer, RGBA, TextAlignment
+from core.renderer import Renderer, RenderContext, RGBA, TextAlignment
+from core.tracing import span
+from core.variable_map import VariableMap
 from renderer.config import RendererPillowConfig
+from renderer.font_cache import FontCache, get_font_cache
 
 logger = get_logger(__name__)
 
 BACKGROUND_COLOR = (0, 0, 0, 255)
+TRANSPARENT_COLOR = (0, 0, 0, 0)
+WHITE_COLOR = (255, 255, 255, 255)
+
+
+@dataclass
+class StaticLayerBitmap:
+    """
+    Rasterised static layer with the state it was rendered from.
+
+    Pasting image through mask gives the same pixels as drawing the layer, because ImageDraw replaces
+    the pixels it draws. Layers which blend with what is underneath (antialiased text, translucent images)
+    keep no image and are drawn every time.
+    """
+    layer: weakref.ref
+    signature: tuple
+    size: Tuple[int, int]
+    image: Image.Image | None
+    # Pixels drawn by the layer, None when it covers the whole canvas
+    mask: Image.Image | None
+
+    def is_valid_for(self, layer: Layer, size: Tuple[int, int]) -> bool:
+        return self.layer() is layer and self.size == size and self.signature == layer.signature()
+
+
+@dataclass
+class PillowRenderContext(RenderContext):
+    image: Image.Image
+    draw: ImageDraw.ImageDraw
 
 
 class PillowRenderer(Renderer):
-    def draw_text(self, position: Tuple[float, float], text: str, font_size: float = 1.0, color: RGBA = (255, 255, 255, 255),
-                  align: TextAlignment = TextAlignment.LEFT, drop_shadow: bool = False) -> None:
-        # TODO: remove hardcoded font path
-        font = ImageFont.truetype(RendererPillowConfig.font_path, self.layout.width / 16 * font_size)
+    """
+    Renders layouts into Pillow RGBA images.
+
+    Instance holds only shared caches (fonts, static layer bitmaps),
+    so a single renderer can be used from many threads at once.
+    """
 
-        x = self.layout.width * position[0]
-        y = self.layout.height * position[1]
+    def draw_text(self, ctx: PillowRenderContext, position: Tuple[float, float], text: str, font_size: float = 1.0,
+                  color: RGBA = (255, 255, 255, 255), align: TextAlignment = TextAlignment.LEFT,
+                  drop_shadow: bool = False) -> None:
+        self.draw_text_px(ctx, ctx.width * position[0], ctx.height * position[1], text,
+                          font_size_to_px(ctx.width, font_size), color, align, drop_shadow)
+
+    def draw_text_px(self, ctx: PillowRenderContext, x: float, y: float, text: str, font_size: float, color: RGBA,
+                     align: TextAlignment, drop_shadow: bool) -> None:
+        font = self.fonts.get(RendererPillowConfig.font_path, font_size)
+        ctx.glyphs += len(text)
 
         # Get text size
         # TODO: replace with bbox method for better accuracy and height calculation
-        text_width = self.draw.textlength(text, font=font)
+        text_width = ctx.draw.textlength(text, font=font)
 
         match align:
             case TextAlignment.RIGHT:
@@ -34,29 +83,162 @@ class PillowRenderer(Renderer):
                 pass
 
         if drop_shadow:
-            self.draw_text((position[0] + 0.002, position[1] + 0.002), text, font_size=font_size, color=(0,0,0,255), align=align, drop_shadow=False)
+            # Reuse the already measured font and offset for the shadow pass
+            shadow_x = x + ctx.width * 0.002
+            shadow_y = y + ctx.height * 0.002
+            ctx.draw.text((shadow_x, shadow_y), text, font=font, fill=(0, 0, 0, 255))
+
+        ctx.draw.text((x, y), text, font=font, fill=color)
+
+    def draw_rect(self, ctx: PillowRenderContext, position: Tuple[float, float], size: Tuple[int, int],
+                  color: RGBA = (255, 255, 255, 255), fill: bool = True) -> None:
+        x = ctx.width * position[0]
+        y = ctx.height * position[1]
+        w = ctx.width * size[0]
+        h = ctx.height * size[1]
+        self.fill_rect_px(ctx, x, y, w, h, color)
+
+    def draw_image(self, ctx: PillowRenderContext, position: Tuple[float, float], size: Tuple[float, float],
+                   image: Image.Image | np.ndarray) -> None:
+        if isinstance(image, np.ndarray):
+            image = Image.fromarray(image, "RGBA")
+        elif image.mode != "RGBA":
+            image = image.convert("RGBA")
 
-        self.draw.text((x, y), text, font=font, fill=color)
+        x, y = round(ctx.width * position[0]), round(ctx.height * position[1])
+        w, h = round(ctx.width * size[0]), round(ctx.height * size[1])
+        if w <= 0 or h <= 0:
+            return
+        if image.size != (w, h):
+            image = image.resize((w, h), Image.Resampling.BILINEAR)
 
-    def draw_rect(self, position: Tuple[float, float], size: Tuple[int, int], color: RGBA = (255, 255, 255, 255),
-                  fill: bool = True) -> None:
-        x = self.layout.width * position[0]
-        y = self.layout.height * position[1]
-        w = self.layout.width * size[0]
-        h = self.layout.height * size[1]
-        self.draw.rectangle(((x, y), (x + w, y + h)), fill=color)
+        # alpha_composite does not accept negative destination, crop the hidden part instead
+        left, top = max(0, -x), max(0, -y)
+        right, bottom = min(w, ctx.width - x), min(h, ctx.height - y)
+        if left >= right or top >= bottom:
+            return
+        if (left, top, right, bottom) != (0, 0, w, h):
+            image = image.crop((left, top, right, bottom))
+        ctx.image.alpha_composite(image, dest=(x + left, y + top))
 
-    def __init__(self):
-        self.image: Image.Image | None = None
-        self.draw: ImageDraw.ImageDraw | None = None
-        self.layout: Layout | None = None
+    def fill_rect_px(self, ctx: PillowRenderContext, x: float, y: float, width: float, height: float,
+                     color: RGBA) -> None:
+        ctx.draw.rectangle(((x, y), (x + width, y + height)), fill=color)
 
-    def begin(self, layout: Layout) -> None:
+    def __init__(self, fonts: FontCache | None = None):
+        # Font cache is shared across renderers unless a dedicated one is given
+        self.fonts: FontCache = fonts if fonts is not None else get_font_cache()
+        # Bitmaps of static layers keyed by id of the layer
+        self._static_layers: LRUCache[int, StaticLayerBitmap] = LRUCache(RendererPillowConfig.static_layer_cache_size)
+
+    def cache_identity(self) -> tuple:
+        return self.__class__.__qualname__, PIL.__version__, RendererPillowConfig.font_path
+
+    def begin(self, layout: Layout) -> PillowRenderContext:
         logger.info("PillowRenderer begin")
-        self.layout = layout
-        self.image = Image.new("RGBA", (layout.width, layout.height), BACKGROUND_COLOR)
-        self.draw = ImageDraw.Draw(self.image)
+        return self._create_context(layout, Image.new("RGBA", (layout.width, layout.height), BACKGROUND_COLOR))
+
+    @staticmethod
+    def _create_context(layout: Layout, image: Image.Image) -> PillowRenderContext:
+        return PillowRenderContext(layout, image, ImageDraw.Draw(image))
+
+    def encode(self, result: Image.Image, format: str, **params) -> bytes:
+        buffer = io.BytesIO()
+        self.encode_to(result, buffer, format, **params)
+        return buffer.getvalue()
+
+    def encode_to(self, result: Image.Image, target: str | Path | BinaryIO, format: str, **params) -> None:
+        with span(f"encode {format.upper()}", "encode"):
+            image = result
+            if format.upper() in ("JPEG", "JPG") and image.mode != "RGB":
+                # JPEG has no alpha channel
+                image = image.convert("RGB")
+            image.save(target, format=format, **params)
+
+    def render_many(self, layout: Layout, variable_maps: Iterable[VariableMap], format: str | None = None,
+                    **params) -> Iterator[Image.Image | bytes]:
+        display_list = layout.compile()
+        canvas_layout = Layout(display_list.width, display_list.height)
+        if self.profiler is not None:
+            self.profiler.register(layout)
+
+        # Leading static layers are baked into the background once for the whole batch
+        ctx = self._create_context(canvas_layout, Image.new("RGBA", (canvas_layout.width, canvas_layout.height),
+                                                            BACKGROUND_COLOR))
+        first_dynamic = 0
+        for layer_span in display_list.layers:
+            if not layer_span.static:
+                break
+            self.render_static_layer(ctx, layer_span.layer)
+            first_dynamic += 1
+        background = ctx.image
+        spans = display_list.layers[first_dynamic:]
+
+        # When encoding, a single canvas is reused because the image never leaves the renderer
+        canvas = background.copy() if format is not None else None
+
+        names = layout.get_vars()
+        for variable_map in variable_maps:
+            variable_map.resolve(names)
+            if canvas is not None:
+                canvas.paste(background)
+                image = canvas
+            else:
+                image = background.copy()
+
+            ctx = self._create_context(canvas_layout, image)
+            self.render_spans(ctx, display_list, spans, variable_map)
+
+            yield image if format is None else self.encode(image, format, **params)
+
+        logger.debug(f"Font cache: {self.fonts.stats()}")
+        logger.debug(f"Static layer cache: {self._static_layers.stats()}")
+
+    def warm_up(self, layout: Layout) -> None:
+        super().warm_up(layout)
+        # Load fonts of all text commands, sizes are known after compilation
+        display_list = layout.compile()
+        for i, op in enumerate(display_list.ops):
+            if op == DrawOp.TEXT:
+                self.fonts.get(RendererPillowConfig.font_path, display_list.coords[i * COORDS_STRIDE + 4])
+
+    def render_static_layer(self, ctx: PillowRenderContext, layer: Layer) -> None:
+        bitmap = self._get_static_layer(layer, (ctx.width, ctx.height))
+        if bitmap.image is not None:
+            ctx.image.paste(bitmap.image, mask=bitmap.mask)
+        else:
+            super().render_static_layer(ctx, layer)
+
+    def _get_static_layer(self, layer: Layer, size: Tuple[int, int]) -> StaticLayerBitmap:
+        bitmap = self._static_layers.get(id(layer))
+        if bitmap is not None and bitmap.is_valid_for(layer, size):
+            return bitmap
+
+        # Concurrent renders may rasterise the same layer twice, the result is identical
+        logger.debug(f"Rasterising static layer with {len(layer.widgets)} widgets")
+        signature = layer.signature()
+        # Drawn over black and over white, a pixel drawn by the layer is the same on both,
+        # a pixel left alone keeps the background and any other pixel blends with it
+        images = []
+        for background in (TRANSPARENT_COLOR, WHITE_COLOR):
+            layer_ctx = self._create_context(Layout(size[0], size[1]), Image.new("RGBA", size, background))
+            self.render_layer(layer_ctx, layer, VariableMap())
+            images.append(layer_ctx.image)
+        on_black, on_white = np.asarray(images[0]), np.asarray(images[1])
+        drawn = (on_black == on_white).all(axis=2)
+        untouched = (on_black == 0).all(axis=2) & (on_white == 255).all(axis=2)
+
+        image = mask = None
+        if (drawn | untouched).all():
+            image = images[0]
+            if not drawn.all():
+                mask = Image.fromarray(drawn.astype(np.uint8) * 255, "L")
+        bitmap = StaticLayerBitmap(weakref.ref(layer), signature, size, image, mask)
+        self._static_layers.put(id(layer), bitmap)
+        return bitmap
 
-    def end(self) -> Image.Image:
+    def end(self, ctx: PillowRenderContext) -> Image.Image:
         logger.info("PillowRenderer end")
-        return self.image
+        logger.debug(f"Font cache: {self.fonts.stats()}")
+        logger.debug(f"Static layer cache: {self._static_layers.stats()}")
+        return ctx.image
@@ -0,0 +1,133 @@
+"""
+OsuAPI retries and re-authentication against a local stub of the osu! API.
+"""
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from osu.api import OsuAPI
+from osu.config import OsuAPIConfig, OsuAPICacheConfig
+
+
+class _Handler(BaseHTTPRequestHandler):
+    server: "_StubServer"
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status: int, body: dict, headers: dict | None = None) -> None:
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        stub = self.server
+        with stub.lock:
+            stub.tokens += 1
+            token = f"token-{stub.tokens}"
+        self._reply(200, {"access_token": token, "expires_in": 86400, "token_type": "Bearer"})
+
+    def do_GET(self):
+        stub = self.server
+        with stub.lock:
+            stub.requests.append((self.path, self.headers.get("Authorization"), time.monotonic()))
+            scripted = stub.script[self.path]
+            status, headers = scripted.popleft() if scripted else (200, {})
+        if status == 200:
+            return self._reply(200, {"id": 2, "username": "peppy", "country_code": "AU",
+                                     "avatar_url": "https://a.ppy.sh/2"})
+        self._reply(status, {"error": status}, headers)
+
+
+class _StubServer(ThreadingHTTPServer):
+    """
+    Answers GET requests with scripted statuses, then with 200. Every POST issues a new token.
+    """
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.lock = threading.Lock()
+        self.script: defaultdict[str, deque] = defaultdict(deque)
+        self.requests: list[tuple[str, str, float]] = []
+        self.tokens = 0
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+
+USER_PATH = "/api/v2/users/@peppy"
+
+
+@pytest.fixture
+def stub(monkeypatch, tmp_path):
+    server = _StubServer()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    monkeypatch.setattr(OsuAPI, "BASE_URL", f"{server.url}/api/v2")
+    monkeypatch.setattr(OsuAPI, "TOKEN_URL", f"{server.url}/oauth/token")
+    monkeypatch.setattr(OsuAPI, "SESSION_PATH", str(tmp_path / "session.json"))
+    monkeypatch.setattr(OsuAPICacheConfig, "enabled", False)
+    monkeypatch.setattr(OsuAPIConfig, "max_retries", 3)
+    monkeypatch.setattr(OsuAPIConfig, "retry_backoff", 0.01)
+    yield server
+    server.shutdown()
+    server.server_close()
+    thread.join()
+
+
+def test_retries_rate_limit_after_retry_after(stub):
+    stub.script[USER_PATH].append((429, {"Retry-After": "1"}))
+    with OsuAPI("id", "secret") as api:
+        user = api.get_user("peppy")
+
+    assert user.id == 2
+    assert len(stub.requests) == 2
+    assert stub.requests[1][2] - stub.requests[0][2] >= 0.9
+
+
+def test_retries_server_errors(stub):
+    stub.script[USER_PATH].extend([(503, {}), (502, {})])
+    with OsuAPI("id", "secret") as api:
+        assert api.get_user("peppy").id == 2
+    assert len(stub.requests) == 3
+
+
+def test_gives_up_after_max_retries(stub):
+    stub.script[USER_PATH].extend([(500, {})] * 10)
+    with OsuAPI("id", "secret") as api:
+        with pytest.raises(RuntimeError):
+            api.get_user("peppy")
+    assert len(stub.requests) == OsuAPIConfig.max_retries + 1
+
+
+def test_reauthenticates_once_on_401(stub):
+    stub.script[USER_PATH].append((401, {}))
+    with OsuAPI("id", "secret") as api:
+        assert api.get_user("peppy").id == 2
+
+    assert stub.tokens == 2
+    assert [authorization for _, authorization, _ in stub.requests] == ["Bearer token-1", "Bearer token-2"]
+
+
+def test_does_not_reauthenticate_twice(stub):
+    stub.script[USER_PATH].extend([(401, {})] * 3)
+    with OsuAPI("id", "secret") as api:
+        with pytest.raises(RuntimeError):
+            api.get_user("peppy")
+
+    assert stub.tokens == 2
+    assert len(stub.requests) == 2